@@ -0,0 +1,337 @@
+import asyncio
+import os
+import re
+
+
+class AsyncFTPClient:
+    """
+    asyncio version of FTPClient built on asyncio streams. It covers the
+    same operations (open/login/list/cd/get/put/close), so many sessions
+    and transfers can share one event loop instead of one thread each:
+
+        async def fetch(host, name):
+            client = AsyncFTPClient()
+            if await client.open(host) and await client.login("anonymous", ""):
+                await client.get(name)
+            await client.close()
+
+        await asyncio.gather(*(fetch(h, "README") for h in hosts))
+    """
+
+    def __init__(self, timeout=5.0, chunk_size=65536):
+        self.reader = None
+        self.writer = None
+        self.connected = False
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.host = None
+        self.port = 21
+        self.output_callback = print
+
+    def set_output_callback(self, callback):
+        if callback is None:
+            self.output_callback = print
+        else:
+            self.output_callback = callback
+
+    def _log(self, message: str):
+        """send messages to the configured output callback."""
+        try:
+            self.output_callback(message)
+        except Exception:
+            print(message)
+
+    #  connect/login
+    async def open(self, host, port=21):
+        """Connect and read the banner. Returns True on success."""
+        try:
+            self._log(f"Connecting to {host}:{port}...")
+            self.reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(host, port), self.timeout
+            )
+            self.connected = True
+            self.host = host
+            self.port = port
+
+            response = await self._recv_response()
+            self._log(response.strip())
+            return self._parse_response_code(response) == 220
+        except Exception as e:
+            self._log(f"Error connecting to server: {e}")
+            self.connected = False
+            return False
+
+    async def login(self, username, password=None):
+        """Perform the USER/PASS sequence."""
+        if not self.connected:
+            self._log("Not connected.")
+            return False
+
+        try:
+            if not username:
+                username = "anonymous"
+
+            response = await self._command(f"USER {username}")
+            if response.startswith("331") and password is not None:
+                response = await self._command(f"PASS {password}")
+
+            if response.startswith("230"):
+                self._log(" Login successful!")
+                return True
+            elif response.startswith("530"):
+                self._log(" Login failed: incorrect username or password.")
+                self.connected = False
+                return False
+            else:
+                self._log(" Unexpected login response: " + response.strip())
+                return False
+
+        except Exception as e:
+            self._log(f"Error during login: {e}")
+            self.connected = False
+            return False
+
+    # list dir
+    async def list_directory(self):
+        """Perform a LIST in passive mode and return the lines."""
+        if not self.connected:
+            self._log("Not connected.")
+            return []
+
+        try:
+            data_reader, data_writer = await self._open_data_connection()
+            if data_reader is None:
+                return []
+
+            try:
+                control_resp = await self._command("LIST")
+                if self._parse_response_code(control_resp) not in (125, 150):
+                    return []
+
+                chunks = []
+                while True:
+                    chunk = await asyncio.wait_for(data_reader.read(self.chunk_size), self.timeout)
+                    if not chunk:
+                        break
+                    chunks.append(chunk)
+            finally:
+                data_writer.close()
+
+            self._log((await self._recv_response()).strip())
+
+        except asyncio.TimeoutError:
+            self._log("Data connection error: timed out waiting for the server.")
+            return []
+        except Exception as e:
+            self._log(f"Data connection error: {e}")
+            return []
+
+        return b"".join(chunks).decode('utf-8', errors='ignore').splitlines()
+
+    # cd dir
+    async def cd(self, path):
+        if not self.connected:
+            self._log("Not connected.")
+            return False
+
+        try:
+            response = await self._command(f"CWD {path}")
+        except asyncio.TimeoutError:
+            self._log(f"Failed to change directory to '{path}': timed out waiting for the server.")
+            return False
+        except Exception as e:
+            self._log(f"Failed to change directory to '{path}': {e}")
+            return False
+        code = self._parse_response_code(response)
+        if code == 250:
+            self._log(f"Changed directory to '{path}'")
+            return True
+        elif code == 550:
+            self._log(f"Failed to change directory to '{path}'")
+        else:
+            self._log("Unexpected response: " + response.strip())
+        return False
+
+    # download
+    async def get(self, filename, local_path=None):
+        """Download a remote file. Returns True on success."""
+        if not self.connected:
+            self._log("Not connected.")
+            return False
+
+        local_path = local_path or filename
+        try:
+            await self._command("TYPE I")
+            data_reader, data_writer = await self._open_data_connection()
+            if data_reader is None:
+                return False
+
+            try:
+                control_resp = await self._command(f"RETR {filename}")
+                code = self._parse_response_code(control_resp)
+                if code not in (125, 150):
+                    self._log(
+                        f"Server rejected RETR command (code {code}) — file may not exist or permission denied."
+                    )
+                    return False
+
+                # disk writes are short compared to network waits, doing
+                # them inline keeps the per-chunk overhead low
+                with open(local_path, "wb") as f:
+                    while True:
+                        chunk = await asyncio.wait_for(data_reader.read(self.chunk_size), self.timeout)
+                        if not chunk:
+                            break
+                        f.write(chunk)
+            finally:
+                data_writer.close()
+
+            final_resp = await self._recv_response()
+            self._log(final_resp.strip())
+            if self._parse_response_code(final_resp) == 226:
+                self._log(f"File '{filename}' downloaded successfully.")
+                return True
+            self._log(f"Unexpected final response: {final_resp.strip()}")
+            # the server did not confirm the transfer, so the file may be truncated
+            if os.path.exists(local_path):
+                os.remove(local_path)
+            return False
+
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError):
+                self._log("Download error: timed out waiting for the server.")
+            else:
+                self._log(f"Download error: {e}")
+            if os.path.exists(local_path):
+                os.remove(local_path)
+            return False
+
+    # upload file
+    async def put(self, filename, remote_name=None):
+        """Upload a local file. Returns True on success."""
+        if not self.connected:
+            self._log("Not connected.")
+            return False
+
+        if not os.path.isfile(filename):
+            self._log(f" File '{filename}' does not exist locally.")
+            return False
+
+        remote_name = remote_name or os.path.basename(filename)
+        try:
+            await self._command("TYPE I")
+            data_reader, data_writer = await self._open_data_connection()
+            if data_reader is None:
+                return False
+
+            try:
+                control_resp = await self._command(f"STOR {remote_name}")
+                code = self._parse_response_code(control_resp)
+                if code not in (125, 150):
+                    self._log(f" Server rejected STOR command (code {code})")
+                    return False
+
+                with open(filename, "rb") as f:
+                    while True:
+                        chunk = f.read(self.chunk_size)
+                        if not chunk:
+                            break
+                        data_writer.write(chunk)
+                        # wait for the socket buffer to drain so memory stays bounded
+                        await asyncio.wait_for(data_writer.drain(), self.timeout)
+
+                # end of data is signalled by closing the data connection
+                data_writer.close()
+                await asyncio.wait_for(data_writer.wait_closed(), self.timeout)
+            finally:
+                data_writer.close()
+
+            final_resp = await self._recv_response(timeout=max(self.timeout, 10.0))
+            self._log(final_resp.strip())
+            if self._parse_response_code(final_resp) == 226:
+                self._log(f"File '{remote_name}' uploaded successfully.")
+                return True
+            self._log(f"Unexpected final response: {final_resp.strip()}")
+            return False
+
+        except asyncio.TimeoutError:
+            self._log("Upload error: timed out waiting for the server.")
+            return False
+        except Exception as e:
+            self._log(f"Upload error: {e}")
+            return False
+
+    # close connection
+    async def close(self):
+        if self.connected:
+            try:
+                resp = (await self._command("QUIT", log=False)).strip()
+                if resp:
+                    self._log(resp)
+                self.writer.close()
+                await self.writer.wait_closed()
+            except Exception as e:
+                self._log(f"Error closing connection: {e}")
+            self.connected = False
+            self._log("Connection closed.")
+        else:
+            self._log("No active connection.")
+
+    # control channel
+    async def _command(self, command, log=True):
+        """Send a command and return its complete reply."""
+        self.writer.write((command + "\r\n").encode('utf-8'))
+        await self.writer.drain()
+        response = await self._recv_response()
+        if log:
+            self._log(response.strip())
+        return response
+
+    async def _recv_response(self, timeout=None):
+        """
+        Read one complete (possibly multi-line) reply. StreamReader keeps
+        any bytes past the reply buffered for the next call.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        lines = []
+        expected_code = None
+
+        while True:
+            raw = await asyncio.wait_for(self.reader.readline(), timeout)
+            if not raw:
+                break
+            line = raw.decode('utf-8', errors='ignore').rstrip("\r\n")
+            lines.append(line)
+
+            if expected_code is None:
+                if line[3:4] == "-":
+                    expected_code = line[:3]
+                    continue
+                if line[:3].isdigit():
+                    break
+            elif line.startswith(expected_code + " "):
+                break
+
+        return "\n".join(lines) + ("\n" if lines else "")
+
+    async def _open_data_connection(self):
+        response = await self._command("PASV")
+        match = _PASV_RE.search(response)
+        if not match:
+            self._log("Could not parse PASV response.")
+            return None, None
+
+        port = int(match.group(5)) * 256 + int(match.group(6))
+        # same reasoning as the sync client: trust the control peer address
+        ip = self.writer.get_extra_info("peername")[0]
+        return await asyncio.wait_for(asyncio.open_connection(ip, port), self.timeout)
+
+    @staticmethod
+    def _parse_response_code(response):
+        try:
+            return int(response[:3])
+        except Exception:
+            return 0
+
+
+_PASV_RE = re.compile(r"\((\d+),(\d+),(\d+),(\d+),(\d+),(\d+)\)")
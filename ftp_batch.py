@@ -0,0 +1,432 @@
+import json
+import os
+import re
+import shlex
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from ftp_client import DEFAULT_WORKERS, FTPClient, netrc_credentials
+from ftp_mirror import mirror
+from ftp_pool import PoolTimeout
+from ftp_shaping import RateSchedule, Shaper, parse_rate
+from ftp_transfer import mget, mput
+
+try:
+    import yaml
+except ImportError:  # only needed for YAML job files
+    yaml = None
+
+# ${NAME} in any job string is replaced from the environment
+_ENV_RE = re.compile(r"\$\{(\w+)\}")
+
+# how long a step waits for a free pooled session
+SESSION_TIMEOUT = 60.0
+
+# keys of a step that are not arguments of its operation
+_STEP_KEYS = ("op", "name", "after", "cwd", "priority")
+
+
+class JobError(Exception):
+    """The job file is invalid, or the server could not be logged in to."""
+
+
+class Step:
+    """One operation from a job file and its outcome."""
+
+    def __init__(self, name, op, args, cwd=None, after=(), priority=1):
+        self.name = name
+        self.op = op
+        self.args = args
+        self.cwd = cwd
+        self.after = list(after)
+        self.priority = priority  # bandwidth weight under a shaper
+        self.state = "pending"  # pending, running, ok, failed, skipped
+        self.elapsed = None
+        self.error = None
+
+    def __repr__(self):
+        return f"<Step {self.name} {self.op} {self.state}>"
+
+
+# operations: op -> (required args, optional args, function(client, **args) -> bool)
+def _get(client, remote, local=None, resume=False):
+    return client.get(remote, local, resume=resume)
+
+
+def _put(client, local, remote=None, resume=False):
+    return client.put(local, remote, resume=resume)
+
+
+def _mget(client, patterns, local_dir=".", workers=DEFAULT_WORKERS, allow_empty=False):
+    matched, failed = mget(client, _as_list(patterns), workers, local_dir=local_dir)
+    # an empty source set usually means the files did not arrive, so it
+    # fails the step unless the job says that is fine
+    return (matched > 0 or allow_empty) and not failed
+
+
+def _mput(client, patterns, workers=DEFAULT_WORKERS, allow_empty=False):
+    matched, failed = mput(client, _as_list(patterns), workers)
+    return (matched > 0 or allow_empty) and not failed
+
+
+def _mirror(client, remote, local, upload=False, delete=False, workers=DEFAULT_WORKERS):
+    plan = mirror(client, remote, local, upload=upload, delete=delete, workers=workers)
+    if plan is None:
+        return False
+    for transfer in plan.failed:
+        client._log(f"{transfer.direction} {transfer.remote_name} failed: {transfer.error}")
+    return not plan.failed and not plan.unreadable
+
+
+def _quote(client, command):
+    return 200 <= client.quote(command).code < 400
+
+
+OPERATIONS = {
+    "get": (("remote",), ("local", "resume"), _get),
+    "put": (("local",), ("remote", "resume"), _put),
+    "mget": (("patterns",), ("local_dir", "workers", "allow_empty"), _mget),
+    "mput": (("patterns",), ("workers", "allow_empty"), _mput),
+    "mirror": (("remote", "local"), ("upload", "delete", "workers"), _mirror),
+    "delete": (("remote",), (), lambda client, remote: client.delete(remote)),
+    "mkdir": (("remote",), (), lambda client, remote: client.mkdir(remote)),
+    "rmdir": (("remote",), (), lambda client, remote: client.rmdir(remote)),
+    "rename": (("source", "target"), (), lambda client, source, target: client.rename(source, target)),
+    "quote": (("command",), (), _quote),
+}
+
+# these fan out over the session pool themselves, so they run on the
+# main connection, one at a time
+BULK_OPERATIONS = ("mget", "mput", "mirror")
+
+
+def load_job(path):
+    """
+    Read a job from a JSON or YAML (.yaml/.yml) file, or JSON from stdin
+    for "-". A job is a dict with `steps` and optional host, port, user,
+    password, cwd, workers, sequential and the bandwidth limits rate,
+    host_rate, transfer_rate and schedule; a bare list is taken as the
+    steps. ${NAME} in any string is filled in from the environment.
+    """
+    try:
+        if path == "-":
+            text = sys.stdin.read()
+        else:
+            with open(path) as f:
+                text = f.read()
+    except OSError as e:
+        raise JobError(f"Cannot read job file: {e}")
+
+    if path.endswith((".yaml", ".yml")):
+        if yaml is None:
+            raise JobError("YAML job files need PyYAML (pip install pyyaml).")
+        try:
+            job = yaml.safe_load(text)
+        except yaml.YAMLError as e:
+            raise JobError(f"Invalid YAML: {e}")
+    else:
+        try:
+            job = json.loads(text)
+        except ValueError as e:
+            raise JobError(f"Invalid JSON: {e}")
+
+    if isinstance(job, list):
+        job = {"steps": job}
+    if not isinstance(job, dict) or not isinstance(job.get("steps"), list):
+        raise JobError("A job needs a list of steps.")
+    return _expand(job)
+
+
+def parse_steps(job):
+    """
+    Turn the job's step list into Step objects. A step is a dict with
+    `op` and its arguments, or a string like "get reports/a.csv a.csv"
+    with the arguments in order. With `sequential: true` every step
+    also waits for the one before it.
+    """
+    steps = []
+    for number, item in enumerate(job["steps"], 1):
+        if isinstance(item, str):
+            item = _from_words(number, shlex.split(item))
+        if not isinstance(item, dict):
+            raise JobError(f"Step {number}: expected a dict or a string.")
+
+        op = item.get("op")
+        if op not in OPERATIONS:
+            raise JobError(f"Step {number}: unknown op {op!r}, expected one of {', '.join(OPERATIONS)}.")
+        required, optional, _ = OPERATIONS[op]
+        args = {key: value for key, value in item.items() if key not in _STEP_KEYS}
+        missing = [key for key in required if key not in args]
+        unknown = [key for key in args if key not in required + optional]
+        if missing or unknown:
+            problem = f"missing {', '.join(missing)}" if missing else f"unknown {', '.join(unknown)}"
+            raise JobError(f"Step {number} ({op}): {problem}.")
+
+        after = item.get("after") or []
+        after = [after] if isinstance(after, str) else [str(name) for name in after]
+        if job.get("sequential") and steps:
+            after.append(steps[-1].name)
+        try:
+            priority = int(item.get("priority", 1))
+        except (TypeError, ValueError):
+            raise JobError(f"Step {number}: priority must be a whole number.")
+        steps.append(Step(str(item.get("name") or f"{number}-{op}"), op, args, item.get("cwd"), after, priority))
+
+    names = [step.name for step in steps]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise JobError(f"Duplicate step names: {', '.join(duplicates)}.")
+    for step in steps:
+        unknown = [name for name in step.after if name not in names]
+        if unknown:
+            raise JobError(f"Step {step.name}: 'after' names unknown step(s) {', '.join(unknown)}.")
+    return steps
+
+
+def connect(job, log=None):
+    """
+    Open and log in a client for the job. Host and port come from the
+    job or FTP_HOST/FTP_PORT; credentials from the job, then
+    FTP_USER/FTP_PASSWORD, then ~/.netrc, then anonymous.
+    """
+    host = job.get("host") or os.environ.get("FTP_HOST")
+    if not host:
+        raise JobError("No host: set 'host' in the job or FTP_HOST.")
+    try:
+        port = int(job.get("port") or os.environ.get("FTP_PORT") or 21)
+    except ValueError:
+        raise JobError("The port must be a number.")
+
+    username = job.get("user") or os.environ.get("FTP_USER")
+    password = job.get("password") or os.environ.get("FTP_PASSWORD")
+    if username is None:
+        username, password = netrc_credentials(host) or ("anonymous", "")
+
+    client = FTPClient(is_gui=True)
+    client.shaper = shaper(job)
+    client.set_output_callback(log or (lambda message: None))
+    client.open(host, port, username, password or "")
+    if not client.connected or client.username is None:
+        client.close()
+        raise JobError(f"Could not log in to {host}:{port} as {username}.")
+    return client
+
+
+def shaper(job):
+    """
+    Shaper for the job's bandwidth settings (rate, host_rate,
+    transfer_rate, schedule), None when it has none.
+    """
+    if not any(job.get(key) for key in ("rate", "host_rate", "transfer_rate", "schedule")):
+        return None
+    try:
+        schedule = RateSchedule.parse(job["schedule"]) if job.get("schedule") else None
+        return Shaper(
+            parse_rate(job.get("rate") or "off"),
+            parse_rate(job.get("host_rate") or "off"),
+            parse_rate(job.get("transfer_rate") or "off"),
+            schedule,
+        )
+    except ValueError as e:
+        raise JobError(str(e))
+
+
+class BatchRunner:
+    """
+    Runs the steps of a job over pooled sessions of one logged-in
+    client. A step starts once every step in its `after` list has
+    succeeded, up to `workers` at a time; when a step fails, the steps
+    that depend on it are skipped. on_step(step) is called from the
+    calling thread as each step ends.
+    """
+
+    def __init__(self, client, steps, workers=DEFAULT_WORKERS, cwd=None, on_step=None, verbose=False):
+        self.client = client
+        self.steps = steps
+        self.workers = max(1, workers)
+        self.cwd = cwd or client.current_dir()
+        self.on_step = on_step
+        self.verbose = verbose
+        self._by_name = {step.name: step for step in steps}
+        self._main_lock = threading.Lock()
+
+    def run(self):
+        """Run every step. Returns True if all of them succeeded."""
+        pool = self.client.get_pool(self.workers)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while True:
+                for step in self._ready():
+                    step.state = "running"
+                    running[executor.submit(self._run_step, step, pool)] = step
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self._ended(running.pop(future))
+
+        # whatever is still pending waits on itself
+        for step in self.steps:
+            if step.state == "pending":
+                step.state = "skipped"
+                step.error = "dependency cycle"
+                self._ended(step)
+        return all(step.state == "ok" for step in self.steps)
+
+    def _ready(self):
+        """Pending steps whose dependencies all succeeded; skips the hopeless ones."""
+        ready = []
+        changed = True
+        while changed:
+            changed = False
+            for step in self.steps:
+                if step.state != "pending" or step in ready:
+                    continue
+                states = [self._by_name[name].state for name in step.after]
+                if any(state in ("failed", "skipped") for state in states):
+                    step.state = "skipped"
+                    step.error = "a step it depends on did not succeed"
+                    self._ended(step)
+                    changed = True
+                elif all(state == "ok" for state in states):
+                    ready.append(step)
+        return ready
+
+    def _run_step(self, step, pool):
+        # runs on a worker thread; the step's log lines explain a failure
+        messages = []
+        started = time.perf_counter()
+        try:
+            if step.op in BULK_OPERATIONS:
+                with self._main_lock:
+                    ok = self._call(self.client, step, messages)
+            else:
+                with pool.session(timeout=SESSION_TIMEOUT) as session:
+                    ok = self._call(session, step, messages)
+        except PoolTimeout as e:
+            ok = False
+            messages.append(str(e))
+        except Exception as e:
+            ok = False
+            messages.append(f"{type(e).__name__}: {e}")
+        step.elapsed = time.perf_counter() - started
+        step.state = "ok" if ok else "failed"
+        if not ok:
+            step.error = messages[-1] if messages else "failed"
+        return ok
+
+    def _call(self, client, step, messages):
+        log = messages.append
+        if self.verbose:
+            log = lambda message: (messages.append(message), print(f"[{step.name}] {message}", file=sys.stderr))
+        saved = client.output_callback
+        client.set_output_callback(log)
+        client.priority = step.priority
+        try:
+            directory = step.cwd or self.cwd
+            if directory and not client.cd(directory):
+                return False
+            _, _, function = OPERATIONS[step.op]
+            return bool(function(client, **step.args))
+        finally:
+            client.priority = 1
+            client.set_output_callback(saved)
+
+    def _ended(self, step):
+        if self.on_step:
+            self.on_step(step)
+
+
+def report(steps):
+    """Per-step results as plain dicts, e.g. for a JSON report."""
+    return [
+        {
+            "name": step.name,
+            "op": step.op,
+            "state": step.state,
+            "seconds": round(step.elapsed, 6) if step.elapsed is not None else None,
+            "error": step.error,
+        }
+        for step in steps
+    ]
+
+
+def _from_words(number, words):
+    if not words:
+        raise JobError(f"Step {number}: empty command.")
+    op, values = words[0], words[1:]
+    if op not in OPERATIONS:
+        raise JobError(f"Step {number}: unknown op {op!r}, expected one of {', '.join(OPERATIONS)}.")
+    if op in ("mget", "mput"):
+        return {"op": op, "patterns": values}
+    required, optional, _ = OPERATIONS[op]
+    names = required + optional
+    if len(values) > len(names):
+        raise JobError(f"Step {number} ({op}): too many arguments.")
+    return dict(zip(names, values), op=op)
+
+
+def _expand(value):
+    if isinstance(value, str):
+        def replace(match):
+            name = match.group(1)
+            if name not in os.environ:
+                raise JobError(f"Environment variable {name} is not set.")
+            return os.environ[name]
+        return _ENV_RE.sub(replace, value)
+    if isinstance(value, list):
+        return [_expand(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _expand(item) for key, item in value.items()}
+    return value
+
+
+def _as_list(value):
+    return [value] if isinstance(value, str) else list(value)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run an FTP job file without prompts.")
+    parser.add_argument("job", help="JSON or YAML job file, - for JSON on stdin")
+    parser.add_argument("-j", "--workers", type=int, help=f"steps run at once (default: job's, else {DEFAULT_WORKERS})")
+    parser.add_argument("--report", metavar="FILE", help="write per-step results as JSON")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print server replies to stderr")
+    args = parser.parse_args(argv)
+
+    log = (lambda message: print(message, file=sys.stderr)) if args.verbose else None
+    try:
+        job = load_job(args.job)
+        steps = parse_steps(job)
+        client = connect(job, log)
+    except JobError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+
+    def print_step(step):
+        seconds = f"{step.elapsed:8.2f}s" if step.elapsed is not None else " " * 9
+        detail = f"  {step.error}" if step.error else ""
+        print(f"{step.state.upper():8} {step.name:30} {seconds}{detail}", flush=True)
+
+    started = time.perf_counter()
+    try:
+        runner = BatchRunner(client, steps, args.workers or int(job.get("workers") or DEFAULT_WORKERS),
+                             job.get("cwd"), print_step, args.verbose)
+        ok = runner.run()
+    finally:
+        client.close()
+
+    counts = {state: sum(step.state == state for step in steps) for state in ("ok", "failed", "skipped")}
+    print(f"{counts['ok']} ok, {counts['failed']} failed, {counts['skipped']} skipped "
+          f"in {time.perf_counter() - started:.2f}s.")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report(steps), f, indent=2)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
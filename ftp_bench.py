@@ -0,0 +1,348 @@
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+from ftp_client import FTPClient
+from ftp_loopback import LoopbackFTPServer
+from ftp_metrics import Metrics
+from ftp_transfer import mget, mput
+
+KiB = 1024
+MiB = 1024 * 1024
+
+# file sizes for get/put and entry counts for listings; --quick uses the
+# first few of each so a run takes seconds instead of minutes
+TRANSFER_SIZES = (64 * KiB, 1 * MiB, 16 * MiB, 128 * MiB)
+LISTING_SIZES = (10, 1000, 100000, 1000000)
+QUICK_TRANSFER_SIZES = TRANSFER_SIZES[:3]
+QUICK_LISTING_SIZES = LISTING_SIZES[:3]
+
+SMALL_FILES = 200
+SMALL_FILE_SIZE = 4 * KiB
+
+# files queried with SIZE/MDTM, one by one and pipelined
+METADATA_FILES = 500
+
+# text-like file moved with and without MODE Z
+COMPRESSION_SIZE = 16 * MiB
+
+# a run counts as a regression when its median is this much slower
+REGRESSION_THRESHOLD = 0.10
+
+
+class Bench:
+    """
+    One benchmark run against a LoopbackFTPServer. Every scenario adds
+    result dicts to self.results; run() returns them with the run's
+    settings and the client-side metrics so two JSON files can be
+    compared with compare().
+    """
+
+    def __init__(self, latency=0.0, bandwidth=None, repeats=3, quick=False, log=print):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.repeats = max(1, repeats)
+        self.transfer_sizes = QUICK_TRANSFER_SIZES if quick else TRANSFER_SIZES
+        self.listing_sizes = QUICK_LISTING_SIZES if quick else LISTING_SIZES
+        self.log = log
+        self.metrics = Metrics()
+        self.results = []
+        self.server = None
+        self.workdir = None
+
+    def run(self, scenarios=None):
+        scenarios = scenarios or list(SCENARIOS)
+        unknown = [name for name in scenarios if name not in SCENARIOS]
+        if unknown:
+            raise ValueError(f"Unknown scenario(s): {', '.join(unknown)}")
+
+        started = time.time()
+        with tempfile.TemporaryDirectory(prefix="ftp-bench-") as workdir, \
+                LoopbackFTPServer(latency=self.latency, bandwidth=self.bandwidth) as server:
+            self.server = server
+            self.workdir = workdir
+            for name in scenarios:
+                self.log(f"== {name}")
+                SCENARIOS[name](self)
+
+        return {
+            "meta": {
+                "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(started)),
+                "duration_s": round(time.time() - started, 3),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "latency_s": self.latency,
+                "bandwidth_bytes_per_s": self.bandwidth,
+                "repeats": self.repeats,
+                "scenarios": scenarios,
+            },
+            "results": self.results,
+            "metrics": self.metrics.snapshot(),
+        }
+
+    def client(self):
+        """A logged-in client on the loopback server."""
+        client = FTPClient(is_gui=True)
+        client.set_output_callback(lambda message: None)
+        client.metrics = self.metrics
+        client.open("127.0.0.1", self.server.port)
+        if not client.login("bench", "bench"):
+            raise RuntimeError("Could not log in to the loopback server.")
+        return client
+
+    def measure(self, name, func, nbytes=None, operations=1, **params):
+        """
+        Time func() self.repeats times and record the result. func must
+        return True for success; a failed run raises so a broken build
+        never produces plausible-looking numbers.
+        """
+        runs = []
+        for _ in range(self.repeats):
+            start = time.perf_counter()
+            ok = func()
+            runs.append(time.perf_counter() - start)
+            if ok is False:
+                raise RuntimeError(f"Benchmark step '{name}' failed.")
+
+        median = statistics.median(runs)
+        result = {
+            "name": name,
+            "params": params,
+            "runs_s": [round(r, 6) for r in runs],
+            "median_s": round(median, 6),
+            "min_s": round(min(runs), 6),
+            "ops_per_s": round(operations / median, 3) if median else None,
+        }
+        if nbytes is not None:
+            result["mib_per_s"] = round(nbytes / MiB / median, 3) if median else None
+        self.results.append(result)
+
+        rate = f", {result['mib_per_s']} MiB/s" if nbytes is not None else ""
+        self.log(f"  {name}: median {median * 1000:.1f} ms{rate}")
+        return result
+
+
+# scenarios
+def bench_login(bench):
+    def login():
+        client = bench.client()
+        client.close()
+        return True
+
+    bench.measure("login", login)
+
+
+def bench_get(bench):
+    client = bench.client()
+    try:
+        for size in bench.transfer_sizes:
+            bench.server.add_file(f"/get/{size}.bin", size=size)
+            client.cd("/get")
+            local_path = os.path.join(bench.workdir, "download.bin")
+            bench.measure(f"get[{_size_name(size)}]", lambda: client.get(f"{size}.bin", local_path),
+                          nbytes=size, size=size)
+            os.remove(local_path)
+    finally:
+        client.close()
+
+
+def bench_put(bench):
+    client = bench.client()
+    try:
+        client.mkdir("/put")
+        client.cd("/put")
+        for size in bench.transfer_sizes:
+            local_path = os.path.join(bench.workdir, f"upload-{size}.bin")
+            with open(local_path, "wb") as f:
+                f.write(os.urandom(min(size, MiB)) * max(1, size // MiB))
+                f.truncate(size)
+            bench.measure(f"put[{_size_name(size)}]", lambda: client.put(local_path, f"{size}.bin"),
+                          nbytes=size, size=size)
+            os.remove(local_path)
+    finally:
+        client.close()
+
+
+def bench_list(bench):
+    client = bench.client()
+    try:
+        for count in bench.listing_sizes:
+            path = f"/list/{count}"
+            bench.server.add_many(path, count)
+            client.cd(path)
+            bench.measure(f"list_directory[{count}]", lambda: len(client.list_directory()) == count,
+                          operations=count, entries=count)
+            bench.measure(f"list_entries[{count}]",
+                          lambda: len(client.list_entries(refresh=True)) == count,
+                          operations=count, entries=count)
+    finally:
+        client.close()
+
+
+def bench_small_files(bench):
+    for i in range(SMALL_FILES):
+        bench.server.add_file(f"/small/f{i:04d}.dat", size=SMALL_FILE_SIZE)
+    nbytes = SMALL_FILES * SMALL_FILE_SIZE
+
+    for workers in (1, 4):
+        client = bench.client()
+        local_dir = os.path.join(bench.workdir, f"small-{workers}")
+        os.makedirs(local_dir, exist_ok=True)
+        try:
+            client.cd("/small")
+            bench.measure(f"mget[{SMALL_FILES}x{_size_name(SMALL_FILE_SIZE)},j{workers}]",
+                          lambda: not mget(client, ["*.dat"], workers, local_dir=local_dir)[1],
+                          nbytes=nbytes, operations=SMALL_FILES, files=SMALL_FILES, workers=workers)
+
+            client.mkdir(f"/small-up-{workers}")
+            client.cd(f"/small-up-{workers}")
+            pattern = os.path.join(local_dir, "*.dat")
+            bench.measure(f"mput[{SMALL_FILES}x{_size_name(SMALL_FILE_SIZE)},j{workers}]",
+                          lambda: not mput(client, [pattern], workers)[1],
+                          nbytes=nbytes, operations=SMALL_FILES, files=SMALL_FILES, workers=workers)
+        finally:
+            client.close()
+
+
+def bench_metadata(bench):
+    names = [f"m{i:04d}.dat" for i in range(METADATA_FILES)]
+    for name in names:
+        bench.server.add_file(f"/meta/{name}", size=SMALL_FILE_SIZE)
+
+    client = bench.client()
+    try:
+        client.cd("/meta")
+        bench.measure(f"size_sequential[{METADATA_FILES}]",
+                      lambda: all(client.size(name) == SMALL_FILE_SIZE for name in names),
+                      operations=METADATA_FILES, files=METADATA_FILES)
+        bench.measure(f"size_pipelined[{METADATA_FILES}]",
+                      lambda: all(v == SMALL_FILE_SIZE for v in client.sizes(names).values()),
+                      operations=METADATA_FILES, files=METADATA_FILES)
+        bench.measure(f"mdtm_pipelined[{METADATA_FILES}]",
+                      lambda: None not in client.mdtms(names).values(),
+                      operations=METADATA_FILES, files=METADATA_FILES)
+    finally:
+        client.close()
+
+
+def bench_compression(bench):
+    data = _text(COMPRESSION_SIZE)
+    bench.server.add_file("/text/data.csv", data)
+    local_path = os.path.join(bench.workdir, "data.csv")
+    with open(local_path, "wb") as f:
+        f.write(data)
+
+    client = bench.client()
+    try:
+        client.cd("/text")
+        for mode in ("S", "Z"):
+            client.use_compression = mode == "Z"
+            name = f"{_size_name(COMPRESSION_SIZE)},mode{mode}"
+            download = os.path.join(bench.workdir, f"download-{mode}.csv")
+            bench.measure(f"get_text[{name}]", lambda: client.get("data.csv", download),
+                          nbytes=COMPRESSION_SIZE, size=COMPRESSION_SIZE, mode=mode)
+            bench.measure(f"put_text[{name}]", lambda: client.put(local_path, f"up-{mode}.csv"),
+                          nbytes=COMPRESSION_SIZE, size=COMPRESSION_SIZE, mode=mode)
+            with open(download, "rb") as f:
+                if f.read() != data or bench.server.read_file(f"/text/up-{mode}.csv") != data:
+                    raise RuntimeError(f"MODE {mode} transfer did not round-trip.")
+            os.remove(download)
+    finally:
+        client.close()
+
+
+SCENARIOS = {
+    "login": bench_login,
+    "get": bench_get,
+    "put": bench_put,
+    "list": bench_list,
+    "small_files": bench_small_files,
+    "metadata": bench_metadata,
+    "compression": bench_compression,
+}
+
+
+def compare(baseline, current):
+    """
+    Compare two run() results by median time. Returns a list of
+    (name, old_median, new_median, change) for every benchmark present
+    in both, change being the relative slowdown (0.25 = 25% slower).
+    """
+    old = {r["name"]: r for r in baseline["results"]}
+    rows = []
+    for result in current["results"]:
+        before = old.get(result["name"])
+        if before is None or not before["median_s"]:
+            continue
+        change = result["median_s"] / before["median_s"] - 1.0
+        rows.append((result["name"], before["median_s"], result["median_s"], change))
+    return rows
+
+
+def _text(size):
+    """Log-like CSV rows, roughly as compressible as real exports."""
+    rows, length, i = [], 0, 0
+    while length < size:
+        row = f"{i},2024-01-{i % 28 + 1:02d}T{i % 24:02d}:{i % 60:02d}:00,host{i % 97},GET,/api/v1/items/{i * 7919 % 100000},{200 if i % 13 else 404},{i * 31 % 65536}\n"
+        rows.append(row)
+        length += len(row)
+        i += 1
+    return "".join(rows).encode("ascii")[:size]
+
+
+def _size_name(size):
+    return f"{size // MiB}MiB" if size >= MiB else f"{size // KiB}KiB"
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark FTPClient against a loopback server.")
+    parser.add_argument("scenarios", nargs="*", help=f"any of: {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("-o", "--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="compare against an earlier JSON result")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added per server reply")
+    parser.add_argument("--bandwidth", type=float, default=None, help="server bandwidth in MiB/s")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--quick", action="store_true", help="skip the largest sizes")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="slowdown that counts as a regression (default 0.10)")
+    args = parser.parse_args(argv)
+
+    bench = Bench(
+        latency=args.latency,
+        bandwidth=args.bandwidth * MiB if args.bandwidth else None,
+        repeats=args.repeats,
+        quick=args.quick,
+    )
+    try:
+        results = bench.run(args.scenarios)
+    except (ValueError, RuntimeError) as e:
+        print(e)
+        return 2
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to '{args.output}'.")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = 0
+        for name, before, after, change in compare(baseline, results):
+            flag = "  REGRESSION" if change > args.threshold else ""
+            regressions += bool(flag)
+            print(f"{name:40} {before * 1000:10.1f} ms -> {after * 1000:10.1f} ms  {change:+7.1%}{flag}")
+        if regressions:
+            print(f"{regressions} regression(s) over {args.threshold:.0%}.")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,388 @@
+import hashlib
+import io
+import json
+import mmap
+import netrc
+import posixpath
+import select
 import socket
 import re
 import os
+import sys
 import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from ftp_index import DEFAULT_INDEX, RemoteIndex, crawl
+from ftp_journal import JournalRunner, TransferJournal, enqueue, journal_path
+from ftp_listing import FTPEntry, ListingCache, parse_ftp_time, parse_list_line, parse_mlsd_line
+from ftp_metrics import Metrics
+from ftp_mirror import mirror
+from ftp_pool import FTPSessionPool, PoolTimeout
+from ftp_shaping import RateSchedule, Shaper, parse_rate
+from ftp_transfer import mget, mput
+from ftp_tuning import MAX_CHUNK, MIN_CHUNK, DataTuner
+
+# segmented downloads: below this many bytes per segment a plain get is faster
+MIN_SEGMENT_SIZE = 1024 * 1024
+
+# interrupted transfers leave <local file> + CHECKPOINT_SUFFIX behind,
+# refreshed every CHECKPOINT_INTERVAL bytes
+CHECKPOINT_SUFFIX = ".ftp-checkpoint"
+CHECKPOINT_INTERVAL = 4 * 1024 * 1024
+
+# bytes handed to sendfile per call, small enough for smooth progress
+SENDFILE_SLICE = 1024 * 1024
+
+# worker sessions used by mget/mput unless -j is given
+DEFAULT_WORKERS = 4
+
+# MODE Z: most inflated bytes produced per decompress call, so a small
+# compressed chunk cannot balloon in memory
+INFLATE_LIMIT = 4 * 1024 * 1024
+
+# transfers that fail verification are repeated this many times
+VERIFY_RETRIES = 2
+
+# servers hash the whole file before answering HASH/XMD5...; allow for a
+# slow disk on top of COMPLETION_TIMEOUT
+HASH_RATE = 32 * 1024 * 1024
+
+# unanswered commands allowed on the wire by pipeline()
+PIPELINE_WINDOW = 32
+
+# waiting for the reply that ends an upload: at least this long, plus a
+# few control round trips and time for the server to flush what it got
+COMPLETION_TIMEOUT = 5.0
+COMPLETION_FLUSH_RATE = 8 * 1024 * 1024
+
+_REPLY_START_RE = re.compile(r"(\d{3})([ -]|$)")
+_PASV_RE = re.compile(r"\((\d+),(\d+),(\d+),(\d+),(\d+),(\d+)\)")
+_PWD_RE = re.compile(r'"(.*)"')
+_RETR_SIZE_RE = re.compile(r"\((\d+) bytes\)")
+_VERB_RE = re.compile(r"[A-Za-z]{3,4}$")
+
+# commands the server answers without real work, the only ones whose
+# round trip feeds the RTT estimate; HASH, transfers and listings would
+# skew it with server-side time
+_RTT_COMMANDS = frozenset(("NOOP", "PWD", "TYPE", "PASV", "EPSV", "SIZE", "CWD"))
+_HASH_REPLY_RE = re.compile(r"^\d{3}[ -]\S+ \d+-\d+ ([0-9A-Fa-f]+)")
+_XHASH_REPLY_RE = re.compile(r"^\d{3}[ -]([0-9A-Fa-f]+)\b")
+
+
+class TransferCancelled(Exception):
+    """Raised from a progress callback to stop a transfer."""
+
+
+class _ServerReplied(Exception):
+    """The server answered on the control connection before the upload ended."""
+
+
+class _CRC32:
+    """zlib.crc32 with the hashlib update/hexdigest interface."""
+
+    def __init__(self):
+        self.value = 0
+
+    def update(self, data):
+        self.value = zlib.crc32(data, self.value)
+
+    def hexdigest(self):
+        return f"{self.value:08x}"
+
+
+# HASH algorithm name -> (equivalent X command, digest factory)
+_HASH_ALGORITHMS = {
+    "SHA-256": ("XSHA256", hashlib.sha256),
+    "SHA-1": ("XSHA1", hashlib.sha1),
+    "MD5": ("XMD5", hashlib.md5),
+    "CRC32": ("XCRC", _CRC32),
+}
+
+
+class FTPReply:
+    """One complete server reply: its numeric code and its lines."""
+
+    def __init__(self, code, lines):
+        self.code = code
+        self.lines = lines
+
+    @property
+    def text(self):
+        return "\n".join(self.lines)
+
+    def __str__(self):
+        return self.text
+
+    def __repr__(self):
+        return f"<FTPReply {self.code} {self.lines[:1]}>"
+
+
+class _ReplyReader:
+    """
+    Buffered line reader for the control connection. Bytes that arrive
+    past the end of a reply stay buffered for the next call, so pipelined
+    replies are neither lost nor merged, and every byte is scanned for a
+    line ending only once.
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = bytearray()
+        self.start = 0    # first unconsumed byte
+        self.scanned = 0  # no line ending before this index
+
+    def read_line(self):
+        """Return the next line without its ending, or None at EOF."""
+        while True:
+            end = self.buffer.find(b"\n", max(self.start, self.scanned))
+            if end >= 0:
+                line = self.buffer[self.start:end].rstrip(b"\r")
+                self.start = end + 1
+                if self.start == len(self.buffer):
+                    self.buffer.clear()
+                    self.start = self.scanned = 0
+                return line.decode('utf-8', errors='ignore')
+
+            self.scanned = len(self.buffer)
+            if self.start > 65536:
+                # drop consumed bytes now and then instead of on every line
+                del self.buffer[:self.start]
+                self.scanned -= self.start
+                self.start = 0
+
+            chunk = self.sock.recv(4096)
+            if not chunk:
+                if self.start < len(self.buffer):
+                    # connection closed after an unterminated line
+                    line = self.buffer[self.start:]
+                    self.buffer.clear()
+                    self.start = self.scanned = 0
+                    return line.decode('utf-8', errors='ignore')
+                return None
+            self.buffer += chunk
+
+    def pending(self):
+        """True if reply bytes are buffered or waiting on the socket."""
+        if self.start < len(self.buffer):
+            return True
+        try:
+            return bool(select.select([self.sock], [], [], 0)[0])
+        except (OSError, ValueError):
+            return False
+
+    def read_reply(self, timeout):
+        """
+        Read one complete, possibly multi-line, reply. A first line that
+        does not start with a reply code is returned at once with code 0
+        rather than waiting for a timeout.
+        """
+        self.sock.settimeout(timeout)
+        lines = []
+        try:
+            first = self.read_line()
+            if first is None:
+                return FTPReply(0, lines)
+            lines.append(first)
+
+            match = _REPLY_START_RE.match(first)
+            if not match:
+                return FTPReply(0, lines)
+
+            code = match.group(1)
+            if match.group(2) == "-":
+                terminator = code + " "
+                while True:
+                    line = self.read_line()
+                    if line is None:
+                        break
+                    lines.append(line)
+                    if line.startswith(terminator) or line == code:
+                        break
+            return FTPReply(int(code), lines)
+
+        except socket.timeout:
+            return FTPReply(int(lines[0][:3]) if lines and lines[0][:3].isdigit() else 0, lines)
+
+
+class RetrieveStream(io.RawIOBase):
+    """
+    Readable binary stream over a RETR data connection, returned by
+    FTPClient.retrieve_stream(). Bytes are only taken off the socket as
+    the caller reads them, so TCP flow control holds the server back.
+    Iterating gives lines, like any binary file, through readline(),
+    which reads a chunk at a time into a small buffer; chunks() gives
+    blocks. close() reads the server's final reply, after which `ok`
+    says whether the whole file arrived.
+    """
+
+    def __init__(self, client, data_socket, filename, timer, size=None, progress=None):
+        super().__init__()
+        self.client = client
+        self.name = filename
+        self.size = size
+        self.position = 0
+        self.ok = False
+        self._socket = data_socket
+        self._timer = timer
+        self._progress = progress
+        self._eof = False
+        self._buffer = bytearray()  # received but not yet read, only filled by readline/peek
+        self._scratch = None
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self.closed:
+            raise ValueError("I/O operation on closed stream.")
+        if self._buffer:
+            n = min(len(buffer), len(self._buffer))
+            buffer[:n] = self._buffer[:n]
+            del self._buffer[:n]
+            return n
+        return self._recv_into(buffer)
+
+    def readline(self, size=-1):
+        if self.closed:
+            raise ValueError("I/O operation on closed stream.")
+        if size is None:
+            size = -1
+        searched = 0
+        while True:
+            end = self._buffer.find(b"\n", searched) + 1
+            if end or self._eof or 0 <= size <= len(self._buffer):
+                break
+            searched = len(self._buffer)
+            self._fill()
+        if not end:
+            end = len(self._buffer)
+        if size >= 0:
+            end = min(end, size)
+        line = bytes(self._buffer[:end])
+        del self._buffer[:end]
+        return line
+
+    def peek(self, size=0):
+        """Buffered bytes without consuming them, receiving one chunk if there are none."""
+        if self.closed:
+            raise ValueError("I/O operation on closed stream.")
+        if not self._buffer:
+            self._fill()
+        return bytes(self._buffer)
+
+    def _fill(self):
+        if self._scratch is None:
+            self._scratch = memoryview(bytearray(self.client._chunk_size()))
+        n = self._recv_into(self._scratch)
+        self._buffer += self._scratch[:n]
+        return n
+
+    def _recv_into(self, buffer):
+        if self._eof:
+            return 0
+        n = self._socket.recv_into(buffer)
+        if not n:
+            self._eof = True
+            return 0
+        self.position += n
+        self._timer.first_byte()
+        if self._progress:
+            self._progress(self.position, self.size)
+        return n
+
+    def chunks(self, size=None):
+        """Yield the data as bytes objects of up to size bytes."""
+        size = size or self.client._chunk_size()
+        while True:
+            data = self.read(size)
+            if not data:
+                return
+            yield data
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self._finish()
+        finally:
+            super().close()
+
+    def _finish(self):
+        client = self.client
+        complete = self._eof
+        self._socket.close()
+        # closing before the end makes the server answer 426
+        reply = client._recv_reply(client._completion_timeout(0))
+        client._log(reply.text or "No reply from server.")
+        self.ok = complete and reply.code == 226 and self.size in (None, self.position)
+        if self.ok:
+            self._timer.finish(self.position)
+            client._log(f"File '{self.name}' streamed successfully ({self.position} bytes).")
+        elif not complete:
+            self._timer.finish(self.position, "cancelled")
+            client._log(f"Stream of '{self.name}' closed after {self.position} bytes.")
+        else:
+            self._timer.finish(self.position, "failed")
+            client._log(f"Stream of '{self.name}' incomplete: {self.position} bytes received.")
 
 
 class FTPClient:
     def __init__(self, is_gui=False):
         self.control_socket = None
+        self._reader = None
         self.connected = False
         self.is_gui = is_gui        
         self.output_callback = print  
 
+        # remembered so extra sessions can be opened for parallel transfers
+        self.host = None
+        self.port = 21
+        self.username = None
+        self.password = None
+        self.pool = None
+        self._features = None
+
+        # remote listings by absolute path, see list_entries()
+        self.cwd = None
+        self.listing_cache = ListingCache()
+        self._listing_complete = False
+        # update cached listings after an upload instead of dropping them
+        self.cache_patch_uploads = False
+
+        # data path tuning: fixed read size and socket buffer in bytes,
+        # None to size them from the measured RTT and throughput (a
+        # socket_buffer of 0 keeps the kernel defaults)
+        self.buffer_size = None
+        self.socket_buffer = None
+        self.tuner = DataTuner()
+        self.use_sendfile = True
+        # deflate get/put data (MODE Z) when the server offers it; pays off
+        # for text on slow links, costs CPU on fast ones
+        self.use_compression = False
+        self.compression_level = 6
+        self._mode = "S"
+        # check finished get/put against the server: a digest computed as
+        # the data streams through, compared with HASH or XSHA256/XMD5/XCRC,
+        # or the size where the server offers no hash
+        self.verify = True
+        self.hash_algorithms = ("SHA-256", "SHA-1", "MD5", "CRC32")
+        self._hash_choice = None  # (algorithm, command), False if none; None until asked
+        # mapping the target saves a copy but pays a page fault per page,
+        # compare both with the per-transfer MiB per CPU second figure
+        self.use_mmap = False
+        # bandwidth limits for data connections (a Shaper, shared with
+        # pooled sessions), and this session's weight while it is shaped
+        self.shaper = None
+        self.priority = 1
+
+        # latency/throughput histograms, shared with pooled sessions
+        self.metrics = Metrics()
+        self._command_started = None
+        self._pasv_started = None
+        # smoothed control round trip, scales the upload completion timeout
+        self.rtt = None
+
     def set_output_callback(self, callback):
         
         if callback is None:
@@ -27,25 +399,47 @@ class FTPClient:
             print(message)
 
     #  connect/login 
-    def open(self, host, port=21):
-        # Connect to FTP server and authenticate
+    def open(self, host, port=21, username=None, password=None):
+        """
+        Connect to host and, unless running under the GUI, log in: with
+        username/password when given, else with a matching ~/.netrc
+        entry, else by asking on the terminal.
+        """
+        self._close_pool()
+        self._features = None
+        self._mode = "S"
+        self._hash_choice = None
+        self.cwd = None
+        self.listing_cache = ListingCache(self.listing_cache.ttl, self.listing_cache.max_dirs)
         try:
             self.control_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._reader = _ReplyReader(self.control_socket)
             self.control_socket.settimeout(5.0)
             self._log(f"Connecting to {host}:{port}...")
             self.control_socket.connect((host, port))
             self.connected = True
+            self.host = host
+            self.port = port
 
             response = self._recv_response()
             self._log(response.strip())
 
+            if username is not None:
+                self.login(username, password)
+                return
+
             # If running under GUI, we stop here.
             if self.is_gui:
                 return
 
             # CLI login flow 
-            username = input("Username (or 'anonymous'): ")
-            password = input("Password: ")
+            credentials = netrc_credentials(host)
+            if credentials:
+                self._log(f"Using credentials for {host} from netrc.")
+                username, password = credentials
+            else:
+                username = input("Username (or 'anonymous'): ")
+                password = input("Password: ")
 
             self.login(username, password)
 
@@ -79,6 +473,8 @@ class FTPClient:
             # Evaluate final login response
             if response.startswith("230"):
                 self._log(" Login successful!")
+                self.username = username
+                self.password = password
                 return True
             elif response.startswith("530"):
                 self._log(" Login failed: incorrect username or password.")
@@ -106,173 +502,1266 @@ class FTPClient:
     def list_directory(self):
         """
         Perform a LIST in passive mode and return the directory listing
-        as a list of lines. This is used both by the CLI (via dir())
-        and by the GUI (to populate the remote file list).
+        as a list of lines. This is used by the CLI (via dir()).
+        """
+        return list(self._iter_lines("LIST"))
+
+    def iter_directory(self, path=None):
+        """
+        Yield FTPEntry objects (name, type, size, modify, perms) as the
+        listing arrives. Uses MLSD when FEAT advertises MLST, otherwise
+        parses Unix or DOS style LIST output. The control connection is
+        busy until the generator is exhausted or closed.
+        """
+        use_mlsd = self.supports("MLST") or self.supports("MLSD")
+        command = "MLSD" if use_mlsd else "LIST"
+        if path:
+            command += f" {path}"
+        parse = parse_mlsd_line if use_mlsd else parse_list_line
+
+        for line in self._iter_lines(command):
+            entry = parse(line)
+            if entry is not None:
+                yield entry
+
+    def list_entries(self, path=None, refresh=False):
+        """
+        Return the FTPEntry list for path (default: current directory),
+        served from the listing cache when a fresh copy is there. Uploads,
+        deletes and renames through this client drop the affected entries.
+        """
+        return list(self.iter_entries(path, refresh))
+
+    def iter_entries(self, path=None, refresh=False):
+        """
+        Streaming form of list_entries: yields the cached listing when
+        there is a fresh one, otherwise entries as they arrive, caching
+        them once the listing completes.
         """
         if not self.connected:
             self._log("Not connected.")
-            return []
+            self._listing_complete = False
+            return
+
+        abs_path = self._remote_abspath(path or ".")
+        if not refresh and abs_path:
+            cached = self.listing_cache.get(abs_path)
+            if cached is not None:
+                # only complete listings are cached
+                self._listing_complete = True
+                yield from cached
+                return
+
+        entries = []
+        for entry in self.iter_directory(path):
+            entries.append(entry)
+            yield entry
+        if abs_path and self._listing_complete:
+            self.listing_cache.put(abs_path, entries)
+
+    def name_list(self, path=None):
+        """Return the plain file names from NLST, for wildcard matching."""
+        command = f"NLST {path}" if path else "NLST"
+        return [os.path.basename(name.rstrip("/")) for name in self._iter_lines(command) if name]
+
+    def _iter_lines(self, command):
+        """
+        Run a listing command over a passive data connection and yield
+        its lines as they arrive, without holding the whole listing.
+        """
+        self._listing_complete = False
+        if not self.connected:
+            self._log("Not connected.")
+            return
 
         ip, port = self._enter_passive_mode()
         if not ip:
-            return []
-
-        listing_lines = []
+            return
 
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as data_socket:
-                data_socket.connect((ip, port))
-                self._send_command("LIST")
+            data_socket = self._connect_data(ip, port)
+        except Exception as e:
+            self._log(f"Data connection error: {e}")
+            return
+
+        with data_socket:
+            try:
+                self._set_mode("S")
+                self._send_command(command)
                 control_resp = self._recv_response()
                 self._log(control_resp.strip())
+                if self._parse_response_code(control_resp) not in (125, 150):
+                    return
+            except Exception as e:
+                self._log(f"Data connection error: {e}")
+                return
 
-                # get dir list
-                data = b""
+            try:
+                pending = b""
+                chunk_size = self._chunk_size()
                 while True:
-                    chunk = data_socket.recv(4096)
+                    chunk = data_socket.recv(chunk_size)
                     if not chunk:
                         break
-                    data += chunk
-
-                listing_text = data.decode('utf-8', errors='ignore')
-                listing_lines = listing_text.splitlines()
+                    lines = (pending + chunk).split(b"\n")
+                    pending = lines.pop()
+                    for line in lines:
+                        yield line.rstrip(b"\r").decode('utf-8', errors='ignore')
+                if pending:
+                    yield pending.rstrip(b"\r").decode('utf-8', errors='ignore')
 
+            except Exception as e:
+                self._log(f"Data connection error: {e}")
+            finally:
+                # runs even if the caller stops iterating early, so the
+                # completion reply never lingers on the control channel
+                data_socket.close()
                 final_resp = self._recv_response()
                 self._log(final_resp.strip())
-
-        except Exception as e:
-            self._log(f"Data connection error: {e}")
-            return []
-
-        return listing_lines
+                self._listing_complete = self._parse_response_code(final_resp) in (226, 250)
 
     # cd dir
     def cd(self, path):
+        """Change the remote directory. Returns True on success."""
         if not self.connected:
             self._log("Not connected.")
-            return
+            return False
 
         self._send_command(f"CWD {path}")
         response = self._recv_response()
         self._log(response.strip())
         code = self._parse_response_code(response)
         if code == 250:
+            # absolute paths are known already, anything else is looked
+            # up with PWD the next time it is needed
+            self.cwd = posixpath.normpath(path) if path.startswith("/") else None
             self._log(f"Changed directory to '{path}'")
+            return True
         elif code == 550:
             self._log(f"Failed to change directory to '{path}'")
         else:
             self._log("Unexpected response: " + response.strip())
+        return False
 
     # download
-    def get(self, filename):
+    def get(self, filename, local_path=None, resume=False, progress=None):
+        """
+        Download a remote file into local_path (defaults to the remote
+        name in the current directory). With resume=True an existing
+        partial local file is continued with REST instead of restarted.
+        progress(done, total) is called as data arrives; total may be
+        None, and raising TransferCancelled from it stops the transfer
+        with the partial file kept. With verify on, a file that fails the
+        check is downloaded again. Returns True on success.
+        """
+        return self._with_verify_retries(
+            filename, lambda resume: self._get(filename, local_path, resume, progress), resume
+        )
+
+    def _get(self, filename, local_path, resume, progress):
+        """One get() attempt; None means the file arrived but failed verification."""
         if not self.connected:
             self._log("Not connected.")
-            return
+            return False
 
+        local_path = local_path or filename
+        offset = 0
+        remote_size = None
+        if resume:
+            remote_size = self.size(filename)
+            offset = self._download_resume_offset(local_path, remote_size)
+            if remote_size is not None and offset == remote_size:
+                if self._verify_local(filename, local_path, remote_size):
+                    self._clear_checkpoint(local_path)
+                    self._log(f"File '{filename}' is already complete.")
+                    return True
+                self._log(f"Local copy of '{filename}' does not match, restarting.")
+                offset = 0
+
+        hash_method = self._server_hash() if self.verify else None
+        timer = self.metrics.transfer("get")
         ip, port = self._enter_passive_mode()
         if not ip:
-            return
+            timer.finish(0, "failed")
+            return False
 
+        received = offset
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as data_socket:
-                data_socket.connect((ip, port))
+            with self._connect_data(ip, port) as data_socket:
+                if offset and not self._restart_at(offset):
+                    offset = 0
+                    received = 0
+                # offsets into a deflate stream mean nothing, so resumes
+                # always run uncompressed
+                compressed = not offset and self._want_mode_z() and self._set_mode("Z")
+                if not compressed:
+                    self._set_mode("S")
+                # the server hashes whole files, so only whole downloads get a digest
+                digest = _HASH_ALGORITHMS[hash_method[0]][1]() if hash_method and not offset else None
 
                 # request file
+                timer.request()
                 self._send_command(f"RETR {filename}")
                 control_resp = self._recv_response()
                 self._log(control_resp.strip())
 
                 code = self._parse_response_code(control_resp)
-                if code != 150:
+                if code not in (125, 150):
                     self._log(
                         f"Server rejected RETR command (code {code}) — file may not exist or permission denied."
                     )
-                    return
-
-                # write into file (local name is same as remote here)
+                    timer.finish(0, "failed")
+                    return False
+
+                if offset:
+                    self._log(f"Resuming '{filename}' at byte {offset}.")
+
+                # many servers announce the size in the 150 reply, which
+                # lets use_mmap map the file instead of copying through a buffer
+                if remote_size is None and not offset:
+                    match = _RETR_SIZE_RE.search(control_resp)
+                    if match:
+                        remote_size = int(match.group(1))
+
+                checkpoint = {
+                    "direction": "get",
+                    "host": self.host,
+                    "remote": filename,
+                    "size": remote_size,
+                }
+
+                # write into file, partial data is kept so it can be resumed
+                started = time.monotonic(), time.thread_time()
+
+                def track(pos, total):
+                    nonlocal received
+                    received = pos
+                    timer.first_byte()
+                    if progress:
+                        progress(pos, total)
+
+                wire = None
                 try:
-                    with open(filename, "wb") as f:
-                        while True:
-                            chunk = data_socket.recv(4096)
-                            if not chunk:
-                                break
-                            f.write(chunk)
+                    with open(local_path, "r+b" if offset else "w+b") as f:
+                        f.truncate(offset)
+                        if compressed:
+                            received, wire = self._recv_compressed(
+                                data_socket, f, offset, remote_size,
+                                on_checkpoint=lambda pos: self._write_checkpoint(local_path, checkpoint, pos),
+                                progress=track, digest=digest,
+                            )
+                        else:
+                            received = self._recv_to_file(
+                                data_socket, f, offset, remote_size,
+                                on_checkpoint=lambda pos: self._write_checkpoint(local_path, checkpoint, pos),
+                                progress=track, digest=digest,
+                            )
+                except TransferCancelled:
+                    # drop any preallocated tail, then take the server's
+                    # 426 so the control channel stays in step
+                    os.truncate(local_path, received)
+                    self._abandon_data(data_socket, received - offset)
+                    self._write_checkpoint(local_path, checkpoint, received)
+                    self._log(f"Download of '{filename}' cancelled, partial file kept.")
+                    timer.finish(received - offset, "cancelled")
+                    return False
                 except Exception as e:
-                    self._log(f"Error writing to file '{filename}': {e}")
-                    if os.path.exists(filename):
-                        os.remove(filename)
-                    return
+                    self._log(f"Error writing to file '{local_path}': {e}")
+                    self._abandon_data(data_socket, received - offset)
+                    self._write_checkpoint(local_path, checkpoint, received)
+                    timer.finish(received - offset, "failed")
+                    return False
 
                 final_resp = self._recv_response()
                 self._log(final_resp.strip())
                 if self._parse_response_code(final_resp) == 226:
-                    self._log(f"File '{filename}' downloaded successfully.")
+                    timer.finish(received - offset)
+                    self.tuner.record(received - offset, time.monotonic() - started[0])
+                    self._clear_checkpoint(local_path)
+                    if not self._verify_transfer(filename, received, remote_size, hash_method, digest):
+                        return None
+                    self._log(
+                        f"File '{filename}' downloaded successfully"
+                        f"{self._rate_summary(received - offset, started, wire)}."
+                    )
+                    return True
                 else:
+                    timer.finish(received - offset, "failed")
+                    self._write_checkpoint(local_path, checkpoint, received)
                     self._log(f"Unexpected final response: {final_resp.strip()}")
+                    return False
+
+        except Exception as e:
+            timer.finish(received - offset, "failed")
+            self._log(f"Download error: {e}")
+            if os.path.exists(local_path):
+                self._write_checkpoint(
+                    local_path,
+                    {"direction": "get", "host": self.host, "remote": filename, "size": remote_size},
+                    received,
+                )
+                self._log(f"Partial file kept, use 'reget {filename}' to resume.")
+            return False
+
+    def retrieve_stream(self, filename, offset=0, progress=None):
+        """
+        Open a remote file for reading without staging it on disk,
+        optionally from byte offset (REST). Returns a RetrieveStream, a
+        readable binary file object to use in a with block, or None if
+        the transfer could not be started. Memory use is whatever the
+        caller reads at a time. The control connection is busy until the
+        stream is closed. Streams always use MODE S.
+        """
+        if not self.connected:
+            self._log("Not connected.")
+            return None
+
+        timer = self.metrics.transfer("get")
+        ip, port = self._enter_passive_mode()
+        if not ip:
+            timer.finish(0, "failed")
+            return None
 
+        try:
+            data_socket = self._connect_data(ip, port)
+        except OSError as e:
+            self._log(f"Data connection error: {e}")
+            timer.finish(0, "failed")
+            return None
+
+        try:
+            if offset and not self._restart_at(offset):
+                self._log(f"Server cannot start '{filename}' at byte {offset}.")
+                data_socket.close()
+                timer.finish(0, "failed")
+                return None
+            self._set_mode("S")
+            timer.request()
+            self._send_command(f"RETR {filename}")
+            control_resp = self._recv_response()
+            self._log(control_resp.strip())
         except Exception as e:
+            data_socket.close()
             self._log(f"Download error: {e}")
+            timer.finish(0, "failed")
+            return None
+
+        code = self._parse_response_code(control_resp)
+        if code not in (125, 150):
+            self._log(f"Server rejected RETR command (code {code}) — file may not exist or permission denied.")
+            data_socket.close()
+            timer.finish(0, "failed")
+            return None
+
+        match = _RETR_SIZE_RE.search(control_resp)
+        size = int(match.group(1)) if match else None
+        return RetrieveStream(self, data_socket, filename, timer, size, progress)
+
+    # segmented download
+    def get_segmented(self, filename, segments=4, retries=2):
+        """
+        Download a file over several data connections at once. Each
+        segment is fetched by its own logged-in session using REST + RETR
+        and written into a preallocated local file at its offset. Failed
+        segments are retried on their own. Returns True on success.
+        """
+        if not self.connected:
+            self._log("Not connected.")
+            return False
+
+        size = self.size(filename)
+        if size is None or segments < 2 or size < segments * MIN_SEGMENT_SIZE:
+            self._log("Segmented download not worthwhile, using a single connection.")
+            return self.get(filename)
+
+        remote_dir = self.pwd()
+        seg_len = size // segments
+        ranges = []
+        for i in range(segments):
+            offset = i * seg_len
+            length = size - offset if i == segments - 1 else seg_len
+            ranges.append((offset, length))
+
+        try:
+            # preallocate so every segment can write at its own offset
+            with open(filename, "wb") as f:
+                f.truncate(size)
+        except Exception as e:
+            self._log(f"Error creating local file '{filename}': {e}")
+            return False
+
+        self._log(f"Downloading '{filename}' ({size} bytes) in {segments} segments...")
+        start = time.time()
+
+        sessions = self.get_pool(segments)
+
+        def worker(seg_range):
+            for attempt in range(retries + 1):
+                if attempt:
+                    self.metrics.increment("retries_total", operation="segment")
+                try:
+                    with sessions.session(timeout=30.0) as session:
+                        if self._fetch_segment(session, filename, remote_dir, seg_range):
+                            self.metrics.observe("transfer_retries", attempt, operation="segment")
+                            return True
+                except PoolTimeout as e:
+                    self._log(f"No session for segment: {e}")
+                self._log(f"Segment at offset {seg_range[0]} failed (attempt {attempt + 1}).")
+            self.metrics.observe("transfer_retries", retries, operation="segment")
+            return False
+
+        with ThreadPoolExecutor(max_workers=segments) as pool:
+            results = list(pool.map(worker, ranges))
+
+        # each segment checks it received its whole range (the file was
+        # preallocated, so its size says nothing); the assembled file then
+        # gets the same hash check as a plain get
+        if not all(results) or not self._verify_local(filename, filename, size):
+            self._log(f"Segmented download of '{filename}' failed.")
             if os.path.exists(filename):
                 os.remove(filename)
+            return False
+
+        elapsed = max(time.time() - start, 1e-6)
+        self._log(
+            f"File '{filename}' downloaded successfully "
+            f"({size / elapsed / 1024 / 1024:.2f} MiB/s over {segments} connections)."
+        )
+        return True
+
+    def _fetch_segment(self, session, filename, remote_dir, seg_range):
+        """Fetch one byte range of a file on a borrowed session."""
+        offset, length = seg_range
+        received = 0
+        timer = session.metrics.transfer("segment")
+        try:
+            if remote_dir:
+                session.cd(remote_dir)
+            session._send_command("TYPE I")
+            session._recv_response()
+
+            ip, port = session._enter_passive_mode()
+            if not ip:
+                return False
+
+            with session._connect_data(ip, port, timeout=10.0) as data_socket:
+                # byte ranges only work on the raw stream
+                session._set_mode("S")
+                session._send_command(f"REST {offset}")
+                if session._parse_response_code(session._recv_response()) != 350:
+                    self._log("Server does not support REST.")
+                    return False
+
+                timer.request()
+                session._send_command(f"RETR {filename}")
+                code = session._parse_response_code(session._recv_response())
+                if code not in (125, 150):
+                    timer.finish(0, "failed")
+                    return False
+
+                with open(filename, "r+b") as f:
+                    end = self._recv_to_file(
+                        data_socket, f, offset, offset + length, exact=True,
+                        progress=lambda pos, total: timer.first_byte(),
+                    )
+                    received = end - offset
+
+            # closing early makes the server answer 426 instead of 226,
+            # either is fine once the whole range has arrived
+            session._recv_response()
+
+        except Exception as e:
+            timer.finish(received, "failed")
+            self._log(f"Segment download error: {e}")
+            # the control channel may still hold stray replies, let the
+            # pool replace this session
+            session.close()
+            return False
+
+        timer.finish(received, "ok" if received == length else "failed")
+        return received == length
 
     # upload file
-    def put(self, filename):
+    def put(self, filename, remote_name=None, resume=False, progress=None):
+        """
+        Upload a local file as remote_name (defaults to its base name).
+        With resume=True the remote SIZE is checked and only the missing
+        tail is sent, using REST + STOR or APPE. progress works as for
+        get(), and so does verification. Returns True on success.
+        """
+        remote = remote_name or os.path.basename(filename)
+        return self._with_verify_retries(
+            remote, lambda resume: self._put(filename, remote_name, resume, progress), resume
+        )
+
+    def _put(self, filename, remote_name, resume, progress):
+        """One put() attempt; None means the upload went through but failed verification."""
         if not self.connected:
             self._log("Not connected.")
-            return
+            return False
 
         local_path = filename
         if not os.path.isfile(local_path):
             self._log(f" File '{local_path}' does not exist locally.")
-            return
+            return False
 
+        remote_name = remote_name or os.path.basename(local_path)
+        local_size = os.path.getsize(local_path)
+        offset = 0
+        if resume:
+            offset = self._upload_resume_offset(local_path, remote_name, local_size)
+            if offset == local_size and local_size:
+                self._clear_checkpoint(local_path)
+                self._log(f"File '{remote_name}' is already complete on the server.")
+                return True
+
+        checkpoint = {
+            "direction": "put",
+            "host": self.host,
+            "remote": remote_name,
+            "size": local_size,
+            "mtime": os.path.getmtime(local_path),
+        }
+
+        hash_method = self._server_hash() if self.verify else None
+        timer = self.metrics.transfer("put")
         ip, port = self._enter_passive_mode()
         if not ip:
-            return
-
-        remote_name = os.path.basename(local_path)
+            timer.finish(0, "failed")
+            return False
 
+        sent = offset
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as data_socket:
-                data_socket.settimeout(10.0)
-                data_socket.connect((ip, port))
+            with self._connect_data(ip, port, timeout=10.0, direction="send") as data_socket:
+                # file upload, continuing a partial remote file if asked to
+                store = "STOR"
+                if offset and not self._restart_at(offset):
+                    store = "APPE"
+                compressed = not offset and self._want_mode_z() and self._set_mode("Z")
+                if not compressed:
+                    self._set_mode("S")
+                digest = _HASH_ALGORITHMS[hash_method[0]][1]() if hash_method and not offset else None
+                timer.request()
+                self._send_command(f"{store} {remote_name}")
+                control_resp = self._recv_response()
+                self._log(control_resp.strip())
+
+                code = self._parse_response_code(control_resp)
+                if code not in (125, 150):
+                    self._log(f" Server rejected {store} command (code {code})")
+                    timer.finish(0, "failed")
+                    return False
+                timer.first_byte()
+
+                if offset:
+                    self._log(f"Resuming '{remote_name}' at byte {offset} ({store}).")
+
+                # send file data, watching the control connection: a server
+                # that gives up part way (quota, disk full) says so there
+                started = time.monotonic(), time.thread_time()
+
+                def track(pos, total):
+                    nonlocal sent
+                    sent = pos
+                    if self._reader.pending():
+                        raise _ServerReplied()
+                    if progress:
+                        progress(pos, total)
+
+                wire = None
+                try:
+                    with open(local_path, "rb") as f:
+                        if compressed:
+                            sent, wire = self._send_compressed(
+                                data_socket, f, offset, local_size,
+                                lambda pos: self._write_checkpoint(local_path, checkpoint, pos),
+                                track, digest,
+                            )
+                        else:
+                            sent = self._send_from_file(
+                                data_socket, f, offset, local_size,
+                                lambda pos: self._write_checkpoint(local_path, checkpoint, pos),
+                                track, digest,
+                            )
+                    # half-close, so the server sees the end of the data at
+                    # once and answers without us guessing how long to wait
+                    data_socket.shutdown(socket.SHUT_WR)
+                except TransferCancelled:
+                    data_socket.close()
+                    self._log(self._recv_response(timeout=self._completion_timeout(0)).strip())
+                    self._write_checkpoint(local_path, checkpoint, sent)
+                    self._log(f"Upload of '{remote_name}' cancelled, use 'reput {local_path}' to continue.")
+                    timer.finish(sent - offset, "cancelled")
+                    return False
+                except _ServerReplied:
+                    pass
+                except OSError as e:
+                    # servers usually drop the data connection before
+                    # replying with the reason
+                    self._log(f"Data connection lost after {sent} bytes: {e}")
+                data_socket.close()
+
+                # final confirm
+                final_reply = self._recv_reply(self._completion_timeout(sent - offset))
+                self._log(final_reply.text or "No reply from server.")
+
+                if final_reply.code in (226, 250) and sent == local_size:
+                    timer.finish(sent - offset)
+                    self.tuner.record(sent - offset, time.monotonic() - started[0])
+                    self._clear_checkpoint(local_path)
+                    self._uploaded(remote_name, local_size)
+                    if not self._verify_transfer(remote_name, local_size, None, hash_method, digest):
+                        return None
+                    self._log(
+                        f"File '{remote_name}' uploaded successfully"
+                        f"{self._rate_summary(sent - offset, started, wire)}."
+                    )
+                    return True
+
+                timer.finish(sent - offset, "failed")
+                self._write_checkpoint(local_path, checkpoint, sent)
+                if 400 <= final_reply.code < 500:
+                    self._log(f"Upload of '{remote_name}' interrupted at byte {sent}, "
+                              f"use 'reput {local_path}' to retry.")
+                elif final_reply.code >= 500:
+                    self._log(f"Server refused the rest of '{remote_name}' at byte {sent}.")
+                else:
+                    self._log(f"Upload of '{remote_name}' incomplete: {sent} of {local_size} bytes sent.")
+                return False
 
-                # file upload
-                self._send_command(f"STOR {remote_name}")
+        except Exception as e:
+            timer.finish(sent - offset, "failed")
+            self._log(f"Upload error: {e}")
+            if sent:
+                self._write_checkpoint(local_path, checkpoint, sent)
+                self._log(f"Use 'reput {local_path}' to resume.")
+            return False
+
+    def store_stream(self, remote_name, source, append=False, progress=None):
+        """
+        Upload from a binary file object or an iterable of bytes-like
+        chunks as remote_name, appending (APPE) if asked, without a local
+        file. One chunk is in flight at a time and the next is only
+        pulled from source once the socket has taken the last, so a slow
+        link slows the producer down instead of filling memory.
+        progress(done, None) is called after every chunk and may raise
+        TransferCancelled. Returns True on success.
+        """
+        if not self.connected:
+            self._log("Not connected.")
+            return False
+
+        timer = self.metrics.transfer("put")
+        ip, port = self._enter_passive_mode()
+        if not ip:
+            timer.finish(0, "failed")
+            return False
+
+        store = "APPE" if append else "STOR"
+        sent = 0
+        try:
+            with self._connect_data(ip, port, timeout=10.0, direction="send") as data_socket:
+                self._set_mode("S")
+                timer.request()
+                self._send_command(f"{store} {remote_name}")
                 control_resp = self._recv_response()
                 self._log(control_resp.strip())
 
                 code = self._parse_response_code(control_resp)
-                if code != 150:
-                    self._log(f" Server rejected STOR command (code {code})")
-                    return
+                if code not in (125, 150):
+                    self._log(f" Server rejected {store} command (code {code})")
+                    timer.finish(0, "failed")
+                    return False
+                timer.first_byte()
 
-                # send file data
-                with open(local_path, "rb") as f:
-                    while True:
-                        chunk = f.read(4096)
-                        if not chunk:
-                            break
+                complete = False
+                try:
+                    for chunk in _source_chunks(source, self._chunk_size()):
+                        # a server that gives up part way says so on the
+                        # control connection
+                        if self._reader.pending():
+                            raise _ServerReplied()
                         data_socket.sendall(chunk)
-
-                # delay
-                time.sleep(0.5)
+                        sent += len(chunk)
+                        if progress:
+                            progress(sent, None)
+                    data_socket.shutdown(socket.SHUT_WR)
+                    complete = True
+                except TransferCancelled:
+                    self._log(f"Upload of '{remote_name}' cancelled after {sent} bytes.")
+                except _ServerReplied:
+                    pass
+                except OSError as e:
+                    self._log(f"Data connection lost after {sent} bytes: {e}")
+                except Exception as e:
+                    self._log(f"Reading the data for '{remote_name}' failed: {e}")
                 data_socket.close()
 
-                # final confirm
-                final_resp = self._recv_response(timeout=10.0)
-                self._log(final_resp.strip())
-
-                if self._parse_response_code(final_resp) == 226:
-                    self._log(f"File '{remote_name}' uploaded successfully.")
-                else:
-                    self._log(f"Unexpected final response: {final_resp.strip()}")
+                final_reply = self._recv_reply(self._completion_timeout(sent))
+                self._log(final_reply.text or "No reply from server.")
+                if complete and final_reply.code in (226, 250):
+                    timer.finish(sent)
+                    self._uploaded(remote_name, None if append else sent)
+                    self._log(f"File '{remote_name}' stored successfully ({sent} bytes).")
+                    return True
+
+                # whatever arrived may have been kept as a partial file
+                abs_path = self._remote_abspath(remote_name)
+                if abs_path:
+                    self.listing_cache.invalidate(posixpath.dirname(abs_path))
+                timer.finish(sent, "failed")
+                if complete:
+                    self._log(f"Upload of '{remote_name}' failed after {sent} bytes.")
+                return False
 
         except Exception as e:
+            timer.finish(sent, "failed")
             self._log(f"Upload error: {e}")
+            return False
+
+    # verification
+    def _with_verify_retries(self, remote_name, attempt, resume):
+        """
+        Run attempt(resume) until it returns True or False; None (failed
+        verification) repeats it from scratch up to VERIFY_RETRIES times.
+        """
+        for tries in range(VERIFY_RETRIES + 1):
+            result = attempt(resume)
+            if result is not None:
+                return result
+            # the copy that failed cannot be trusted as a base to resume from
+            resume = False
+            if tries < VERIFY_RETRIES:
+                self.metrics.increment("retries_total", operation="verify")
+                self._log(f"Transferring '{remote_name}' again.")
+        self._log(f"'{remote_name}' failed verification {VERIFY_RETRIES + 1} times, giving up.")
+        return False
+
+    def _verify_transfer(self, remote_name, nbytes, remote_size, hash_method, digest):
+        """
+        Check a finished transfer: the digest streamed alongside the data
+        against the server's hash when both exist, otherwise nbytes
+        against the remote size (asked for with SIZE unless given).
+        Returns False on a mismatch, True if it matched or there was
+        nothing to compare.
+        """
+        if not self.verify:
+            return True
+        if digest is not None:
+            remote = self._remote_hash(remote_name, hash_method, nbytes)
+            if remote is not None:
+                algorithm = hash_method[0]
+                local = digest.hexdigest()
+                if int(remote, 16) == int(local, 16):
+                    self.metrics.increment("verifications_total", method=algorithm, result="ok")
+                    self._log(f"{algorithm} of '{remote_name}' verified.")
+                    return True
+                self.metrics.increment("verifications_total", method=algorithm, result="mismatch")
+                self._log(f"{algorithm} mismatch for '{remote_name}': {local} here, {remote} on the server.")
+                return False
+
+        if remote_size is None:
+            remote_size = self.size(remote_name)
+        if remote_size is None:
+            return True
+        if remote_size == nbytes:
+            self.metrics.increment("verifications_total", method="size", result="ok")
+            return True
+        self.metrics.increment("verifications_total", method="size", result="mismatch")
+        self._log(f"Size mismatch for '{remote_name}': {nbytes} bytes here, {remote_size} on the server.")
+        return False
+
+    def _verify_local(self, remote_name, local_path, size):
+        """
+        Check a local copy that is already as long as the remote file,
+        hashing it from disk when the server can hash too.
+        """
+        hash_method = self._server_hash() if self.verify else None
+        digest = _hash_file(local_path, hash_method[0]) if hash_method else None
+        return self._verify_transfer(remote_name, size, size, hash_method, digest)
+
+    def _server_hash(self):
+        """
+        (algorithm, command) this server can hash files with, or None.
+        HASH is preferred over the X commands and earlier entries of
+        hash_algorithms over later ones; OPTS HASH switches the server
+        to the chosen algorithm. Worked out once per connection.
+        """
+        if self._hash_choice is not None:
+            return self._hash_choice or None
+
+        features = self.features()
+        choice = False
+        if "HASH" in features:
+            offered = [name.strip() for name in features["HASH"].split(";") if name.strip()]
+            current = next((name[:-1].upper() for name in offered if name.endswith("*")), None)
+            names = {name.rstrip("*").upper() for name in offered}
+            for algorithm in self.hash_algorithms:
+                if algorithm not in names or algorithm not in _HASH_ALGORITHMS:
+                    continue
+                if algorithm != current:
+                    self._send_command(f"OPTS HASH {algorithm}")
+                    if self._recv_reply().code != 200:
+                        continue
+                choice = (algorithm, "HASH")
+                break
+        if not choice:
+            for algorithm in self.hash_algorithms:
+                command = _HASH_ALGORITHMS.get(algorithm, (None,))[0]
+                if command in features:
+                    choice = (algorithm, command)
+                    break
+        self._hash_choice = choice
+        return choice or None
+
+    def _remote_hash(self, remote_name, hash_method, nbytes):
+        """The server's hex digest of remote_name, or None if it gave none."""
+        algorithm, command = hash_method
+        self._send_command(f"{command} {remote_name}")
+        reply = self._recv_reply(COMPLETION_TIMEOUT + nbytes / HASH_RATE)
+        self._log(reply.text or "No reply from server.")
+        if not 200 <= reply.code < 300 or not reply.lines:
+            return None
+        pattern = _HASH_REPLY_RE if command == "HASH" else _XHASH_REPLY_RE
+        match = pattern.match(reply.lines[-1])
+        return match.group(1) if match else None
+
+    # data path
+    def _recv_to_file(self, data_socket, f, offset, size=None, exact=False,
+                      on_checkpoint=None, progress=None, digest=None):
+        """
+        Receive the data connection into f starting at offset and return
+        the end position. Data is read with recv_into into one reusable
+        buffer, or, with use_mmap and a known size, straight into a
+        preallocated memory map of the file. With exact=True reading stops
+        at `size` (segmented downloads). on_checkpoint(pos) is called every
+        CHECKPOINT_INTERVAL bytes, progress(pos, size) after every chunk.
+        digest, a hashlib-style object, is updated with every chunk.
+        """
+        pos = offset
+        next_checkpoint = offset + CHECKPOINT_INTERVAL
+
+        if self.use_mmap and size is not None and size > offset:
+            if os.fstat(f.fileno()).st_size < size:
+                f.truncate(size)
+            try:
+                with mmap.mmap(f.fileno(), size) as mapped:
+                    view = memoryview(mapped)
+                    try:
+                        while pos < size:
+                            n = data_socket.recv_into(view[pos:size])
+                            if not n:
+                                break
+                            if digest:
+                                digest.update(view[pos:pos + n])
+                            pos += n
+                            if on_checkpoint and pos >= next_checkpoint:
+                                mapped.flush()
+                                on_checkpoint(pos)
+                                next_checkpoint = pos + CHECKPOINT_INTERVAL
+                            if progress:
+                                progress(pos, size)
+                    finally:
+                        view.release()
+            finally:
+                if not exact and pos < size:
+                    # the transfer broke off or the file shrank on the server:
+                    # drop the preallocated tail so the file holds only real data
+                    f.truncate(pos)
+            if exact or pos < size:
+                return pos
+
+        # reuse one buffer for every chunk; reads that keep filling it mean
+        # data is waiting in the socket, so fewer, larger reads will do
+        chunk = self._chunk_size()
+        if size is not None:
+            # no point allocating more than is left to come
+            chunk = max(MIN_CHUNK, min(chunk, size - pos))
+        buffer = bytearray(chunk)
+        view = memoryview(buffer)
+        full_reads = 0
+        f.seek(pos)
+        while not exact or pos < size:
+            limit = chunk if not exact else min(chunk, size - pos)
+            n = data_socket.recv_into(view[:limit])
+            if not n:
+                break
+            f.write(view[:n])
+            if digest:
+                digest.update(view[:n])
+            pos += n
+            full_reads = full_reads + 1 if n == chunk else 0
+            if full_reads == 4 and chunk < MAX_CHUNK and self.buffer_size is None:
+                chunk *= 2
+                buffer = bytearray(chunk)
+                view = memoryview(buffer)
+                full_reads = 0
+            if on_checkpoint and pos >= next_checkpoint:
+                f.flush()
+                on_checkpoint(pos)
+                next_checkpoint = pos + CHECKPOINT_INTERVAL
+            if progress:
+                progress(pos, size)
+        return pos
+
+    def _send_from_file(self, data_socket, f, offset, size, on_checkpoint=None, progress=None,
+                        digest=None):
+        """
+        Send f from offset to size and return the end position. Uses
+        socket.sendfile, which hands the copy to the kernel where the OS
+        supports it, in SENDFILE_SLICE pieces so checkpoints and progress
+        still fire; a digest is then fed from the file in a second pass.
+        Falls back to a reusable read buffer.
+        """
+        pos = offset
+        next_checkpoint = offset + CHECKPOINT_INTERVAL
+
+        if self.use_sendfile:
+            while pos < size:
+                sent = data_socket.sendfile(f, pos, min(SENDFILE_SLICE, size - pos))
+                if not sent:
+                    break
+                pos += sent
+                if on_checkpoint and next_checkpoint <= pos < size:
+                    on_checkpoint(pos)
+                    next_checkpoint = pos + CHECKPOINT_INTERVAL
+                if progress:
+                    progress(pos, size)
+            if digest:
+                # the data never passed through here; the page cache makes
+                # reading it back cheap next to sending it
+                _feed_digest(digest, f, offset, pos)
+            return pos
+
+        buffer = bytearray(max(MIN_CHUNK, min(self._chunk_size(), size - pos)))
+        view = memoryview(buffer)
+        f.seek(pos)
+        while pos < size:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            data_socket.sendall(view[:n])
+            if digest:
+                digest.update(view[:n])
+            pos += n
+            if on_checkpoint and pos >= next_checkpoint:
+                on_checkpoint(pos)
+                next_checkpoint = pos + CHECKPOINT_INTERVAL
+            if progress:
+                progress(pos, size)
+        return pos
+
+    def _recv_compressed(self, data_socket, f, offset, size=None, on_checkpoint=None, progress=None,
+                         digest=None):
+        """
+        MODE Z counterpart of _recv_to_file: inflate the data connection
+        chunk by chunk into f from offset. Returns (end position, bytes
+        received on the wire).
+        """
+        inflater = zlib.decompressobj()
+        buffer = bytearray(self._chunk_size())
+        view = memoryview(buffer)
+        pos = offset
+        wire = 0
+        next_checkpoint = offset + CHECKPOINT_INTERVAL
+        f.seek(pos)
+        while True:
+            n = data_socket.recv_into(buffer)
+            if not n:
+                break
+            wire += n
+            data = inflater.decompress(view[:n], INFLATE_LIMIT)
+            while data:
+                f.write(data)
+                if digest:
+                    digest.update(data)
+                pos += len(data)
+                tail = inflater.unconsumed_tail
+                data = inflater.decompress(tail, INFLATE_LIMIT) if tail else b""
+            if on_checkpoint and pos >= next_checkpoint:
+                f.flush()
+                on_checkpoint(pos)
+                next_checkpoint = pos + CHECKPOINT_INTERVAL
+            if progress:
+                progress(pos, size)
+
+        data = inflater.flush()
+        f.write(data)
+        if digest:
+            digest.update(data)
+        pos += len(data)
+        if not inflater.eof:
+            self._log("Compressed stream ended early.")
+        self.metrics.increment("compressed_wire_bytes_total", wire, direction="get")
+        return pos, wire
+
+    def _send_compressed(self, data_socket, f, offset, size, on_checkpoint=None, progress=None,
+                         digest=None):
+        """
+        MODE Z counterpart of _send_from_file: deflate f from offset to
+        size chunk by chunk at compression_level. Returns (end position,
+        bytes sent on the wire).
+        """
+        deflater = zlib.compressobj(self.compression_level)
+        pos = offset
+        wire = 0
+        next_checkpoint = offset + CHECKPOINT_INTERVAL
+        buffer = bytearray(max(MIN_CHUNK, min(self._chunk_size(), size - pos)))
+        view = memoryview(buffer)
+        f.seek(pos)
+        while pos < size:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            if digest:
+                digest.update(view[:n])
+            data = deflater.compress(view[:n])
+            if data:
+                data_socket.sendall(data)
+                wire += len(data)
+            pos += n
+            if on_checkpoint and pos >= next_checkpoint:
+                on_checkpoint(pos)
+                next_checkpoint = pos + CHECKPOINT_INTERVAL
+            if progress:
+                progress(pos, size)
+
+        data = deflater.flush()
+        data_socket.sendall(data)
+        wire += len(data)
+        self.metrics.increment("compressed_wire_bytes_total", wire, direction="put")
+        return pos, wire
+
+    def _chunk_size(self):
+        return self.buffer_size or self.tuner.chunk_size()
+
+    def _abandon_data(self, data_socket, nbytes):
+        """
+        Close a data connection part way and read the reply that ends the
+        transfer (426 or 226). Without one the control channel is a reply
+        behind, so the session is marked disconnected for the pool to drop.
+        """
+        data_socket.close()
+        reply = self._recv_reply(self._completion_timeout(nbytes))
+        self._log(reply.text or "No reply from server.")
+        if not reply.code:
+            self._log("No reply to the aborted transfer, closing the connection.")
+            self.connected = False
+            self.control_socket.close()
+        return reply
+
+    def _completion_timeout(self, nbytes):
+        """How long to wait for the reply that ends a transfer of nbytes."""
+        return COMPLETION_TIMEOUT + 4 * (self.rtt or 0.0) + nbytes / COMPLETION_FLUSH_RATE
+
+    @staticmethod
+    def _rate_summary(nbytes, started, wire=None):
+        """Format throughput and bytes per CPU second since `started`."""
+        wall = max(time.monotonic() - started[0], 1e-6)
+        cpu = max(time.thread_time() - started[1], 1e-6)
+        mib = nbytes / (1024 * 1024)
+        ratio = f", MODE Z {nbytes / wire:.1f}:1" if wire else ""
+        return f" ({nbytes} bytes, {mib / wall:.2f} MiB/s, {mib / cpu:.1f} MiB per CPU second{ratio})"
+
+    # delete / rename
+    def delete(self, filename):
+        """Delete a remote file. Returns True on success."""
+        if not self.connected:
+            self._log("Not connected.")
+            return False
+
+        self._send_command(f"DELE {filename}")
+        response = self._recv_response()
+        self._log(response.strip())
+        if self._parse_response_code(response) != 250:
+            return False
+        self._invalidate_parent(filename)
+        return True
+
+    def rename(self, old_name, new_name):
+        """Rename a remote file or directory. Returns True on success."""
+        if not self.connected:
+            self._log("Not connected.")
+            return False
+
+        self._send_command(f"RNFR {old_name}")
+        response = self._recv_response()
+        self._log(response.strip())
+        if self._parse_response_code(response) != 350:
+            return False
+
+        self._send_command(f"RNTO {new_name}")
+        response = self._recv_response()
+        self._log(response.strip())
+        if self._parse_response_code(response) != 250:
+            return False
+
+        self._invalidate_parent(old_name)
+        self._invalidate_parent(new_name)
+        # a renamed directory takes its cached listing's key with it
+        self.listing_cache.invalidate(self._remote_abspath(old_name))
+        return True
+
+    def current_dir(self):
+        """Absolute remote working directory, asking PWD only when unknown."""
+        return self._remote_abspath(".")
+
+    # listing cache upkeep
+    def _remote_abspath(self, path):
+        """Absolute form of a remote path, None if the cwd is unknown."""
+        if path.startswith("/"):
+            return posixpath.normpath(path)
+        if self.cwd is None:
+            self.cwd = self.pwd()
+            if self.cwd is None:
+                return None
+        return posixpath.normpath(posixpath.join(self.cwd, path))
+
+    def _invalidate_parent(self, remote_path):
+        abs_path = self._remote_abspath(remote_path)
+        if abs_path:
+            self.listing_cache.invalidate(posixpath.dirname(abs_path))
+
+    def _uploaded(self, remote_name, size):
+        abs_path = self._remote_abspath(remote_name)
+        if not abs_path:
+            return
+        parent = posixpath.dirname(abs_path)
+        if self.cache_patch_uploads:
+            entry = FTPEntry(posixpath.basename(abs_path), "file", size, time.time())
+            if self.listing_cache.patch(parent, entry):
+                return
+        self.listing_cache.invalidate(parent)
+
+    # resume support
+    def _restart_at(self, offset):
+        """Send TYPE I and REST, returns True if the server accepted the offset."""
+        self._send_command("TYPE I")
+        self._recv_response()
+        self._send_command(f"REST {offset}")
+        response = self._recv_response()
+        self._log(response.strip())
+        return self._parse_response_code(response) == 350
+
+    def _download_resume_offset(self, local_path, remote_size):
+        """Work out where an interrupted download can safely continue."""
+        if not os.path.isfile(local_path):
+            return 0
+
+        offset = os.path.getsize(local_path)
+        checkpoint = self._read_checkpoint(local_path)
+        if checkpoint and checkpoint.get("size") not in (None, remote_size):
+            self._log("Remote file changed since the last attempt, restarting.")
+            return 0
+        if checkpoint and checkpoint.get("offset") is not None:
+            # a preallocated (use_mmap) file can be full size with only the
+            # checkpointed part written, so the size is no guide
+            offset = min(offset, checkpoint["offset"])
+        if remote_size is not None and offset > remote_size:
+            return 0
+        return offset
+
+    def _upload_resume_offset(self, local_path, remote_name, local_size):
+        """Work out how much of an interrupted upload is already on the server."""
+        checkpoint = self._read_checkpoint(local_path)
+        if checkpoint and (
+            checkpoint.get("size") != local_size
+            or checkpoint.get("mtime") != os.path.getmtime(local_path)
+        ):
+            self._log("Local file changed since the last attempt, restarting.")
+            return 0
+
+        remote_size = self.size(remote_name)
+        if remote_size is None or remote_size > local_size:
+            return 0
+        return remote_size
+
+    @staticmethod
+    def _checkpoint_path(local_path):
+        return local_path + CHECKPOINT_SUFFIX
+
+    def _read_checkpoint(self, local_path):
+        try:
+            with open(self._checkpoint_path(local_path), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_checkpoint(self, local_path, checkpoint, offset):
+        # written to a temp file and renamed so a crash never leaves half a checkpoint
+        path = self._checkpoint_path(local_path)
+        data = dict(checkpoint, local=local_path, offset=offset, updated=time.time())
+        try:
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            self._log(f"Could not write checkpoint '{path}': {e}")
+
+    def _clear_checkpoint(self, local_path):
+        try:
+            os.remove(self._checkpoint_path(local_path))
+        except OSError:
+            pass
+
+    def resume_all(self, directory="."):
+        """
+        Resume every interrupted transfer recorded by a checkpoint file in
+        `directory` for the current host. Remote names are relative to the
+        current remote directory, as they were when the transfer started.
+        """
+        resumed = 0
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith(CHECKPOINT_SUFFIX):
+                continue
+            local_path = os.path.join(directory, name[:-len(CHECKPOINT_SUFFIX)])
+            checkpoint = self._read_checkpoint(local_path)
+            if not checkpoint or checkpoint.get("host") != self.host:
+                continue
+
+            resumed += 1
+            if checkpoint.get("direction") == "put":
+                self.put(local_path, checkpoint["remote"], resume=True)
+            else:
+                self.get(checkpoint["remote"], local_path, resume=True)
+
+        if not resumed:
+            self._log("No interrupted transfers to resume.")
+        return resumed
+
+    # session pool
+    def get_pool(self, size=4):
+        """
+        Return the pool of extra logged-in sessions used for parallel
+        transfers, creating it on first use and growing it to `size`.
+        """
+        if self.pool is None:
+            self.pool = FTPSessionPool(self._quiet_clone, max_size=size)
+        elif self.pool.max_size < size:
+            self.pool.max_size = size
+        return self.pool
+
+    def _quiet_clone(self):
+        session = self.clone()
+        if session is not None:
+            session.set_output_callback(lambda message: None)
+        return session
+
+    def _close_pool(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+
+    def noop(self):
+        """Send NOOP, returns True if the server answered normally."""
+        if not self.connected:
+            return False
+        self._send_command("NOOP")
+        return self._parse_response_code(self._recv_response()) == 200
 
     # close connection
     def close(self):
+        self._close_pool()
         if self.connected:
             try:
                 self._send_command("QUIT")
@@ -287,54 +1776,318 @@ class FTPClient:
         else:
             self._log("No active connection.")
 
+    # server features
+    def features(self):
+        """
+        Return the FEAT reply as a dict of feature name -> parameters,
+        fetched once per connection.
+        """
+        if self._features is None:
+            if not self.connected:
+                return {}
+            self._send_command("FEAT")
+            reply = self._recv_reply()
+            features = {}
+            if reply.code == 211:
+                for line in reply.lines[1:-1]:
+                    name, _, params = line.strip().partition(" ")
+                    if name:
+                        features[name.upper()] = params
+            self._features = features
+        return self._features
+
+    def supports(self, feature):
+        return feature.upper() in self.features()
+
+    # transfer mode
+    def _want_mode_z(self):
+        """True if compression is enabled and FEAT lists MODE Z."""
+        return self.use_compression and "Z" in self.features().get("MODE", "").upper().split()
+
+    def _set_mode(self, mode):
+        """
+        Switch the transfer mode (S or Z), only talking to the server when
+        it changes. Returns True if the mode is now in effect.
+        """
+        if self._mode == mode:
+            return True
+        self._send_command(f"MODE {mode}")
+        reply = self._recv_reply()
+        if reply.code != 200:
+            self._log(f"MODE {mode} refused: {reply.text}")
+            return False
+        if mode == "Z":
+            # lets the server compress at the level we would use ourselves
+            self._send_command(f"OPTS MODE Z LEVEL {self.compression_level}")
+            self._recv_reply()
+        self._mode = mode
+        return True
+
+    # raw command
+    def quote(self, command):
+        """Send a raw command (HELP, FEAT, STAT...) and return its FTPReply."""
+        if not self.connected:
+            self._log("Not connected.")
+            return FTPReply(0, [])
+
+        self._send_command(command)
+        reply = self._recv_reply()
+        self._log(reply.text)
+        return reply
+
+    # current remote directory
+    def pwd(self):
+        if not self.connected:
+            return None
+
+        self._send_command("PWD")
+        response = self._recv_response()
+        if self._parse_response_code(response) != 257:
+            return None
+        match = _PWD_RE.search(response)
+        return match.group(1).replace('""', '"') if match else None
+
+    def size(self, filename):
+        """Return the remote file size in bytes, or None if unknown."""
+        if not self.connected:
+            return None
+
+        # SIZE is only reliable in binary mode
+        self._send_command("TYPE I")
+        self._recv_response()
+        self._send_command(f"SIZE {filename}")
+        response = self._recv_response()
+        if self._parse_response_code(response) != 213:
+            return None
+        try:
+            return int(response[4:].strip())
+        except ValueError:
+            return None
+
+    def mdtm(self, filename):
+        """Return the remote modification time as a timestamp, or None."""
+        if not self.connected:
+            return None
+
+        self._send_command(f"MDTM {filename}")
+        response = self._recv_response()
+        if self._parse_response_code(response) != 213:
+            return None
+        return parse_ftp_time(response[4:].strip())
+
+    def set_mtime(self, filename, timestamp):
+        """Set the remote modification time with MFMT where supported."""
+        if not self.connected or not self.supports("MFMT"):
+            return False
+
+        stamp = time.strftime("%Y%m%d%H%M%S", time.gmtime(timestamp))
+        self._send_command(f"MFMT {stamp} {filename}")
+        return self._parse_response_code(self._recv_response()) == 213
+
+    # pipelined commands
+    def pipeline(self, commands, window=PIPELINE_WINDOW, timeout=10.0):
+        """
+        Send independent commands back to back, with up to `window` of
+        them unanswered at a time, and return one FTPReply per command in
+        order. Items succeed or fail on their own, so check each code.
+
+        A reply slower than `timeout` is given the completion timeout
+        more before it counts as missing. A code of 0 means no reply
+        came; the connection is then closed (self.connected is False),
+        since any late replies would be matched to the wrong commands.
+        """
+        commands = list(commands)
+        if not self.connected or not self.control_socket:
+            self._log("Not connected.")
+            return [FTPReply(0, []) for _ in commands]
+
+        window = max(1, window)
+        replies = []
+        sent = 0
+        started = time.perf_counter()
+        # per-command round trips mean nothing once commands overlap
+        self._command_started = None
+        try:
+            while len(replies) < len(commands):
+                if sent < len(commands) and sent - len(replies) < window:
+                    batch = commands[sent:len(replies) + window]
+                    self.control_socket.sendall("".join(c + "\r\n" for c in batch).encode('utf-8'))
+                    sent += len(batch)
+                reply = self._recv_reply(timeout)
+                if not reply.code and not reply.lines:
+                    # slow rather than lost, as long as it turns up in time
+                    self._log(f"No reply to '{commands[len(replies)]}' yet, still waiting.")
+                    reply = self._recv_reply(self._completion_timeout(0))
+                if not reply.code:
+                    break
+                if reply.code >= 200:
+                    replies.append(reply)
+        except Exception as e:
+            self._log(f"Error sending pipelined commands: {e}")
+
+        self.metrics.observe("pipeline_seconds", time.perf_counter() - started)
+        self.metrics.increment("pipelined_commands_total", len(replies))
+
+        missing = len(commands) - len(replies)
+        if missing:
+            self._log(f"{missing} of {len(commands)} pipelined commands got no reply, closing the connection.")
+            self.connected = False
+            self.control_socket.close()
+            replies.extend(FTPReply(0, []) for _ in range(missing))
+        return replies
+
+    def sizes(self, filenames, window=PIPELINE_WINDOW):
+        """SIZE for many files in one pipeline: {name: bytes or None}."""
+        filenames = list(filenames)
+        if not filenames or not self.connected:
+            return dict.fromkeys(filenames)
+
+        self._send_command("TYPE I")
+        self._recv_response()
+        result = {}
+        for name, reply in zip(filenames, self.pipeline([f"SIZE {n}" for n in filenames], window)):
+            text = reply.lines[-1][4:].strip() if reply.code == 213 else ""
+            result[name] = int(text) if text.isdigit() else None
+        return result
+
+    def mdtms(self, filenames, window=PIPELINE_WINDOW):
+        """MDTM for many files in one pipeline: {name: timestamp or None}."""
+        filenames = list(filenames)
+        if not filenames or not self.connected:
+            return dict.fromkeys(filenames)
+
+        result = {}
+        for name, reply in zip(filenames, self.pipeline([f"MDTM {n}" for n in filenames], window)):
+            result[name] = parse_ftp_time(reply.lines[-1][4:].strip()) if reply.code == 213 else None
+        return result
+
+    def delete_many(self, filenames, window=PIPELINE_WINDOW):
+        """
+        Delete many remote files in one pipeline. Failures are logged one
+        by one; returns the names that could not be deleted.
+        """
+        filenames = list(filenames)
+        if not filenames:
+            return []
+        if not self.connected:
+            self._log("Not connected.")
+            return filenames
+
+        failed = []
+        for name, reply in zip(filenames, self.pipeline([f"DELE {n}" for n in filenames], window)):
+            if reply.code == 250:
+                self._invalidate_parent(name)
+            else:
+                failed.append(name)
+                self._log(f"Could not delete '{name}': {reply.text or 'no reply'}")
+        self._log(f"Deleted {len(filenames) - len(failed)} of {len(filenames)} files.")
+        return failed
+
+    def mkdir(self, path):
+        """Create a remote directory. Returns True on success."""
+        if not self.connected:
+            self._log("Not connected.")
+            return False
+
+        self._send_command(f"MKD {path}")
+        response = self._recv_response()
+        self._log(response.strip())
+        if self._parse_response_code(response) != 257:
+            return False
+        self._invalidate_parent(path)
+        return True
+
+    def rmdir(self, path):
+        """Remove an empty remote directory. Returns True on success."""
+        if not self.connected:
+            self._log("Not connected.")
+            return False
+
+        self._send_command(f"RMD {path}")
+        response = self._recv_response()
+        self._log(response.strip())
+        if self._parse_response_code(response) != 250:
+            return False
+        self._invalidate_parent(path)
+        self.listing_cache.invalidate(self._remote_abspath(path))
+        return True
+
+    def clone(self, remote_dir=None):
+        """
+        Open another logged-in session to the same server with the same
+        credentials, optionally changing into remote_dir. Returns None if
+        the new session could not be established.
+        """
+        if not self.host or self.username is None:
+            return None
+
+        session = FTPClient(is_gui=True)
+        session.buffer_size = self.buffer_size
+        session.socket_buffer = self.socket_buffer
+        session.tuner = self.tuner
+        session.use_sendfile = self.use_sendfile
+        session.use_mmap = self.use_mmap
+        session.shaper = self.shaper
+        session.use_compression = self.use_compression
+        session.compression_level = self.compression_level
+        session.verify = self.verify
+        session.hash_algorithms = self.hash_algorithms
+        session.cache_patch_uploads = self.cache_patch_uploads
+        session.metrics = self.metrics
+        session.set_output_callback(lambda message: None)
+        session.open(self.host, self.port)
+        if not session.connected or not session.login(self.username, self.password):
+            return None
+        # shared, so uploads on this session invalidate our listings too
+        session.listing_cache = self.listing_cache
+        if remote_dir:
+            session.cd(remote_dir)
+        session.set_output_callback(self.output_callback)
+        return session
+
     # send command
     def _send_command(self, command):
         if self.connected and self.control_socket:
             try:
                 self.control_socket.sendall((command + "\r\n").encode('utf-8'))
+                # only the verb, arguments would leak paths and passwords
+                verb = command.split(" ", 1)[0]
+                verb = verb.upper() if _VERB_RE.match(verb) else "OTHER"
+                self._command_started = (verb, time.perf_counter())
             except Exception as e:
                 self._log(f"Error sending command '{command}': {e}")
 
     def _recv_response(self, timeout=5.0):
-        # handle multi-line response
-        if not self.control_socket:
-            return ""
-        data = b""
-        self.control_socket.settimeout(timeout)
-        expected_code = None
-
-        while True:
-            try:
-                chunk = self.control_socket.recv(4096)
-                if not chunk:
-                    break
-                data += chunk
-                text = data.decode('utf-8', errors='ignore')
-                lines = text.splitlines()
-
-                if not lines:
-                    continue
-
-                # detect multi-line code
-                if expected_code is None and re.match(r'^(\d{3})-', lines[0]):
-                    expected_code = lines[0][:3]
-
-                pattern = rf'^{expected_code} ' if expected_code else r'^\d{3} '
-                if re.search(pattern, lines[-1]):
-                    break
-
-            except socket.timeout:
-                break
-
-        return data.decode('utf-8', errors='ignore')
+        """Read one reply and return its text, "" if nothing arrived."""
+        reply = self._recv_reply(timeout)
+        return reply.text + "\n" if reply.lines else ""
+
+    def _recv_reply(self, timeout=5.0):
+        """Read one complete reply as an FTPReply."""
+        if not self.control_socket or self._reader is None:
+            return FTPReply(0, [])
+        reply = self._reader.read_reply(timeout)
+
+        if self._command_started:
+            verb, sent_at = self._command_started
+            self._command_started = None
+            if reply.code:
+                sample = time.perf_counter() - sent_at
+                self.metrics.observe("command_seconds", sample, command=verb)
+                if verb in _RTT_COMMANDS and not 100 <= reply.code < 200:
+                    self.rtt = sample if self.rtt is None else 0.875 * self.rtt + 0.125 * sample
+            else:
+                self.metrics.increment("command_timeouts_total", command=verb)
+        return reply
 
     # enter passive mode
     def _enter_passive_mode(self):
+        self._pasv_started = time.perf_counter()
         self._send_command("PASV")
         response = self._recv_response()
         self._log(response.strip())
 
-        match = re.search(r"\((\d+),(\d+),(\d+),(\d+),(\d+),(\d+)\)", response)
+        match = _PASV_RE.search(response)
         if not match:
             self._log("Could not parse PASV response.")
             return None, None
@@ -343,6 +2096,28 @@ class FTPClient:
         port = int(match.group(5)) * 256 + int(match.group(6))
         return control_ip, port
 
+    def _connect_data(self, ip, port, timeout=None, direction="recv"):
+        """
+        Open the data connection announced by the last PASV reply, with
+        buffers sized for the direction data will flow in. Under a shaper
+        the socket comes back wrapped so every byte pays its tokens.
+        """
+        data_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            self.tuner.configure(data_socket, self.rtt, direction, self.socket_buffer)
+            if timeout is not None:
+                data_socket.settimeout(timeout)
+            data_socket.connect((ip, port))
+        except Exception:
+            data_socket.close()
+            raise
+        if self._pasv_started is not None:
+            self.metrics.observe("pasv_setup_seconds", time.perf_counter() - self._pasv_started)
+            self._pasv_started = None
+        if self.shaper is not None:
+            return self.shaper.wrap(data_socket, self.host, self.priority, self.metrics, direction)
+        return data_socket
+
     def _parse_response_code(self, response):
         try:
             return int(response[:3])
@@ -350,15 +2125,82 @@ class FTPClient:
             return 0
 
 
+def netrc_credentials(host):
+    """(login, password) for host from ~/.netrc (or $NETRC), or None."""
+    try:
+        entry = netrc.netrc(os.environ.get("NETRC")).authenticators(host)
+    except (OSError, netrc.NetrcParseError):
+        return None
+    if not entry:
+        return None
+    login, _, password = entry
+    return login, password
+
+
+def _source_chunks(source, chunk_size):
+    """
+    Bytes-like chunks from a binary file object (read with readinto into
+    one reused buffer where possible) or from an iterable of chunks.
+    """
+    if hasattr(source, "readinto"):
+        buffer = bytearray(chunk_size)
+        view = memoryview(buffer)
+        while True:
+            n = source.readinto(buffer)
+            if not n:
+                return
+            yield view[:n]
+    elif hasattr(source, "read"):
+        while True:
+            data = source.read(chunk_size)
+            if not data:
+                return
+            if isinstance(data, str):
+                raise TypeError("store_stream needs binary data, got text")
+            yield data
+    else:
+        for data in source:
+            if isinstance(data, str):
+                raise TypeError("store_stream needs binary data, got text")
+            yield data
+
+
+def _hash_file(path, algorithm):
+    """A digest object for algorithm, fed the whole of the file at path."""
+    digest = _HASH_ALGORITHMS[algorithm][1]()
+    with open(path, "rb") as f:
+        _feed_digest(digest, f, 0, None)
+    return digest
+
+
+def _feed_digest(digest, f, start, end):
+    """Update digest with f's bytes from start to end (None: to the end of the file)."""
+    f.seek(start)
+    while end is None or start < end:
+        chunk = f.read(MAX_CHUNK if end is None else min(MAX_CHUNK, end - start))
+        if not chunk:
+            break
+        digest.update(chunk)
+        start += len(chunk)
+
+
 # main loop 
 def main():
     client = FTPClient(is_gui=False)  
+    # transfer journal, opened on first use or when it holds work to resume
+    journal = TransferJournal(journal_path()) if os.path.exists(journal_path()) else None
+    runner = None
+    runner_thread = None
+    index = None  # remote tree index for crawl/find, opened on first use
 
     while True:
         try:
             command = input("ftp> ").strip()
         except (EOFError, KeyboardInterrupt):
             print()
+            if runner is not None:
+                runner.stop()
+                runner_thread.join()
             client.close()
             print("Goodbye!")
             break
@@ -370,6 +2212,11 @@ def main():
             parts = command.split()
             if len(parts) >= 2:
                 client.open(parts[1])
+                unfinished = journal.unfinished(client) if journal and client.username else []
+                if unfinished and (runner_thread is None or not runner_thread.is_alive()):
+                    print(f"Resuming {len(unfinished)} queued transfer(s) in the background.")
+                    runner = JournalRunner(client, journal)
+                    runner_thread = runner.start()
             else:
                 print("Usage: open <hostname>")
 
@@ -390,6 +2237,79 @@ def main():
             else:
                 print("Usage: get <filename>")
 
+        elif command.startswith("cat"):
+            parts = command.split(maxsplit=1)
+            if len(parts) == 2:
+                stream = client.retrieve_stream(parts[1])
+                if stream is not None:
+                    with stream:
+                        sys.stdout.flush()
+                        for chunk in stream.chunks():
+                            sys.stdout.buffer.write(chunk)
+                        sys.stdout.buffer.flush()
+            else:
+                print("Usage: cat <filename>")
+
+        elif command.startswith("mget") or command.startswith("mput"):
+            parts = command.split()
+            workers = DEFAULT_WORKERS
+            if len(parts) >= 3 and parts[1] == "-j" and parts[2].isdigit():
+                workers = int(parts[2])
+                parts = parts[:1] + parts[3:]
+            if len(parts) >= 2:
+                # recorded in the journal, so what this run does not finish
+                # is picked up the next time the server is opened
+                if journal is None and client.username:
+                    journal = TransferJournal(journal_path())
+                if parts[0] == "mget":
+                    mget(client, parts[1:], workers, journal=journal)
+                else:
+                    mput(client, parts[1:], workers, journal=journal)
+            else:
+                print(f"Usage: {parts[0]} [-j workers] <pattern> [pattern...]")
+
+        elif command.startswith("mirror"):
+            parts = command.split()[1:]
+            options = {"upload": False, "dry_run": False, "delete": False, "workers": DEFAULT_WORKERS}
+            paths = []
+            while parts:
+                part = parts.pop(0)
+                if part in ("-R", "--upload"):
+                    options["upload"] = True
+                elif part in ("-n", "--dry-run"):
+                    options["dry_run"] = True
+                elif part == "--delete":
+                    options["delete"] = True
+                elif part == "-j" and parts and parts[0].isdigit():
+                    options["workers"] = int(parts.pop(0))
+                else:
+                    paths.append(part)
+            if len(paths) == 2:
+                mirror(client, paths[0], paths[1], **options)
+            else:
+                print("Usage: mirror [-R] [-n] [--delete] [-j workers] <remote_dir> <local_dir>")
+
+        elif command.startswith("reget") or command.startswith("reput"):
+            parts = command.split(maxsplit=1)
+            if len(parts) == 2:
+                if parts[0] == "reget":
+                    client.get(parts[1], resume=True)
+                else:
+                    client.put(parts[1], resume=True)
+            else:
+                print(f"Usage: {parts[0]} <filename>")
+
+        elif command == "resume":
+            client.resume_all()
+
+        elif command.startswith("pget"):
+            parts = command.split()
+            if len(parts) in (2, 3) and (len(parts) == 2 or parts[2].isdigit()):
+                segments = int(parts[2]) if len(parts) == 3 else 4
+                client.get_segmented(parts[1], segments)
+            else:
+                print("Usage: pget <filename> [segments]")
+
         elif command.startswith("put"):
             parts = command.split(maxsplit=1)
             if len(parts) == 2:
@@ -397,16 +2317,228 @@ def main():
             else:
                 print("Usage: put <filename>")
 
+        elif command.startswith("delete"):
+            parts = command.split(maxsplit=1)
+            if len(parts) == 2:
+                client.delete(parts[1])
+            else:
+                print("Usage: delete <filename>")
+
+        elif command.startswith("rename"):
+            parts = command.split()
+            if len(parts) == 3:
+                client.rename(parts[1], parts[2])
+            else:
+                print("Usage: rename <from> <to>")
+
+        elif command.startswith("quote"):
+            parts = command.split(maxsplit=1)
+            if len(parts) == 2:
+                client.quote(parts[1])
+            else:
+                print("Usage: quote <command>")
+
+        elif command.startswith("stats"):
+            parts = command.split()
+            if len(parts) == 1:
+                for line in client.metrics.summary():
+                    print(line)
+            elif parts[1] == "reset" and len(parts) == 2:
+                client.metrics.reset()
+                print("Statistics cleared.")
+            elif parts[1] in ("json", "prom") and len(parts) <= 3:
+                text = client.metrics.to_json() if parts[1] == "json" else client.metrics.to_prometheus()
+                if len(parts) == 3:
+                    with open(parts[2], "w") as f:
+                        f.write(text)
+                    print(f"Statistics written to '{parts[2]}'.")
+                else:
+                    print(text)
+            else:
+                print("Usage: stats [json|prom [file]|reset]")
+
+        elif command.startswith("tune"):
+            parts = command.split()
+            if len(parts) == 1:
+                print(client.tuner.describe(client.rtt))
+            elif len(parts) == 3 and parts[1] in ("buffer", "chunk") and (parts[2].isdigit() or parts[2] == "auto"):
+                value = None if parts[2] == "auto" else int(parts[2])
+                if parts[1] == "buffer":
+                    client.socket_buffer = value
+                else:
+                    client.buffer_size = value or None
+                print(client.tuner.describe(client.rtt))
+            else:
+                print("Usage: tune [buffer <bytes>|auto] [chunk <bytes>|auto]")
+
+        elif command.startswith("verify"):
+            parts = command.split()
+            if len(parts) == 2 and parts[1] in ("on", "off"):
+                client.verify = parts[1] == "on"
+            elif len(parts) != 1:
+                print("Usage: verify [on|off]")
+                continue
+            method = client._server_hash() if client.verify and client.connected else None
+            print(f"Verification {'on' if client.verify else 'off'}"
+                  + (f", using {method[0]} via {method[1]}." if method else "."))
+
+        elif command.startswith("compress"):
+            parts = command.split()
+            if len(parts) == 2 and parts[1] in ("on", "off"):
+                client.use_compression = parts[1] == "on"
+            elif len(parts) == 2 and parts[1].isdigit() and int(parts[1]) <= 9:
+                client.use_compression = True
+                client.compression_level = int(parts[1])
+            elif len(parts) != 1:
+                print("Usage: compress [on|off|<level 0-9>]")
+                continue
+            state = f"on, level {client.compression_level}" if client.use_compression else "off"
+            offered = "Z" in client.features().get("MODE", "").upper().split()
+            print(f"MODE Z compression {state}, server {'offers' if offered else 'does not offer'} it.")
+
+        elif command.startswith("limit"):
+            parts = command.split(None, 2)
+            if client.shaper is None:
+                client.shaper = Shaper()
+            shaper = client.shaper
+            try:
+                if len(parts) == 2:
+                    shaper.set_rate(parse_rate(parts[1]))
+                elif len(parts) == 3 and parts[1] == "host":
+                    if not client.host:
+                        print("Not connected.")
+                        continue
+                    shaper.set_host_rate(client.host, parse_rate(parts[2]))
+                elif len(parts) == 3 and parts[1] == "transfer":
+                    shaper.transfer_rate = parse_rate(parts[2])
+                elif len(parts) == 3 and parts[1] == "schedule":
+                    shaper.set_schedule(None if parts[2] == "off" else RateSchedule.parse(parts[2]))
+                elif len(parts) != 1:
+                    raise ValueError("Usage: limit [<rate>|off] [host <rate>] [transfer <rate>] "
+                                     "[schedule <days hh:mm-hh:mm rate>[, ...]|off]")
+            except ValueError as e:
+                print(e)
+                continue
+            for line in shaper.describe():
+                print(line)
+
         elif command == "close":
             client.close()
 
+        elif command.startswith("queue"):
+            parts = command.split()
+            priority = 0
+            if len(parts) >= 4 and parts[1] in ("get", "put", "mget", "mput") and parts[2] == "-p":
+                if not parts[3].lstrip("-").isdigit():
+                    print("The priority must be a whole number.")
+                    continue
+                priority = int(parts[3])
+                parts = parts[:2] + parts[4:]
+            if len(parts) > 1 and not client.username:
+                print("Not connected.")
+                continue
+            if journal is None:
+                journal = TransferJournal(journal_path())
+            running = runner_thread is not None and runner_thread.is_alive()
+
+            if len(parts) in (3, 4) and parts[1] in ("get", "put"):
+                source, target = parts[2], parts[3] if len(parts) == 4 else os.path.basename(parts[2])
+                if parts[1] == "get":
+                    _, queued = journal.add(client, "get", source, target, priority=priority)
+                else:
+                    _, queued = journal.add(client, "put", target, source, priority=priority)
+                if not queued:
+                    print("Already queued, or done and unchanged since.")
+                else:
+                    print("Queued; 'queue run' starts it." if not running else "Queued.")
+            elif len(parts) >= 3 and parts[1] in ("mget", "mput"):
+                queued, skipped = enqueue(journal, client, parts[1][1:], parts[2:], priority=priority)
+                print(f"Queued {queued} file(s)" + (f", {skipped} already queued or unchanged." if skipped else "."))
+            elif len(parts) in (2, 4) and parts[1] == "run" and (len(parts) == 2 or parts[2] == "-j" and parts[3].isdigit()):
+                if running:
+                    print("The queue is already running.")
+                else:
+                    runner = JournalRunner(client, journal, int(parts[3]) if len(parts) == 4 else DEFAULT_WORKERS)
+                    runner_thread = runner.start()
+            elif parts[1:] == ["stop"]:
+                if running:
+                    runner.stop()
+                    runner_thread.join()
+            elif parts[1:] == ["retry"]:
+                print(f"{journal.retry(client)} failed transfer(s) queued again.")
+            elif len(parts) in (2, 3) and parts[1] == "clear" and (len(parts) == 2 or parts[2] in ("done", "failed", "all")):
+                which = parts[2] if len(parts) == 3 else "done"
+                states = ("done", "failed", "pending") if which == "all" else (which,)
+                if running and which == "all":
+                    print("Stop the queue first.")
+                    continue
+                print(f"Removed {journal.clear(states, client)} transfer(s).")
+            elif len(parts) == 1:
+                counts = journal.counts(client if client.username else None)
+                print(", ".join(f"{counts.get(state, 0)} {state}" for state in ("pending", "active", "done", "failed"))
+                      + (" (running)" if running else "") + ".")
+                now = time.time()
+                for entry in journal.entries(client if client.username else None, ("active", "pending", "failed")):
+                    wait = f", next try in {entry.next_attempt - now:.0f}s" if entry.next_attempt > now else ""
+                    error = f", {entry.error}" if entry.error else ""
+                    print(f"  {entry.id:5} {entry.state:8} {entry.direction} {entry.remote} "
+                          f"({entry.offset}/{entry.size if entry.size is not None else '?'} bytes, "
+                          f"{entry.attempts} attempt(s){wait}{error})")
+            else:
+                print("Usage: queue [get|put|mget|mput [-p priority] ...] [run [-j workers]] [stop] [retry] "
+                      "[clear [done|failed|all]]")
+
+        elif command.startswith("crawl"):
+            parts = command.split()[1:]
+            options = {"workers": DEFAULT_WORKERS, "max_depth": None, "full": False}
+            paths = []
+            while parts:
+                part = parts.pop(0)
+                if part == "--full":
+                    options["full"] = True
+                elif part in ("-j", "-d") and parts and parts[0].isdigit():
+                    options["workers" if part == "-j" else "max_depth"] = int(parts.pop(0))
+                else:
+                    paths.append(part)
+            if len(paths) > 1:
+                print("Usage: crawl [-j workers] [-d depth] [--full] [remote_dir]")
+            elif not client.username:
+                print("Not connected.")
+            else:
+                if index is None:
+                    index = RemoteIndex(os.environ.get("FTP_INDEX", DEFAULT_INDEX))
+                stats = crawl(client, index, paths[0] if paths else None, **options)
+                if stats is not None:
+                    files, dirs, total = index.stats(client)
+                    print(f"Index for {client.host}: {files} files, {dirs} directories, {total} bytes.")
+
+        elif command.startswith("find"):
+            parts = command.split(maxsplit=1)
+            if len(parts) != 2:
+                print("Usage: find <name prefix or glob, or /path prefix or glob>")
+            elif not client.host:
+                print("Not connected.")
+            else:
+                if index is None:
+                    index = RemoteIndex(os.environ.get("FTP_INDEX", DEFAULT_INDEX))
+                started = time.perf_counter()
+                found = index.search(client, parts[1])
+                for entry in found:
+                    suffix = "/" if entry.is_dir else f"  {entry.size if entry.size is not None else '?'}"
+                    print(f"{entry.path}{suffix}")
+                print(f"{len(found)} match(es) in {(time.perf_counter() - started) * 1000:.1f} ms"
+                      + (", try 'crawl' first." if not found and not index.stats(client)[1] else "."))
+
         elif command == "quit":
+            if runner is not None:
+                runner.stop()
+                runner_thread.join()
             client.close()
             print("Goodbye!")
             break
 
         else:
-            print("Unknown command. Try: open, dir, cd, get, put, close, quit")
+            print("Unknown command. Try: open, dir, cd, get, cat, reget, pget, mget, put, reput, mput, mirror, resume, delete, rename, quote, stats, tune, compress, verify, limit, queue, crawl, find, close, quit")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,265 @@
+import os
+import posixpath
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from ftp_pool import PoolTimeout
+
+# where the CLI keeps its index unless FTP_INDEX says otherwise
+DEFAULT_INDEX = os.path.join(os.path.expanduser("~"), ".ftp_index.sqlite3")
+
+# search results returned unless asked for more
+SEARCH_LIMIT = 1000
+
+# upper bound for a prefix range; sorts after any character in a path
+_RANGE_END = "\U0010ffff"
+
+# the literal part of a glob pattern, up to the first wildcard
+_GLOB_PREFIX_RE = re.compile(r"[^*?\[]*")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    host TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    parent TEXT NOT NULL,
+    name TEXT NOT NULL,
+    type TEXT NOT NULL,
+    size INTEGER,
+    modify REAL,
+    listed_modify REAL,
+    crawled REAL NOT NULL,
+    PRIMARY KEY (host, port, path)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_name ON entries (host, port, name);
+CREATE INDEX IF NOT EXISTS entries_parent ON entries (host, port, parent);
+"""
+
+
+class IndexEntry:
+    """One indexed remote path."""
+
+    __slots__ = ("path", "type", "size", "modify")
+
+    def __init__(self, path, type, size=None, modify=None):
+        self.path = path
+        self.type = type
+        self.size = size
+        self.modify = modify
+
+    @property
+    def is_dir(self):
+        return self.type == "dir"
+
+    def __repr__(self):
+        return f"<IndexEntry {self.type} {self.path!r} size={self.size}>"
+
+
+class CrawlStats:
+    """What one crawl did."""
+
+    def __init__(self):
+        self.listed = 0  # directories listed
+        self.skipped = 0  # directories whose unchanged mtime spared a listing
+        self.failed = 0  # directories that could not be listed
+        self.entries = 0  # entries seen in the listed directories
+        self.elapsed = 0.0
+
+    def __str__(self):
+        return (f"{self.listed} directories listed, {self.skipped} unchanged, {self.failed} failed, "
+                f"{self.entries} entries in {self.elapsed:.2f}s")
+
+
+class RemoteIndex:
+    """
+    On-disk index of remote trees (path, type, size, mtime) per server,
+    in SQLite. Paths are kept in a primary key so a prefix search is a
+    range scan; names have their own index for searches by file name.
+    """
+
+    def __init__(self, path=DEFAULT_INDEX):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30.0, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def search(self, client, pattern, limit=SEARCH_LIMIT):
+        """
+        Indexed entries of the client's server matching pattern. A pattern
+        starting with "/" is matched against whole paths, anything else
+        against names. Without wildcards it is a prefix ("/pub/linux",
+        "report"); with them a case-sensitive glob in which "*" also
+        crosses "/" ("/pub/*.iso", "*.csv"). Only the part after the
+        literal prefix is scanned.
+        """
+        column = "path" if pattern.startswith("/") else "name"
+        prefix = _GLOB_PREFIX_RE.match(pattern).group(0)
+        sql = (f"SELECT path, type, size, modify FROM entries WHERE host=? AND port=?"
+               f" AND {column} >= ? AND {column} < ?")
+        args = [client.host, client.port, prefix, prefix + _RANGE_END]
+        if prefix != pattern:
+            sql += f" AND {column} GLOB ?"
+            args.append(pattern)
+        sql += " ORDER BY path LIMIT ?"
+        args.append(limit)
+        with self._lock:
+            rows = self._db.execute(sql, args).fetchall()
+        return [IndexEntry(*row) for row in rows]
+
+    def children(self, client, path):
+        """Indexed entries directly inside path."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT path, type, size, modify FROM entries WHERE host=? AND port=? AND parent=?"
+                " ORDER BY name", (client.host, client.port, posixpath.normpath(path)),
+            ).fetchall()
+        return [IndexEntry(*row) for row in rows]
+
+    def stats(self, client):
+        """(files, directories, total file bytes) indexed for the client's server."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT SUM(type != 'dir'), SUM(type = 'dir'), SUM(CASE WHEN type != 'dir' THEN size END)"
+                " FROM entries WHERE host=? AND port=?", (client.host, client.port),
+            ).fetchone()
+        return row[0] or 0, row[1] or 0, row[2] or 0
+
+    def forget(self, client, root="/"):
+        """Drop root and everything under it from the index."""
+        with self._lock, self._db:
+            self._delete_tree(client.host, client.port, posixpath.normpath(root))
+
+    def listed_modify(self, host, port, path):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT listed_modify FROM entries WHERE host=? AND port=? AND path=?", (host, port, path)
+            ).fetchone()
+        return row[0] if row else None
+
+    def store_listing(self, host, port, path, entries, modify=None):
+        """
+        Replace the children of path with a fresh listing. Entries that
+        are gone take their subtrees with them; directories that stay
+        keep what is known below them. modify is the directory's own
+        mtime, remembered so the next crawl can tell it is unchanged.
+        """
+        now = time.time()
+        by_name = {entry.name: entry for entry in entries}
+        with self._lock, self._db:
+            old = self._db.execute(
+                "SELECT name, type FROM entries WHERE host=? AND port=? AND parent=?", (host, port, path)
+            ).fetchall()
+            for name, kind in old:
+                child = posixpath.join(path, name)
+                if name not in by_name:
+                    self._delete_tree(host, port, child)
+                elif kind == "dir" and not by_name[name].is_dir:
+                    # a name that stopped being a directory loses its subtree
+                    self._delete_tree(host, port, child, keep_root=True)
+            self._db.executemany(
+                "INSERT INTO entries (host, port, path, parent, name, type, size, modify, crawled)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (host, port, path) DO UPDATE SET type=excluded.type, size=excluded.size,"
+                " modify=excluded.modify, crawled=excluded.crawled",
+                [(host, port, posixpath.join(path, e.name), path, e.name, e.type, e.size, e.modify, now)
+                 for e in entries],
+            )
+            self._db.execute(
+                "INSERT INTO entries (host, port, path, parent, name, type, listed_modify, crawled)"
+                " VALUES (?, ?, ?, ?, ?, 'dir', ?, ?)"
+                " ON CONFLICT (host, port, path) DO UPDATE SET listed_modify=excluded.listed_modify,"
+                " crawled=excluded.crawled",
+                (host, port, path, posixpath.dirname(path) if path != "/" else "", posixpath.basename(path),
+                 modify, now),
+            )
+
+    def _delete_tree(self, host, port, path, keep_root=False):
+        below = path.rstrip("/") + "/"
+        self._db.execute(
+            "DELETE FROM entries WHERE host=? AND port=? AND path >= ? AND path < ?",
+            (host, port, below, below + _RANGE_END),
+        )
+        if not keep_root:
+            self._db.execute("DELETE FROM entries WHERE host=? AND port=? AND path=?", (host, port, path))
+
+
+def crawl(client, index, root=None, max_depth=None, workers=4, full=False):
+    """
+    Walk the remote tree under root (default: the current directory)
+    breadth first, listing up to `workers` directories at once over
+    pooled sessions, and store what is found in the index. Directories
+    deeper than max_depth below root are recorded but not listed.
+
+    A directory whose mtime matches the one it had when it was last
+    listed is not listed again, nor is anything below it. Most servers
+    only move a directory's mtime when its own entries change, not on
+    edits deeper down, so full=True relists everything. Returns
+    CrawlStats, or None if root could not be listed.
+    """
+    root = client._remote_abspath(root or ".")
+    if root is None:
+        client._log("Could not determine the remote directory.")
+        return None
+
+    stats = CrawlStats()
+    started = time.perf_counter()
+    host, port = client.host, client.port
+    pool = client.get_pool(workers)
+    running = {}
+
+    def submit(path, depth, modify):
+        running[executor.submit(_list, pool, path)] = (path, depth, modify)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        # the root's own mtime is not known without its parent, so it is always listed
+        submit(root, 0, None)
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                path, depth, modify = running.pop(future)
+                entries = future.result()
+                if entries is None:
+                    stats.failed += 1
+                    client._log(f"Could not list {path}.")
+                    if path == root:
+                        stats.elapsed = time.perf_counter() - started
+                        return None
+                    continue
+
+                stats.listed += 1
+                stats.entries += len(entries)
+                index.store_listing(host, port, path, entries, modify)
+                if max_depth is not None and depth >= max_depth:
+                    continue
+                for entry in entries:
+                    if not entry.is_dir:
+                        continue
+                    child = posixpath.join(path, entry.name)
+                    if not full and entry.modify is not None and \
+                            index.listed_modify(host, port, child) == entry.modify:
+                        stats.skipped += 1
+                        continue
+                    submit(child, depth + 1, entry.modify)
+
+    stats.elapsed = time.perf_counter() - started
+    client._log(f"Crawled {root}: {stats}.")
+    return stats
+
+
+def _list(pool, path):
+    # runs on a worker thread; listings go to the index, not the listing cache
+    try:
+        with pool.session(timeout=60.0) as session:
+            session._listing_complete = False
+            entries = list(session.iter_directory(path))
+            return entries if session._listing_complete else None
+    except PoolTimeout:
+        return None
@@ -0,0 +1,490 @@
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from ftp_pool import PoolTimeout
+from ftp_transfer import match_local, match_remote
+
+# where the CLI and the GUI keep their journal unless FTP_JOURNAL says otherwise
+DEFAULT_JOURNAL = os.path.join(os.path.expanduser("~"), ".ftp_journal.sqlite3")
+
+# failed items wait BACKOFF_BASE * 2**(attempts - 1) seconds, up to
+# BACKOFF_MAX, before the next try, and give up after MAX_ATTEMPTS
+BACKOFF_BASE = 5.0
+BACKOFF_MAX = 15 * 60.0
+MAX_ATTEMPTS = 8
+
+# runners renew the leases of their active items every LEASE_SECONDS / 4;
+# an active item whose lease ran out belongs to a process that is gone
+# and is handed out again
+LEASE_SECONDS = 30.0
+
+# byte offsets are written at most this often per transfer
+PROGRESS_INTERVAL = 2.0
+
+STATES = ("pending", "active", "done", "failed")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS transfers (
+    id INTEGER PRIMARY KEY,
+    host TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    username TEXT NOT NULL,
+    direction TEXT NOT NULL,
+    remote TEXT NOT NULL,
+    local TEXT NOT NULL,
+    size INTEGER,
+    priority INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    offset INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0,
+    lease_until REAL NOT NULL DEFAULT 0,
+    error TEXT,
+    local_size INTEGER,
+    local_mtime REAL,
+    remote_size INTEGER,
+    remote_modify REAL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transfers_queue ON transfers (host, port, username, state, next_attempt);
+"""
+
+# added after the first release; older journals get them on open. Both
+# ends of a finished transfer as they were when it completed, so a
+# later change on either side queues it again
+_ADDED_COLUMNS = (
+    ("local_size", "INTEGER"),
+    ("local_mtime", "REAL"),
+    ("remote_size", "INTEGER"),
+    ("remote_modify", "REAL"),
+)
+
+
+def journal_path():
+    """The journal file to use: $FTP_JOURNAL, or DEFAULT_JOURNAL."""
+    return os.environ.get("FTP_JOURNAL", DEFAULT_JOURNAL)
+
+
+class JournalEntry:
+    """One row of the journal."""
+
+    def __init__(self, row):
+        for key in row.keys():
+            setattr(self, key, row[key])
+
+    def __repr__(self):
+        return f"<JournalEntry {self.id} {self.direction} {self.remote} {self.state}>"
+
+
+class TransferJournal:
+    """
+    Durable transfer queue in an SQLite file. Every state change is
+    committed before the call returns (WAL, synchronous=FULL), so queued
+    and half-done transfers outlive the process and a reboot. Items are
+    handed out highest priority first, smaller files first among equals.
+    Safe to share between threads and between processes.
+    """
+
+    def __init__(self, path=DEFAULT_JOURNAL):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30.0, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.executescript(_SCHEMA)
+        present = {row["name"] for row in self._db.execute("PRAGMA table_info(transfers)")}
+        for name, kind in _ADDED_COLUMNS:
+            if name not in present:
+                self._db.execute(f"ALTER TABLE transfers ADD COLUMN {name} {kind}")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def add(self, client, direction, remote, local, size=None, priority=0):
+        """
+        Queue a transfer for the client's server. Remote paths are made
+        absolute against the client's directory and local ones against
+        ours, so the item still means the same after a restart. An
+        identical transfer that is already queued is not added twice,
+        nor is one already done while neither end changed since: the
+        local size and mtime and the remote SIZE and MDTM must match what
+        was recorded when it finished. Returns
+        (item id, whether it was queued now).
+        """
+        remote = client._remote_abspath(remote) or remote
+        local = os.path.abspath(local)
+        if size is None and direction == "put":
+            try:
+                size = os.path.getsize(local)
+            except OSError:
+                pass
+        key = (client.host, client.port, client.username or "", direction, remote, local)
+        # checked before the write lock is taken, as it may ask the server
+        with self._lock:
+            row = self._latest(key)
+        unchanged = row is not None and row["state"] == "done" and _unchanged(client, JournalEntry(row))
+
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute("BEGIN IMMEDIATE")
+            row = self._latest(key)
+            if row is not None and (row["state"] != "done" or unchanged):
+                return row["id"], False
+            cursor = self._db.execute(
+                "INSERT INTO transfers (host, port, username, direction, remote, local, size,"
+                " priority, created, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                key + (size, priority, now, now),
+            )
+            return cursor.lastrowid, True
+
+    def _latest(self, key):
+        return self._db.execute(
+            "SELECT * FROM transfers WHERE host=? AND port=? AND username=? AND direction=?"
+            " AND remote=? AND local=? AND state != 'failed' ORDER BY id DESC LIMIT 1",
+            key,
+        ).fetchone()
+
+    def claim(self, client, now=None):
+        """
+        Mark the next due item for the client's server active and return
+        it, or None. Items left active by a process that died are due
+        again once their lease runs out.
+        """
+        now = now or time.time()
+        with self._lock, self._db:
+            self._db.execute("BEGIN IMMEDIATE")
+            row = self._db.execute(
+                "SELECT * FROM transfers WHERE host=? AND port=? AND username=?"
+                " AND ((state='pending' AND next_attempt <= ?) OR (state='active' AND lease_until < ?))"
+                " ORDER BY priority DESC, size IS NULL, size, id LIMIT 1",
+                (client.host, client.port, client.username or "", now, now),
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute(
+                "UPDATE transfers SET state='active', attempts=attempts+1, lease_until=?, updated=?"
+                " WHERE id=?",
+                (now + LEASE_SECONDS, now, row["id"]),
+            )
+        return self.get(row["id"])
+
+    def start(self, item_id, now=None):
+        """
+        Mark one item active for a transfer run outside a JournalRunner
+        (mget/mput, the GUI) and return it, or None if it is done or
+        another runner holds it.
+        """
+        now = now or time.time()
+        with self._lock, self._db:
+            self._db.execute("BEGIN IMMEDIATE")
+            changed = self._db.execute(
+                "UPDATE transfers SET state='active', attempts=attempts+1, lease_until=?, updated=?"
+                " WHERE id=? AND (state='pending' OR (state='active' AND lease_until < ?))",
+                (now + LEASE_SECONDS, now, item_id, now),
+            ).rowcount
+        return self.get(item_id) if changed else None
+
+    def recorder(self, item_id, progress=None):
+        """
+        A progress(pos, total) callback that records the offset of an
+        active item (and renews its lease) at most every
+        PROGRESS_INTERVAL, then calls `progress` if given.
+        """
+        last = [time.monotonic()]
+
+        def record(pos, total):
+            if time.monotonic() - last[0] >= PROGRESS_INTERVAL:
+                last[0] = time.monotonic()
+                self.progress(item_id, pos)
+            if progress:
+                progress(pos, total)
+        return record
+
+    def progress(self, item_id, offset):
+        """Record how far an active transfer got and renew its lease."""
+        now = time.time()
+        self._update(item_id, "offset=?, lease_until=?, updated=?", offset, now + LEASE_SECONDS, now)
+
+    def renew(self, item_ids):
+        """Extend the leases of active items."""
+        if not item_ids:
+            return
+        now = time.time()
+        marks = ", ".join("?" for _ in item_ids)
+        with self._lock, self._db:
+            self._db.execute(
+                f"UPDATE transfers SET lease_until=? WHERE state='active' AND id IN ({marks})",
+                (now + LEASE_SECONDS,) + tuple(item_ids),
+            )
+
+    def done(self, item_id, local_size=None, local_mtime=None, remote_size=None, remote_modify=None):
+        """Mark an item finished, recording both ends as they are now."""
+        self._update(item_id, "state='done', offset=COALESCE(?, offset), size=COALESCE(?, size),"
+                     " local_size=?, local_mtime=?, remote_size=?, remote_modify=?, error=NULL, updated=?",
+                     local_size, local_size, local_size, local_mtime, remote_size, remote_modify, time.time())
+
+    def record_done(self, item_id, session, local, remote):
+        """done(), with the local file stat()ed and the remote one asked for on session."""
+        try:
+            st = os.stat(local)
+            local_size, local_mtime = st.st_size, st.st_mtime
+        except OSError:
+            local_size = local_mtime = None
+        self.done(item_id, local_size, local_mtime, session.size(remote), session.mdtm(remote))
+
+    def failed(self, item_id, error, max_attempts=MAX_ATTEMPTS):
+        """
+        Put a failed item back with exponential backoff (and some jitter),
+        or mark it failed for good after max_attempts. Returns the delay,
+        None when it gave up.
+        """
+        entry = self.get(item_id)
+        if entry is None:
+            return None
+        if entry.attempts >= max_attempts:
+            self._update(item_id, "state='failed', error=?, updated=?", error, time.time())
+            return None
+        delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (entry.attempts - 1)) * random.uniform(0.8, 1.2)
+        now = time.time()
+        self._update(item_id, "state='pending', error=?, next_attempt=?, updated=?", error, now + delay, now)
+        return delay
+
+    def remove(self, item_id):
+        """Forget an item, e.g. a transfer the user cancelled."""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM transfers WHERE id=?", (item_id,))
+
+    def release(self, item_id):
+        """Hand an active item back untouched, e.g. when stopping; the attempt does not count."""
+        self._update(item_id, "state='pending', attempts=MAX(attempts-1, 0), next_attempt=0, updated=?",
+                     time.time())
+
+    def retry(self, client=None):
+        """Make failed items (for one server, or all) pending again. Returns how many."""
+        where, args = self._server_filter(client)
+        with self._lock, self._db:
+            return self._db.execute(
+                "UPDATE transfers SET state='pending', attempts=0, next_attempt=0, updated=?"
+                f" WHERE state='failed'{where}", (time.time(),) + args,
+            ).rowcount
+
+    def clear(self, states=("done",), client=None):
+        """Delete items in the given states. Returns how many."""
+        where, args = self._server_filter(client)
+        marks = ", ".join("?" for _ in states)
+        with self._lock, self._db:
+            return self._db.execute(
+                f"DELETE FROM transfers WHERE state IN ({marks}){where}", tuple(states) + args
+            ).rowcount
+
+    def get(self, item_id):
+        with self._lock:
+            row = self._db.execute("SELECT * FROM transfers WHERE id=?", (item_id,)).fetchone()
+        return JournalEntry(row) if row is not None else None
+
+    def entries(self, client=None, states=STATES):
+        where, args = self._server_filter(client)
+        marks = ", ".join("?" for _ in states)
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT * FROM transfers WHERE state IN ({marks}){where}"
+                " ORDER BY state != 'active', priority DESC, id", tuple(states) + args,
+            ).fetchall()
+        return [JournalEntry(row) for row in rows]
+
+    def unfinished(self, client):
+        """Pending and active items for the client's server."""
+        return self.entries(client, ("pending", "active"))
+
+    def next_due(self, client):
+        """Earliest time a pending item for the client's server is due, None if none is waiting."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT MIN(CASE state WHEN 'active' THEN lease_until ELSE next_attempt END) FROM transfers"
+                " WHERE host=? AND port=? AND username=? AND state IN ('pending', 'active')",
+                (client.host, client.port, client.username or ""),
+            ).fetchone()
+        return row[0]
+
+    def counts(self, client=None):
+        where, args = self._server_filter(client)
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT state, COUNT(*) FROM transfers WHERE 1{where} GROUP BY state", args
+            ).fetchall()
+        return {state: count for state, count in rows}
+
+    def _update(self, item_id, assignments, *args):
+        with self._lock, self._db:
+            self._db.execute(f"UPDATE transfers SET {assignments} WHERE id=?", args + (item_id,))
+
+    @staticmethod
+    def _server_filter(client):
+        if client is None:
+            return "", ()
+        return " AND host=? AND port=? AND username=?", (client.host, client.port, client.username or "")
+
+
+class JournalRunner:
+    """
+    Works through a journal's items for one client's server over its
+    pooled sessions. Items are claimed one at a time, so several runners
+    (even in different processes) can share a journal. Progress is
+    written back as byte offsets, and an item that was interrupted is
+    continued with REST rather than started over.
+    """
+
+    def __init__(self, client, journal, workers=4, max_attempts=MAX_ATTEMPTS):
+        self.client = client
+        self.journal = journal
+        self.workers = max(1, workers)
+        self.max_attempts = max_attempts
+        self.done = 0
+        self.failed = 0
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._active = set()  # ids of the items being transferred
+
+    def run(self, wait=True):
+        """
+        Transfer every due item. With wait=True, items backing off are
+        waited for too, so it only returns once nothing is left pending
+        (or stop() was called). Returns the number of items given up on.
+        """
+        pool = self.client.get_pool(self.workers)
+        threads = [
+            threading.Thread(target=self._worker, args=(pool, wait), daemon=True)
+            for _ in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        finished = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(finished,), daemon=True)
+        heartbeat.start()
+        for thread in threads:
+            thread.join()
+        finished.set()
+        heartbeat.join()
+        self.client._log(f"Queue: {self.done} done, {self.failed} failed.")
+        return self.failed
+
+    def start(self, wait=True):
+        """run() on a background thread, which is returned."""
+        thread = threading.Thread(target=self.run, args=(wait,), daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        """Finish early; transfers in flight are interrupted and stay queued."""
+        self._stop.set()
+
+    def _worker(self, pool, wait):
+        while not self._stop.is_set():
+            entry = self.journal.claim(self.client)
+            if entry is None:
+                due = self.journal.next_due(self.client) if wait else None
+                if due is None:
+                    return
+                self._stop.wait(min(max(due - time.time(), 0.05), 5.0))
+                continue
+            with self._lock:
+                self._active.add(entry.id)
+            try:
+                with pool.session(timeout=60.0) as session:
+                    self._run_one(session, entry)
+            except PoolTimeout as e:
+                self._failed(entry, str(e))
+            finally:
+                with self._lock:
+                    self._active.discard(entry.id)
+
+    def _heartbeat(self, finished):
+        while not finished.wait(LEASE_SECONDS / 4):
+            with self._lock:
+                active = list(self._active)
+            self.journal.renew(active)
+
+    def _run_one(self, session, entry):
+        from ftp_client import TransferCancelled
+
+        last = [time.monotonic(), entry.offset]
+
+        def progress(pos, total):
+            last[1] = pos
+            if self._stop.is_set():
+                raise TransferCancelled()
+            if time.monotonic() - last[0] >= PROGRESS_INTERVAL:
+                last[0] = time.monotonic()
+                self.journal.progress(entry.id, pos)
+
+        session.priority = max(1, entry.priority)
+        # anything already on the far side is partial output of an earlier attempt
+        resume = entry.attempts > 1 or entry.offset > 0
+        try:
+            if entry.direction == "get":
+                os.makedirs(os.path.dirname(entry.local) or ".", exist_ok=True)
+                ok = session.get(entry.remote, entry.local, resume=resume, progress=progress)
+            else:
+                ok = session.put(entry.local, entry.remote, resume=resume, progress=progress)
+        finally:
+            session.priority = 1
+
+        if self._stop.is_set() and not ok:
+            self.journal.progress(entry.id, last[1])
+            self.journal.release(entry.id)
+        elif ok:
+            self.journal.record_done(entry.id, session, entry.local, entry.remote)
+            with self._lock:
+                self.done += 1
+            self.client._log(f"Queue: {entry.direction} {entry.remote} done.")
+        else:
+            self._failed(entry, f"{entry.direction} failed")
+
+    def _failed(self, entry, error):
+        delay = self.journal.failed(entry.id, error, self.max_attempts)
+        if delay is None:
+            with self._lock:
+                self.failed += 1
+            self.client._log(f"Queue: {entry.direction} {entry.remote} failed after {entry.attempts} attempts.")
+        else:
+            self.client._log(f"Queue: {entry.direction} {entry.remote} failed, retrying in {delay:.0f}s.")
+
+
+def enqueue(journal, client, direction, patterns, local_dir=".", priority=0):
+    """
+    Queue a get of every remote file, or a put of every local file,
+    matching any of the glob patterns, the way mget/mput match them.
+    Returns (queued, skipped), skipped being files already queued or
+    done and unchanged.
+    """
+    results = []
+    if direction == "get":
+        matched = match_remote(client, patterns)
+        sizes = client.sizes(matched)
+        for name in matched:
+            results.append(journal.add(client, "get", name, os.path.join(local_dir, name),
+                                       sizes.get(name), priority))
+    else:
+        for path in match_local(patterns):
+            results.append(journal.add(client, "put", os.path.basename(path), path, priority=priority))
+    queued = sum(added for _, added in results)
+    return queued, len(results) - queued
+
+
+def _unchanged(client, entry):
+    # a finished transfer is only worth skipping while both ends are as
+    # they were when it finished; rows without a record count as changed
+    try:
+        st = os.stat(entry.local)
+    except OSError:
+        return False
+    if entry.local_size is None or (st.st_size, st.st_mtime) != (entry.local_size, entry.local_mtime):
+        return False
+    # for uploads too: a remote copy deleted or replaced since needs sending again
+    return (client.size(entry.remote), client.mdtm(entry.remote)) == (entry.remote_size, entry.remote_modify)
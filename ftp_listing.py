@@ -0,0 +1,201 @@
+import calendar
+import re
+import threading
+import time
+from collections import OrderedDict
+
+
+class FTPEntry:
+    """One parsed directory entry from an MLSD or LIST listing."""
+
+    __slots__ = ("name", "type", "size", "modify", "perms", "raw")
+
+    def __init__(self, name, type="file", size=None, modify=None, perms=None, raw=None):
+        self.name = name
+        self.type = type      # "file", "dir", "link" or "other"
+        self.size = size      # bytes, or None if the listing did not say
+        self.modify = modify  # POSIX timestamp, or None if unknown
+        self.perms = perms
+        self.raw = raw
+
+    @property
+    def is_dir(self):
+        return self.type == "dir"
+
+    def __repr__(self):
+        return f"<FTPEntry {self.type} {self.name!r} size={self.size}>"
+
+
+def parse_mlsd_line(line):
+    """
+    Parse an RFC 3659 MLSD line such as
+    'type=file;size=1024;modify=20240101120000; notes.txt'.
+    Returns None for blank lines and the '.'/'..' entries.
+    """
+    facts_text, sep, name = line.partition(" ")
+    if not sep or not name:
+        return None
+
+    facts = {}
+    for fact in facts_text.split(";"):
+        key, eq, value = fact.partition("=")
+        if eq:
+            facts[key.lower()] = value
+
+    kind = facts.get("type", "file").lower()
+    if kind in ("cdir", "pdir"):
+        return None
+    if kind not in ("file", "dir"):
+        kind = "link" if "slink" in kind else ("dir" if kind.endswith("dir") else "other")
+
+    size = facts.get("size") or facts.get("sizd")
+    return FTPEntry(
+        name,
+        kind,
+        int(size) if size and size.isdigit() else None,
+        parse_ftp_time(facts.get("modify")),
+        facts.get("perm") or facts.get("unix.mode"),
+        line,
+    )
+
+
+def parse_list_line(line, now=None):
+    """
+    Parse one LIST line in Unix ('ls -l') or DOS/IIS format. Names with
+    spaces are kept intact. Returns None for lines that are not entries
+    (blank lines, 'total N' headers).
+    """
+    match = _UNIX_RE.match(line)
+    if match:
+        kind = {"d": "dir", "-": "file", "l": "link"}.get(match.group("type"), "other")
+        name = match.group("name")
+        if kind == "link" and " -> " in name:
+            name = name.split(" -> ", 1)[0]
+        if name in (".", ".."):
+            return None
+        return FTPEntry(
+            name,
+            kind,
+            int(match.group("size")),
+            _parse_unix_time(match.group("month"), match.group("day"), match.group("when"), now),
+            match.group("type") + match.group("perms"),
+            line,
+        )
+
+    match = _DOS_RE.match(line)
+    if match:
+        is_dir = match.group("size").upper() == "<DIR>"
+        return FTPEntry(
+            match.group("name"),
+            "dir" if is_dir else "file",
+            None if is_dir else int(match.group("size")),
+            _parse_dos_time(match.group("date"), match.group("time")),
+            None,
+            line,
+        )
+
+    return None
+
+
+def parse_ftp_time(value):
+    """Convert an MLSD/MDTM time (YYYYMMDDHHMMSS[.sss], UTC) to a timestamp."""
+    if not value:
+        return None
+    try:
+        return calendar.timegm(time.strptime(value[:14], "%Y%m%d%H%M%S"))
+    except ValueError:
+        return None
+
+
+class ListingCache:
+    """
+    Directory listings keyed by absolute remote path, with a TTL and
+    least-recently-used eviction. Safe to share between the sessions of
+    one client, so a put on a pooled session invalidates the listing the
+    browsing session sees.
+    """
+
+    def __init__(self, ttl=30.0, max_dirs=64):
+        self.ttl = ttl
+        self.max_dirs = max_dirs
+        self._entries = OrderedDict()  # path -> (stored_at, [FTPEntry])
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        """Return a copy of the cached listing, or None if missing or stale."""
+        with self._lock:
+            item = self._entries.get(path)
+            if item is None:
+                return None
+            if time.monotonic() - item[0] > self.ttl:
+                del self._entries[path]
+                return None
+            self._entries.move_to_end(path)
+            return list(item[1])
+
+    def put(self, path, entries):
+        with self._lock:
+            self._entries[path] = (time.monotonic(), list(entries))
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_dirs:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, path):
+        with self._lock:
+            self._entries.pop(path, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def patch(self, path, entry):
+        """
+        Add or replace one entry in a cached listing in place. Returns
+        False if the directory is not cached (nothing to patch).
+        """
+        with self._lock:
+            item = self._entries.get(path)
+            if item is None:
+                return False
+            entries = [e for e in item[1] if e.name != entry.name]
+            entries.append(entry)
+            self._entries[path] = (item[0], entries)
+            return True
+
+
+def _parse_unix_time(month, day, when, now=None):
+    try:
+        if ":" in when:
+            # recent files show a time instead of a year, which means
+            # within the last six months
+            now = time.time() if now is None else now
+            year = time.gmtime(now).tm_year
+            stamp = calendar.timegm(time.strptime(f"{year} {month} {day} {when}", "%Y %b %d %H:%M"))
+            if stamp > now + 86400:
+                stamp = calendar.timegm(time.strptime(f"{year - 1} {month} {day} {when}", "%Y %b %d %H:%M"))
+            return stamp
+        return calendar.timegm(time.strptime(f"{when} {month} {day}", "%Y %b %d"))
+    except ValueError:
+        return None
+
+
+def _parse_dos_time(date, clock):
+    for fmt in ("%m-%d-%y %I:%M%p", "%m-%d-%Y %I:%M%p"):
+        try:
+            return calendar.timegm(time.strptime(f"{date} {clock.upper()}", fmt))
+        except ValueError:
+            continue
+    return None
+
+
+_UNIX_RE = re.compile(
+    r"^(?P<type>[-dlbcps])(?P<perms>[-rwxsStTl]{9})\S*\s+"
+    r"\d+\s+\S+\s+(?:\S+\s+)?(?P<size>\d+)\s+"
+    r"(?P<month>[A-Za-z]{3})\s+(?P<day>\d{1,2})\s+(?P<when>\d{1,2}:\d{2}|\d{4})\s"
+    r"(?P<name>.+)$"
+)
+_DOS_RE = re.compile(
+    r"^(?P<date>\d{2}-\d{2}-\d{2,4})\s+(?P<time>\d{1,2}:\d{2}[AaPp][Mm])\s+"
+    r"(?P<size><DIR>|\d+)\s+(?P<name>.+)$"
+)
+
@@ -0,0 +1,633 @@
+import calendar
+import hashlib
+import os
+import posixpath
+import queue
+import socket
+import threading
+import time
+import zlib
+
+# advertised in FEAT, matching what the client knows how to use
+DEFAULT_FEATURES = (
+    "SIZE", "MDTM", "MFMT", "REST STREAM", "MLST type*;size*;modify*;perm*;", "MODE Z",
+    "HASH SHA-256*;SHA-1;MD5;CRC32",
+)
+
+# HASH algorithms and the X commands that stand for them
+_HASHES = {
+    "SHA-256": hashlib.sha256,
+    "SHA-1": hashlib.sha1,
+    "MD5": hashlib.md5,
+    "CRC32": None,  # zlib.crc32, see _digest()
+}
+
+# bytes per send/recv on data connections
+DATA_CHUNK = 64 * 1024
+
+
+class LoopbackFTPServer:
+    """
+    Small in-process FTP server over an in-memory file tree, for the
+    benchmarks in ftp_bench.py and for trying the client without a real
+    server. Each session runs on its own thread. `latency` (seconds) is
+    the round trip added to every command, counted from when the command
+    arrived so pipelined commands overlap as they would on a real link,
+    and again before the first data byte. `bandwidth` (bytes/s) is shared
+    by all data connections. Together they roughly model a remote server
+    on a slower link:
+
+        with LoopbackFTPServer(latency=0.02, bandwidth=10 * 1024 * 1024) as server:
+            server.add_file("/data.bin", size=1024 * 1024)
+            client.open("127.0.0.1", server.port)
+
+    Any user name and password are accepted except the password "bad".
+    With `upload_limit` set, a STOR/APPE that goes past that many bytes
+    is cut off with 552, the way a server over quota would. Listings of
+    the directories in `unreadable` are refused with 550.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, bandwidth=None,
+                 features=DEFAULT_FEATURES, upload_limit=None):
+        self.host = host
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.features = list(features)
+        self.upload_limit = upload_limit
+        self.unreadable = set()
+        self.root = _Node("dir")
+        self.sessions = 0
+        self.commands = 0
+        self._shaper = _Shaper(bandwidth) if bandwidth else None
+        self._lock = threading.Lock()
+        self._clients = set()
+        self._thread = None
+
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind((host, port))
+        self._listener.listen(128)
+        self.port = self._listener.getsockname()[1]
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        """Accept connections on a background thread. Returns self."""
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        try:
+            self._listener.close()
+        except OSError:
+            pass
+        with self._lock:
+            clients = list(self._clients)
+        for conn in clients:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    # file tree
+    def add_dir(self, path):
+        """Create a directory and any missing parents, returns its node."""
+        node = self.root
+        for part in _split(path):
+            child = node.children.get(part)
+            if child is None:
+                child = node.children[part] = _Node("dir")
+                node.mtime = child.mtime
+            node = child
+        return node
+
+    def add_file(self, path, data=None, size=None):
+        """
+        Create a file from `data`, or of `size` bytes of incompressible
+        filler when only the size matters.
+        """
+        if data is None:
+            data = _filler(size or 0)
+        parent = self.add_dir(posixpath.dirname(path))
+        node = parent.children[posixpath.basename(path)] = _Node("file", bytearray(data))
+        # like a real file system, adding or removing an entry moves the directory's mtime
+        parent.mtime = node.mtime
+
+    def add_many(self, path, count, size=0, prefix="file"):
+        """
+        Fill a directory with `count` files named prefix0000000... sharing
+        one node, cheap enough for million-entry listings.
+        """
+        parent = self.add_dir(path)
+        shared = _Node("file", bytearray(_filler(size)))
+        for i in range(count):
+            parent.children[f"{prefix}{i:07d}"] = shared
+
+    def load_directory(self, local_dir, path="/"):
+        """Copy a local directory tree into the server."""
+        for dirpath, dirnames, filenames in os.walk(local_dir):
+            rel = os.path.relpath(dirpath, local_dir)
+            base = path if rel == "." else posixpath.join(path, *rel.split(os.sep))
+            self.add_dir(base)
+            for name in filenames:
+                with open(os.path.join(dirpath, name), "rb") as f:
+                    self.add_file(posixpath.join(base, name), f.read())
+
+    def read_file(self, path):
+        """Contents of a file as bytes, None if it does not exist."""
+        node = self._lookup(path)
+        return bytes(node.data) if node is not None and node.kind == "file" else None
+
+    def _unlink(self, path):
+        """Remove an entry from its directory, moving the directory's mtime. Returns the node."""
+        parent = self._lookup(posixpath.dirname(path))
+        parent.mtime = time.time()
+        return parent.children.pop(posixpath.basename(path))
+
+    def _lookup(self, path):
+        node = self.root
+        for part in _split(path):
+            if node.kind != "dir" or part not in node.children:
+                return None
+            node = node.children[part]
+        return node
+
+    # connections
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self._listener.accept()
+            except OSError:
+                return
+            # replies go out as small back-to-back writes (150 then 226),
+            # which Nagle would hold for the client's delayed ACK
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self._lock:
+                self.sessions += 1
+                self._clients.add(conn)
+            threading.Thread(target=self._run_session, args=(conn,), daemon=True).start()
+
+    def _run_session(self, conn):
+        try:
+            _Session(self, conn).run()
+        except OSError:
+            pass
+        finally:
+            with self._lock:
+                self._clients.discard(conn)
+            conn.close()
+
+
+class _Node:
+    __slots__ = ("kind", "data", "children", "mtime")
+
+    def __init__(self, kind, data=None):
+        self.kind = kind
+        self.data = data
+        self.children = {} if kind == "dir" else None
+        self.mtime = time.time()
+
+
+class _Shaper:
+    """Token bucket shared by all data connections of one server."""
+
+    def __init__(self, rate):
+        self.rate = float(rate)
+        self.allowance = 0.0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, nbytes):
+        with self.lock:
+            now = time.monotonic()
+            # idle time buys at most one chunk of burst
+            self.allowance = min(self.allowance + (now - self.updated) * self.rate, self.chunk())
+            self.updated = now
+            self.allowance -= nbytes
+            wait = -self.allowance / self.rate if self.allowance < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+
+    def chunk(self):
+        return max(1024, min(DATA_CHUNK, int(self.rate / 50)))
+
+
+class _Session:
+    """One control connection and its state."""
+
+    def __init__(self, server, conn):
+        self.server = server
+        self.conn = conn
+        self.reader = conn.makefile("rb")
+        self.lines = queue.Queue()
+        self.arrived = time.monotonic()
+        self.cwd = "/"
+        self.rest = 0
+        self.passive = None
+        self.rename_from = None
+        self.mode = "S"
+        self.level = 6  # MODE Z compression level, set with OPTS
+        self.hash = "SHA-256"
+
+    def run(self):
+        threading.Thread(target=self.read_commands, daemon=True).start()
+        self.reply("220 loopback FTP ready")
+        while True:
+            self.arrived, line = self.lines.get()
+            if line is None:
+                return
+            line = line.decode("utf-8", errors="replace").rstrip("\r\n")
+            verb, _, arg = line.partition(" ")
+            with self.server._lock:
+                self.server.commands += 1
+            handler = getattr(self, "ftp_" + verb.upper(), None)
+            if handler is None:
+                self.reply(f"502 {verb} not implemented")
+                continue
+            try:
+                if handler(arg) is False:
+                    return
+            except OSError:
+                raise
+            except Exception as e:
+                self.reply(f"451 {e}")
+
+    def read_commands(self):
+        # timestamps each command as it arrives, see reply()
+        try:
+            for line in self.reader:
+                self.lines.put((time.monotonic(), line))
+        except OSError:
+            pass
+        self.lines.put((time.monotonic(), None))
+
+    def reply(self, text, lines=None):
+        delay = self.arrived + self.server.latency - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        if lines is None:
+            payload = text + "\r\n"
+        else:
+            code = text[:3]
+            payload = f"{code}-{text[4:]}\r\n" + "".join(f" {x}\r\n" for x in lines) + f"{code} End\r\n"
+        self.conn.sendall(payload.encode("utf-8"))
+
+    def resolve(self, arg):
+        """Absolute path for an argument relative to the cwd."""
+        return posixpath.normpath(posixpath.join(self.cwd, arg or "."))
+
+    # data connection
+    def open_data(self):
+        listener, self.passive = self.passive, None
+        if listener is None:
+            self.reply("425 Use PASV first")
+            return None
+        try:
+            listener.settimeout(10.0)
+            data, _ = listener.accept()
+            return data
+        except OSError:
+            self.reply("425 Data connection failed")
+            return None
+        finally:
+            listener.close()
+
+    def send_data(self, data_conn, payload):
+        view = memoryview(payload)
+        shaper = self.server._shaper
+        chunk = shaper.chunk() if shaper else DATA_CHUNK
+        # in MODE Z the bandwidth limit applies to the compressed bytes
+        deflater = zlib.compressobj(self.level) if self.mode == "Z" else None
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        for start in range(0, len(view), chunk):
+            piece = view[start:start + chunk]
+            if deflater:
+                piece = deflater.compress(piece)
+            if shaper:
+                shaper.consume(len(piece))
+            data_conn.sendall(piece)
+        if deflater:
+            data_conn.sendall(deflater.flush())
+
+    def recv_data(self, data_conn, limit=None):
+        """Receive until EOF; returns None if more than limit bytes arrive."""
+        received = bytearray()
+        shaper = self.server._shaper
+        chunk = shaper.chunk() if shaper else DATA_CHUNK
+        inflater = zlib.decompressobj() if self.mode == "Z" else None
+        while True:
+            piece = data_conn.recv(chunk)
+            if not piece:
+                if inflater:
+                    received += inflater.flush()
+                return received
+            if shaper:
+                shaper.consume(len(piece))
+            received += inflater.decompress(piece) if inflater else piece
+            if limit is not None and len(received) > limit:
+                return None
+
+    # login and session
+    def ftp_USER(self, arg):
+        self.reply("331 Password required")
+
+    def ftp_PASS(self, arg):
+        self.reply("530 Login incorrect" if arg == "bad" else "230 Logged in")
+
+    def ftp_QUIT(self, arg):
+        self.reply("221 Goodbye")
+        return False
+
+    def ftp_NOOP(self, arg):
+        self.reply("200 OK")
+
+    def ftp_SYST(self, arg):
+        self.reply("215 UNIX Type: L8")
+
+    def ftp_FEAT(self, arg):
+        self.reply("211 Features", self.server.features)
+
+    def ftp_TYPE(self, arg):
+        self.reply(f"200 Type set to {arg}")
+
+    def ftp_MODE(self, arg):
+        if arg.upper() in ("S", "Z"):
+            self.mode = arg.upper()
+            self.reply(f"200 Mode {self.mode}")
+        else:
+            self.reply(f"504 Mode {arg} not supported")
+
+    def ftp_OPTS(self, arg):
+        words = arg.upper().split()
+        if words[:3] == ["MODE", "Z", "LEVEL"] and len(words) == 4 and words[3].isdigit() and int(words[3]) <= 9:
+            self.level = int(words[3])
+            self.reply(f"200 MODE Z level set to {self.level}")
+        elif words[:1] == ["HASH"] and len(words) == 2 and words[1] in _HASHES:
+            self.hash = words[1]
+            self.reply(f"200 {self.hash}")
+        else:
+            self.reply(f"501 OPTS {arg} not understood")
+
+    def ftp_PASV(self, arg):
+        if self.passive is not None:
+            self.passive.close()
+        self.passive = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.passive.bind((self.server.host, 0))
+        self.passive.listen(1)
+        port = self.passive.getsockname()[1]
+        ip = self.server.host.replace(".", ",")
+        self.reply(f"227 Entering Passive Mode ({ip},{port >> 8},{port & 255})")
+
+    def ftp_ABOR(self, arg):
+        self.reply("226 ABOR successful")
+
+    # navigation
+    def ftp_PWD(self, arg):
+        self.reply(f'257 "{self.cwd}" is the current directory')
+
+    def ftp_CWD(self, arg):
+        path = self.resolve(arg)
+        node = self.server._lookup(path)
+        if node is None or node.kind != "dir":
+            return self.reply(f"550 {arg}: No such directory")
+        self.cwd = path
+        self.reply("250 Directory changed")
+
+    def ftp_CDUP(self, arg):
+        self.ftp_CWD("..")
+
+    def ftp_MKD(self, arg):
+        path = self.resolve(arg)
+        self.server.add_dir(path)
+        self.reply(f'257 "{path}" created')
+
+    def ftp_RMD(self, arg):
+        path = self.resolve(arg)
+        node = self.server._lookup(path)
+        if node is None or node.kind != "dir" or node.children or path == "/":
+            return self.reply(f"550 {arg}: Cannot remove")
+        self.server._unlink(path)
+        self.reply("250 Directory removed")
+
+    # file information
+    def ftp_SIZE(self, arg):
+        node = self.server._lookup(self.resolve(arg))
+        if node is None or node.kind != "file":
+            return self.reply(f"550 {arg}: No such file")
+        self.reply(f"213 {len(node.data)}")
+
+    def ftp_HASH(self, arg):
+        node = self.server._lookup(self.resolve(arg))
+        if node is None or node.kind != "file":
+            return self.reply(f"550 {arg}: No such file")
+        self.reply(f"213 {self.hash} 0-{len(node.data)} {_digest(self.hash, node.data)} {arg}")
+
+    def ftp_XSHA256(self, arg):
+        self.x_hash("SHA-256", arg)
+
+    def ftp_XSHA1(self, arg):
+        self.x_hash("SHA-1", arg)
+
+    def ftp_XMD5(self, arg):
+        self.x_hash("MD5", arg)
+
+    def ftp_XCRC(self, arg):
+        self.x_hash("CRC32", arg)
+
+    def x_hash(self, algorithm, arg):
+        node = self.server._lookup(self.resolve(arg))
+        if node is None or node.kind != "file":
+            return self.reply(f"550 {arg}: No such file")
+        self.reply(f"250 {_digest(algorithm, node.data)}")
+
+    def ftp_MDTM(self, arg):
+        node = self.server._lookup(self.resolve(arg))
+        if node is None:
+            return self.reply(f"550 {arg}: No such file")
+        self.reply(f"213 {_ftp_time(node.mtime)}")
+
+    def ftp_MFMT(self, arg):
+        stamp, _, name = arg.partition(" ")
+        node = self.server._lookup(self.resolve(name))
+        if node is None:
+            return self.reply(f"550 {name}: No such file")
+        node.mtime = calendar.timegm(time.strptime(stamp[:14], "%Y%m%d%H%M%S"))
+        self.reply(f"213 Modify={stamp[:14]}; {name}")
+
+    def ftp_MLST(self, arg):
+        path = self.resolve(arg)
+        node = self.server._lookup(path)
+        if node is None:
+            return self.reply(f"550 {arg}: No such file")
+        self.reply("250 Listing", [_facts(path, node)])
+
+    # file changes
+    def ftp_DELE(self, arg):
+        path = self.resolve(arg)
+        node = self.server._lookup(path)
+        if node is None or node.kind != "file":
+            return self.reply(f"550 {arg}: No such file")
+        self.server._unlink(path)
+        self.reply("250 File deleted")
+
+    def ftp_RNFR(self, arg):
+        path = self.resolve(arg)
+        if self.server._lookup(path) is None:
+            return self.reply(f"550 {arg}: No such file")
+        self.rename_from = path
+        self.reply("350 Ready for RNTO")
+
+    def ftp_RNTO(self, arg):
+        if self.rename_from is None:
+            return self.reply("503 RNFR first")
+        source, self.rename_from = self.rename_from, None
+        node = self.server._unlink(source)
+        target = self.resolve(arg)
+        parent = self.server.add_dir(posixpath.dirname(target))
+        parent.children[posixpath.basename(target)] = node
+        parent.mtime = time.time()
+        self.reply("250 Renamed")
+
+    # listings
+    def ftp_LIST(self, arg):
+        self.listing(arg, lambda name, node: _list_line(name, node))
+
+    def ftp_NLST(self, arg):
+        self.listing(arg, lambda name, node: name)
+
+    def ftp_MLSD(self, arg):
+        self.listing(arg, _facts)
+
+    def listing(self, arg, format_line):
+        # LIST options such as -a are accepted and ignored
+        path = self.resolve("" if arg.startswith("-") else arg)
+        node = self.server._lookup(path)
+        if node is None or node.kind != "dir" or path in self.server.unreadable:
+            if self.passive is not None:
+                self.passive.close()
+                self.passive = None
+            return self.reply(f"550 {arg}: No such directory")
+        data_conn = self.open_data()
+        if data_conn is None:
+            return
+        with data_conn:
+            self.reply("150 Here comes the listing")
+            lines = [format_line(name, child) for name, child in sorted(node.children.items())]
+            self.send_data(data_conn, ("\r\n".join(lines) + "\r\n" if lines else "").encode("utf-8"))
+        self.reply("226 Transfer complete")
+
+    # transfers
+    def ftp_REST(self, arg):
+        self.rest = int(arg)
+        self.reply(f"350 Restarting at {self.rest}")
+
+    def ftp_RETR(self, arg):
+        offset, self.rest = self.rest, 0
+        node = self.server._lookup(self.resolve(arg))
+        if node is None or node.kind != "file":
+            if self.passive is not None:
+                self.passive.close()
+                self.passive = None
+            return self.reply(f"550 {arg}: No such file")
+        data_conn = self.open_data()
+        if data_conn is None:
+            return
+        with data_conn:
+            self.reply(f"150 Opening BINARY mode data connection ({len(node.data) - offset} bytes)")
+            try:
+                self.send_data(data_conn, memoryview(node.data)[offset:])
+            except OSError:
+                return self.reply("426 Connection closed; transfer aborted")
+        self.reply("226 Transfer complete")
+
+    def ftp_STOR(self, arg):
+        self.store(arg, append=False)
+
+    def ftp_APPE(self, arg):
+        self.store(arg, append=True)
+
+    def store(self, arg, append):
+        offset, self.rest = self.rest, 0
+        path = self.resolve(arg)
+        data_conn = self.open_data()
+        if data_conn is None:
+            return
+        with data_conn:
+            self.reply("150 Ok to send data")
+            received = self.recv_data(data_conn, self.server.upload_limit)
+        if received is None:
+            return self.reply("552 Exceeded storage allocation")
+        node = self.server._lookup(path)
+        if node is None or node.kind != "file":
+            self.server.add_file(path, received)
+        elif append:
+            node.data += received
+            node.mtime = time.time()
+        else:
+            node.data[offset:] = received
+            node.mtime = time.time()
+        self.reply("226 Transfer complete")
+
+
+def _digest(algorithm, data):
+    if algorithm == "CRC32":
+        return f"{zlib.crc32(data):08X}"
+    return _HASHES[algorithm](data).hexdigest()
+
+
+def _split(path):
+    return [part for part in posixpath.normpath("/" + path).split("/") if part]
+
+
+def _filler(size):
+    block = os.urandom(min(size, 1024 * 1024))
+    if not block:
+        return b""
+    return (block * (size // len(block) + 1))[:size]
+
+
+def _ftp_time(stamp):
+    return time.strftime("%Y%m%d%H%M%S", time.gmtime(stamp))
+
+
+def _facts(name, node):
+    if node.kind == "dir":
+        return f"type=dir;modify={_ftp_time(node.mtime)};perm=elcmp; {posixpath.basename(name) or name}"
+    return f"type=file;size={len(node.data)};modify={_ftp_time(node.mtime)};perm=rwadf; {posixpath.basename(name) or name}"
+
+
+def _list_line(name, node):
+    flag, size = ("d", 0) if node.kind == "dir" else ("-", len(node.data))
+    when = time.strftime("%b %d %H:%M", time.gmtime(node.mtime))
+    return f"{flag}rw-r--r--   1 ftp      ftp      {size:>12} {when} {name}"
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="In-memory loopback FTP server.")
+    parser.add_argument("--port", type=int, default=2121)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added per reply")
+    parser.add_argument("--bandwidth", type=float, default=None, help="MiB/s shared by data connections")
+    parser.add_argument("--root", help="local directory to serve (copied into memory)")
+    args = parser.parse_args()
+
+    bandwidth = args.bandwidth * 1024 * 1024 if args.bandwidth else None
+    server = LoopbackFTPServer(port=args.port, latency=args.latency, bandwidth=bandwidth)
+    if args.root:
+        server.load_directory(args.root)
+    print(f"Serving on 127.0.0.1:{server.port}, Ctrl+C to stop.")
+    try:
+        server._serve()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
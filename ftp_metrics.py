@@ -0,0 +1,247 @@
+import json
+import threading
+import time
+
+# histogram upper bounds; anything larger lands in the +Inf bucket
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(11))          # 1 KiB .. 1 GiB
+RATE_BUCKETS = tuple(64 * 1024 * 2 ** i for i in range(15))     # 64 KiB/s .. 1 GiB/s
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10)
+
+# which buckets each histogram uses, latency when not listed
+_BUCKETS = {
+    "transfer_bytes": SIZE_BUCKETS,
+    "throughput_bytes_per_second": RATE_BUCKETS,
+    "transfer_retries": COUNT_BUCKETS,
+}
+
+_HELP = {
+    "command_seconds": "Control command round trip, command sent to first reply line.",
+    "pasv_setup_seconds": "PASV sent to data connection established.",
+    "ttfb_seconds": "RETR/STOR sent to first data byte (downloads) or to the 150 reply (uploads).",
+    "transfer_seconds": "Whole transfer including data connection setup.",
+    "transfer_bytes": "Bytes moved per completed transfer.",
+    "throughput_bytes_per_second": "Per-transfer throughput of completed transfers.",
+    "transfer_retries": "Retries needed per queued transfer or segment.",
+    "command_timeouts_total": "Commands that got no reply in time.",
+    "transfers_total": "Transfers by outcome.",
+    "bytes_total": "Bytes moved, including partial transfers.",
+    "retries_total": "Transfer attempts after the first.",
+    "pipeline_seconds": "One pipeline() batch, first command sent to last reply.",
+    "pipelined_commands_total": "Commands answered through pipeline().",
+    "compressed_wire_bytes_total": "Bytes on the data connection for MODE Z transfers.",
+    "verifications_total": "Finished transfers checked against the server, by hash or size and result.",
+    "throttled_seconds_total": "Time data connections slept to stay under the bandwidth limits.",
+}
+
+
+class Histogram:
+    """Fixed-bucket histogram with count, sum, min and max."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, q):
+        """
+        Estimate the q-th quantile (0..1) by interpolating inside the
+        bucket it falls in. Returns None when nothing was observed.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                lower, upper = max(lower, self.min), min(upper, self.max)
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return self.max
+
+    def snapshot(self):
+        cumulative, running = {}, 0
+        for bound, n in zip(self.buckets + ("+Inf",), self.counts):
+            running += n
+            cumulative[str(bound)] = running
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min,
+            "max": self.max,
+            "mean": self.sum / self.count if self.count else None,
+            "p50": self.percentile(0.5),
+            "p90": self.percentile(0.9),
+            "p99": self.percentile(0.99),
+            "buckets": cumulative,
+        }
+
+
+class Metrics:
+    """
+    Histograms and counters keyed by metric name and labels. One
+    instance is shared by a client and all of its pooled sessions, so
+    every method is thread-safe.
+    """
+
+    def __init__(self):
+        self._histograms = {}  # (name, labels) -> Histogram
+        self._counters = {}    # (name, labels) -> number
+        self._lock = threading.Lock()
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(_BUCKETS.get(name, LATENCY_BUCKETS))
+            histogram.observe(value)
+
+    def increment(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def transfer(self, direction):
+        """Start timing one transfer, see TransferTimer."""
+        return TransferTimer(self, direction)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    # export
+    def snapshot(self):
+        """Everything recorded so far as plain dicts and lists."""
+        result = {"histograms": {}, "counters": {}}
+        with self._lock:
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                item = {"labels": dict(labels)}
+                item.update(histogram.snapshot())
+                result["histograms"].setdefault(name, []).append(item)
+            for (name, labels), value in sorted(self._counters.items()):
+                result["counters"].setdefault(name, []).append({"labels": dict(labels), "value": value})
+        return result
+
+    def to_json(self, indent=2):
+        return json.dumps(self.snapshot(), indent=indent)
+
+    def to_prometheus(self, prefix="ftp_"):
+        """Prometheus text exposition format."""
+        out = []
+        snapshot = self.snapshot()
+        for name, series in snapshot["histograms"].items():
+            metric = prefix + name
+            if name in _HELP:
+                out.append(f"# HELP {metric} {_HELP[name]}")
+            out.append(f"# TYPE {metric} histogram")
+            for item in series:
+                for bound, n in item["buckets"].items():
+                    out.append(f"{metric}_bucket{_labels(item['labels'], le=bound)} {n}")
+                out.append(f"{metric}_sum{_labels(item['labels'])} {_number(item['sum'])}")
+                out.append(f"{metric}_count{_labels(item['labels'])} {item['count']}")
+        for name, series in snapshot["counters"].items():
+            metric = prefix + name
+            if name in _HELP:
+                out.append(f"# HELP {metric} {_HELP[name]}")
+            out.append(f"# TYPE {metric} counter")
+            for item in series:
+                out.append(f"{metric}{_labels(item['labels'])} {_number(item['value'])}")
+        return "\n".join(out) + "\n"
+
+    def summary(self):
+        """Short human-readable lines, one per series."""
+        lines = []
+        snapshot = self.snapshot()
+        for name, series in snapshot["histograms"].items():
+            for item in series:
+                lines.append(
+                    f"{name}{_labels(item['labels'])}: n={item['count']} "
+                    f"p50={_human(name, item['p50'])} p90={_human(name, item['p90'])} "
+                    f"p99={_human(name, item['p99'])} max={_human(name, item['max'])}"
+                )
+        for name, series in snapshot["counters"].items():
+            for item in series:
+                lines.append(f"{name}{_labels(item['labels'])}: {_number(item['value'])}")
+        return lines or ["No metrics recorded yet."]
+
+
+class TransferTimer:
+    """
+    Times one data transfer. Created when the transfer starts (before
+    PASV), then request() when RETR/STOR goes out, first_byte() when data
+    starts flowing and finish() once with the outcome.
+    """
+
+    def __init__(self, metrics, direction):
+        self.metrics = metrics
+        self.direction = direction
+        self.started = time.perf_counter()
+        self.requested = self.started
+        self.first_byte_at = None
+        self.finished = False
+
+    def request(self):
+        self.requested = time.perf_counter()
+
+    def first_byte(self):
+        if self.first_byte_at is None:
+            self.first_byte_at = time.perf_counter()
+            self.metrics.observe("ttfb_seconds", self.first_byte_at - self.requested, direction=self.direction)
+
+    def finish(self, nbytes, outcome="ok"):
+        if self.finished:
+            return
+        self.finished = True
+        elapsed = time.perf_counter() - self.started
+        metrics = self.metrics
+        metrics.increment("transfers_total", direction=self.direction, outcome=outcome)
+        metrics.increment("bytes_total", nbytes, direction=self.direction)
+        if outcome != "ok":
+            return
+        metrics.observe("transfer_seconds", elapsed, direction=self.direction)
+        metrics.observe("transfer_bytes", nbytes, direction=self.direction)
+        if elapsed > 0:
+            metrics.observe("throughput_bytes_per_second", nbytes / elapsed, direction=self.direction)
+
+
+def _labels(labels, **extra):
+    items = list(labels.items()) + list(extra.items())
+    if not items:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in items)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+
+def _number(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _human(name, value):
+    if value is None:
+        return "-"
+    if name.endswith("_seconds"):
+        return f"{value * 1000:.1f}ms"
+    if name == "transfer_bytes":
+        return f"{value / 1024:.0f}KiB"
+    if name == "throughput_bytes_per_second":
+        return f"{value / 1024 / 1024:.2f}MiB/s"
+    return f"{value:g}"
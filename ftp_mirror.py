@@ -0,0 +1,287 @@
+import os
+import posixpath
+
+from ftp_transfer import TransferQueue
+
+# listing and local clocks rarely agree to the second
+MTIME_TOLERANCE = 2.0
+
+
+class MirrorPlan:
+    """What a mirror run will do (or, with dry_run, would do)."""
+
+    def __init__(self):
+        self.transfers = []   # (remote_path, local_path, modify)
+        self.make_dirs = []   # directories to create on the target side
+        self.deletes = []     # files to delete on the target side
+        self.remove_dirs = []  # directories to remove, deepest first
+        self.unchanged = 0
+        self.failed = []      # Transfers that did not succeed, once applied
+        self.unreadable = []  # remote directories that could not be listed
+
+
+def mirror(client, remote_dir, local_dir, upload=False, dry_run=False,
+           delete=False, workers=4, retries=2):
+    """
+    Make local_dir match remote_dir (or, with upload=True, the other way
+    round). Both trees are walked, files are compared by size and
+    modification time (MLSD facts when available, MDTM otherwise), and
+    only new or changed files are transferred, in parallel over pooled
+    sessions. delete=True also removes files missing from the source.
+    Returns the MirrorPlan, with the transfers that failed in
+    plan.failed, or None if the trees could not be compared. Remote
+    directories that cannot be listed are left out of the comparison,
+    listed in plan.unreadable, and nothing under them is deleted.
+    """
+    if not client.connected:
+        client._log("Not connected.")
+        return None
+
+    remote_root = client._remote_abspath(remote_dir)
+    if remote_root is None:
+        client._log(f"Cannot resolve remote directory '{remote_dir}'.")
+        return None
+    local_root = os.path.abspath(local_dir)
+    if upload and not os.path.isdir(local_root):
+        client._log(f"Local directory '{local_dir}' does not exist.")
+        return None
+
+    remote_files, remote_dirs, unreadable = _walk_remote(client, remote_root)
+    if remote_files is None and not upload:
+        # never treat an unreadable source as empty, delete would wipe the target
+        client._log(f"Cannot list remote directory '{remote_dir}'.")
+        return None
+    local_files, local_dirs = _walk_local(local_root)
+    exact_times = client.supports("MLST")
+
+    if upload:
+        plan = _plan_upload(client, remote_root, local_root, remote_files or {}, remote_dirs,
+                            local_files, local_dirs, exact_times)
+    else:
+        plan = _plan_download(client, remote_root, local_root, remote_files, remote_dirs,
+                              local_files, local_dirs, exact_times)
+    if remote_files is None:
+        plan.make_dirs.insert(0, remote_root)
+    if not delete:
+        plan.deletes = []
+        plan.remove_dirs = []
+    if unreadable:
+        plan.unreadable = sorted(posixpath.join(remote_root, rel) for rel in unreadable)
+        for path in plan.unreadable:
+            client._log(f"Cannot list remote directory '{path}', skipping it.")
+        _spare_unreadable(plan, unreadable, remote_root, local_root, upload)
+
+    client._log(
+        f"Mirror {'upload' if upload else 'download'}: {len(plan.transfers)} to transfer, "
+        f"{plan.unchanged} unchanged, {len(plan.make_dirs)} directories to create, "
+        f"{len(plan.deletes)} files and {len(plan.remove_dirs)} directories to delete."
+    )
+    if dry_run:
+        for path in plan.make_dirs:
+            client._log(f"  mkdir {path}")
+        for remote_path, local_path, _ in plan.transfers:
+            client._log(f"  {'put' if upload else 'get'} {local_path if upload else remote_path}")
+        for path in plan.deletes:
+            client._log(f"  delete {path}")
+        for path in plan.remove_dirs:
+            client._log(f"  rmdir {path}")
+        return plan
+
+    if not upload:
+        os.makedirs(local_root, exist_ok=True)
+    _apply(client, plan, upload, workers, retries)
+    return plan
+
+
+def _walk_remote(client, root):
+    """
+    Breadth-first walk, returns ({relpath: FTPEntry}, {reldirs},
+    {unreadable reldirs}), or (None, set(), set()) if the root itself
+    cannot be listed.
+    """
+    files, dirs, unreadable = {}, set(), set()
+    # the root is always listed fresh so a failure can be told from an empty tree
+    client.list_entries(root, refresh=True)
+    if not client._listing_complete:
+        return None, dirs, unreadable
+
+    pending = [""]
+    while pending:
+        rel = pending.pop(0)
+        entries = client.list_entries(posixpath.join(root, rel) if rel else root)
+        if not client._listing_complete:
+            # a failed listing looks empty; its contents are unknown, not gone
+            unreadable.add(rel)
+            continue
+        for entry in entries:
+            child = posixpath.join(rel, entry.name) if rel else entry.name
+            if entry.is_dir:
+                dirs.add(child)
+                pending.append(child)
+            elif entry.type == "file":
+                files[child] = entry
+    return files, dirs, unreadable
+
+
+def _walk_local(root):
+    """Returns ({relpath: (size, mtime)}, {reldirs}) with '/' separators."""
+    files, dirs = {}, set()
+    if not os.path.isdir(root):
+        return files, dirs
+    pending = [""]
+    while pending:
+        rel = pending.pop(0)
+        with os.scandir(os.path.join(root, rel) if rel else root) as it:
+            for item in it:
+                child = f"{rel}/{item.name}" if rel else item.name
+                if item.is_dir(follow_symlinks=False):
+                    dirs.add(child)
+                    pending.append(child)
+                elif item.is_file():
+                    st = item.stat()
+                    files[child] = (st.st_size, st.st_mtime)
+    return files, dirs
+
+
+def _spare_unreadable(plan, unreadable, remote_root, local_root, upload):
+    """Drop deletes at or below directories whose remote listing failed."""
+    if upload:
+        roots = [posixpath.join(remote_root, rel) for rel in unreadable]
+        below = lambda path, top: path == top or path.startswith(top.rstrip("/") + "/")
+    else:
+        roots = [_local_path(local_root, rel) for rel in unreadable]
+        below = lambda path, top: path == top or path.startswith(os.path.join(top, ""))
+    spared = lambda path: any(below(path, top) for top in roots)
+    plan.deletes = [path for path in plan.deletes if not spared(path)]
+    # an unreadable directory's parents are not empty either
+    plan.remove_dirs = [path for path in plan.remove_dirs
+                        if not spared(path) and not any(below(top, path) for top in roots)]
+
+
+def _local_path(local_root, rel):
+    return os.path.join(local_root, *rel.split("/"))
+
+
+def _remote_mtimes(client, remote_root, entries, exact_times):
+    """{relpath: timestamp or None} for the given {relpath: FTPEntry}."""
+    times, missing = {}, []
+    for rel, entry in entries.items():
+        if exact_times and entry.modify is not None:
+            times[rel] = entry.modify
+        else:
+            missing.append(rel)
+    if missing:
+        # LIST times are only good to the minute, ask the server, all
+        # MDTMs in one pipeline rather than a round trip each
+        found = client.mdtms(posixpath.join(remote_root, rel) for rel in missing)
+        for rel in missing:
+            times[rel] = found[posixpath.join(remote_root, rel)]
+    return times
+
+
+def _plan_download(client, remote_root, local_root, remote_files, remote_dirs,
+                   local_files, local_dirs, exact_times):
+    plan = MirrorPlan()
+    plan.make_dirs = sorted(_local_path(local_root, d) for d in remote_dirs - local_dirs)
+    # needed either way: downloaded files get the remote time so the
+    # next run sees them as unchanged
+    modify_times = _remote_mtimes(client, remote_root, remote_files, exact_times)
+
+    for rel, entry in sorted(remote_files.items()):
+        remote_path = posixpath.join(remote_root, rel)
+        local = local_files.get(rel)
+        modify = modify_times[rel]
+        if local is None or entry.size is None or local[0] != entry.size:
+            changed = True
+        else:
+            changed = modify is not None and abs(modify - local[1]) > MTIME_TOLERANCE
+        if changed:
+            plan.transfers.append((remote_path, _local_path(local_root, rel), modify))
+        else:
+            plan.unchanged += 1
+
+    plan.deletes = sorted(_local_path(local_root, f) for f in set(local_files) - set(remote_files))
+    plan.remove_dirs = sorted(
+        (_local_path(local_root, d) for d in local_dirs - remote_dirs), key=len, reverse=True
+    )
+    return plan
+
+
+def _plan_upload(client, remote_root, local_root, remote_files, remote_dirs,
+                 local_files, local_dirs, exact_times):
+    plan = MirrorPlan()
+    plan.make_dirs = sorted(posixpath.join(remote_root, d) for d in local_dirs - remote_dirs)
+    # only files whose sizes match need their times compared
+    same_size = {
+        rel: entry for rel, entry in remote_files.items()
+        if rel in local_files and entry.size is not None and entry.size == local_files[rel][0]
+    }
+    modify_times = _remote_mtimes(client, remote_root, same_size, exact_times)
+
+    for rel, (size, mtime) in sorted(local_files.items()):
+        remote_path = posixpath.join(remote_root, rel)
+        if rel not in same_size:
+            changed = True
+        else:
+            modify = modify_times[rel]
+            # the server stamps uploads with their upload time unless MFMT
+            # set it, so only a newer local file counts as a change
+            changed = modify is None or mtime - modify > MTIME_TOLERANCE
+        if changed:
+            plan.transfers.append((remote_path, _local_path(local_root, rel), mtime))
+        else:
+            plan.unchanged += 1
+
+    plan.deletes = sorted(posixpath.join(remote_root, f) for f in set(remote_files) - set(local_files))
+    plan.remove_dirs = sorted(
+        (posixpath.join(remote_root, d) for d in remote_dirs - local_dirs), key=len, reverse=True
+    )
+    return plan
+
+
+def _apply(client, plan, upload, workers, retries):
+    if upload:
+        for path in plan.make_dirs:
+            client.mkdir(path)
+    else:
+        for path in plan.make_dirs:
+            os.makedirs(path, exist_ok=True)
+
+    if plan.transfers:
+        queue = TransferQueue(client, workers, retries)
+        modify_times = {}
+        for remote_path, local_path, modify in plan.transfers:
+            if upload:
+                queue.add("put", remote_path, local_path)
+            else:
+                queue.add("get", remote_path, local_path)
+            modify_times[local_path] = modify
+        plan.failed = queue.run()
+
+        for transfer in queue.transfers:
+            modify = modify_times[transfer.local_path]
+            if not transfer.ok or modify is None:
+                continue
+            if upload:
+                # keep remote times comparable on the next run
+                client.set_mtime(transfer.remote_name, modify)
+            else:
+                os.utime(transfer.local_path, (modify, modify))
+
+    if upload:
+        client.delete_many(plan.deletes)
+    else:
+        for path in plan.deletes:
+            try:
+                os.remove(path)
+            except OSError as e:
+                client._log(f"Could not delete '{path}': {e}")
+
+    for path in plan.remove_dirs:
+        if upload:
+            client.rmdir(path)
+        else:
+            try:
+                os.rmdir(path)
+            except OSError as e:
+                client._log(f"Could not remove '{path}': {e}")
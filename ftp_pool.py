@@ -0,0 +1,193 @@
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeout(Exception):
+    """Raised when no session became available in time."""
+
+
+class FTPSessionPool:
+    """
+    A bounded set of logged-in FTP sessions that can be borrowed and
+    returned. `factory` is a callable returning a new logged-in session
+    (for example FTPClient.clone) or None if the connection failed.
+
+    Idle sessions are kept alive with NOOP, checked before being handed
+    out again, evicted once they have been idle for too long, and
+    replaced transparently when they turn out to be dead.
+    """
+
+    def __init__(self, factory, max_size=4, keepalive_interval=30.0,
+                 max_idle=300.0, health_check_after=10.0):
+        self.factory = factory
+        self.max_size = max_size
+        self.keepalive_interval = keepalive_interval
+        self.max_idle = max_idle
+        self.health_check_after = health_check_after
+
+        self._idle = deque()  # (session, last_used, last_checked)
+        self._in_use = set()
+        self._reserved = 0  # sessions that are idle, in use or being opened
+        self._lock = threading.Condition()
+        self._closed = False
+
+        self._keepalive_thread = None
+        if keepalive_interval:
+            self._keepalive_thread = threading.Thread(target=self._keepalive_loop, daemon=True)
+            self._keepalive_thread.start()
+
+    # checkout/checkin
+    def checkout(self, timeout=None):
+        """Borrow a healthy session, opening a new one if the pool has room."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            with self._lock:
+                session, last_checked = self._wait_for_slot(deadline)
+
+            if session is None:
+                session = self._connect()
+            elif time.monotonic() - last_checked > self.health_check_after and not self._healthy(session):
+                # dead or stale, reconnect in its place
+                self._discard(session)
+                session = self._connect()
+
+            if session is not None:
+                with self._lock:
+                    self._in_use.add(session)
+                return session
+
+            with self._lock:
+                self._reserved -= 1
+                self._lock.notify()
+            if deadline is not None and time.monotonic() >= deadline:
+                raise PoolTimeout("Could not open a new FTP session.")
+            time.sleep(0.5)
+
+    def checkin(self, session):
+        """Return a borrowed session. Broken sessions are dropped."""
+        with self._lock:
+            self._in_use.discard(session)
+            keep = not self._closed and session.connected
+            if keep:
+                now = time.monotonic()
+                self._idle.append((session, now, now))
+            else:
+                self._reserved -= 1
+            self._lock.notify()
+
+        if not keep:
+            self._discard(session)
+
+    def session(self, timeout=None):
+        """Context manager form of checkout/checkin."""
+        return _Borrowed(self, timeout)
+
+    def close(self):
+        """Close every idle session and refuse further checkouts."""
+        with self._lock:
+            self._closed = True
+            idle = [entry[0] for entry in self._idle]
+            self._idle.clear()
+            self._reserved -= len(idle)
+            self._lock.notify_all()
+
+        for session in idle:
+            self._discard(session)
+
+    @property
+    def size(self):
+        with self._lock:
+            return self._reserved
+
+    # internals
+    def _wait_for_slot(self, deadline):
+        # called with the lock held
+        while True:
+            if self._closed:
+                raise PoolTimeout("Session pool is closed.")
+            if self._idle:
+                # most recently used first, its connection is the warmest
+                session, _, last_checked = self._idle.pop()
+                return session, last_checked
+            if self._reserved < self.max_size:
+                self._reserved += 1
+                return None, 0.0
+
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise PoolTimeout("No FTP session available.")
+            self._lock.wait(remaining)
+
+    def _connect(self):
+        try:
+            return self.factory()
+        except Exception:
+            return None
+
+    @staticmethod
+    def _healthy(session):
+        try:
+            return session.connected and session.noop()
+        except Exception:
+            return False
+
+    @staticmethod
+    def _discard(session):
+        try:
+            if session.connected:
+                session.close()
+        except Exception:
+            pass
+
+    def _keepalive_loop(self):
+        while True:
+            time.sleep(self.keepalive_interval)
+            with self._lock:
+                if self._closed:
+                    return
+                now = time.monotonic()
+                expired, stale, fresh = [], [], deque()
+                for session, last_used, last_checked in self._idle:
+                    if now - last_used > self.max_idle:
+                        expired.append(session)
+                    elif now - last_checked >= self.keepalive_interval:
+                        stale.append((session, last_used))
+                    else:
+                        fresh.append((session, last_used, last_checked))
+                # taken out while we talk to them so nobody checks them out
+                self._idle = fresh
+                self._reserved -= len(expired)
+                if expired:
+                    self._lock.notify_all()
+
+            for session in expired:
+                self._discard(session)
+
+            for session, last_used in stale:
+                alive = self._healthy(session)
+                with self._lock:
+                    keep = alive and not self._closed
+                    if keep:
+                        self._idle.appendleft((session, last_used, time.monotonic()))
+                    else:
+                        self._reserved -= 1
+                        self._lock.notify()
+                if not keep:
+                    self._discard(session)
+
+
+class _Borrowed:
+    def __init__(self, pool, timeout):
+        self.pool = pool
+        self.timeout = timeout
+        self.session = None
+
+    def __enter__(self):
+        self.session = self.pool.checkout(self.timeout)
+        return self.session
+
+    def __exit__(self, exc_type, exc, tb):
+        self.pool.checkin(self.session)
+        return False
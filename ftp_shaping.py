@@ -0,0 +1,350 @@
+import heapq
+import itertools
+import re
+import threading
+import time
+
+# smallest and largest piece of data let through per token request; a
+# transfer of weight w asks for w times the base piece, so under
+# contention it gets about w times the share of the others
+MIN_GRANT = 4 * 1024
+MAX_GRANT = 256 * 1024
+
+# how often the schedule is consulted, in seconds
+SCHEDULE_CHECK = 1.0
+
+# transfer weights are kept in this range
+MAX_WEIGHT = 16
+
+_RATE_RE = re.compile(r"(\d+(?:\.\d+)?)\s*([KMG]?)(?:i?B)?(?:/s)?$", re.IGNORECASE)
+_WINDOW_RE = re.compile(
+    r"(?:(\w{3})(?:-(\w{3}))?\s+)?(\d{1,2}):(\d\d)-(\d{1,2}):(\d\d)\s+(\S+)$", re.IGNORECASE
+)
+_DAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+def parse_rate(text):
+    """
+    Bytes per second from "500K", "2M", "1.5MiB/s" or a plain number;
+    None for "off", "none", "unlimited" or 0. Raises ValueError.
+    """
+    text = str(text).strip()
+    if text.lower() in ("off", "none", "unlimited", "0"):
+        return None
+    match = _RATE_RE.match(text)
+    if not match:
+        raise ValueError(f"Not a rate: {text!r} (try 500K, 2M or off)")
+    rate = float(match.group(1)) * _UNITS[match.group(2).upper()]
+    return rate or None
+
+
+def format_rate(rate):
+    if rate is None:
+        return "unlimited"
+    for unit in ("G", "M", "K"):
+        if rate >= _UNITS[unit]:
+            return f"{rate / _UNITS[unit]:g}{unit}/s"
+    return f"{rate:g}B/s"
+
+
+class TokenBucket:
+    """
+    Token bucket for one rate limit, shared by the threads it limits.
+    Takers run into debt and sleep it off, so the average rate holds
+    however large the pieces are; idle time earns at most `burst` bytes.
+    A rate of None lets everything through.
+    """
+
+    def __init__(self, rate=None, burst=None):
+        self.lock = threading.Lock()
+        self.allowance = 0.0
+        self.updated = time.monotonic()
+        self.burst = burst
+        self.rate = None
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        with self.lock:
+            self.rate = float(rate) if rate else None
+            self.allowance = min(self.allowance, 0.0)
+            self.updated = time.monotonic()
+
+    def grant(self):
+        """Size of piece worth asking for at this rate."""
+        if self.rate is None:
+            return MAX_GRANT
+        return max(MIN_GRANT, min(MAX_GRANT, int(self.rate / 50)))
+
+    def debit(self, nbytes, piece=0):
+        """
+        Take nbytes without sleeping, returns how long the taker has to
+        wait until the bucket has paid for them. Idle time is banked up to
+        the burst, or up to `piece` for takers of larger (weighted) pieces.
+        """
+        with self.lock:
+            if self.rate is None:
+                return 0.0
+            now = time.monotonic()
+            burst = max(self.burst if self.burst is not None else self.grant(), piece)
+            self.allowance = min(self.allowance + (now - self.updated) * self.rate, burst)
+            self.updated = now
+            self.allowance -= nbytes
+            return -self.allowance / self.rate if self.allowance < 0 else 0.0
+
+    def consume(self, nbytes, piece=0):
+        """Take nbytes, sleeping until the bucket can pay for them. Returns the time slept."""
+        wait = self.debit(nbytes, piece)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class RateSchedule:
+    """
+    Global rate by time of day, e.g. capped during business hours and
+    unlimited at night:
+
+        RateSchedule.parse(["mon-fri 09:00-18:00 2M", "sat 10:00-14:00 5M"])
+
+    A window without days applies every day; one ending before it starts
+    runs past midnight. Outside every window rate_at() returns None, and
+    the shaper falls back to its own global rate.
+    """
+
+    def __init__(self, windows=()):
+        self.windows = list(windows)  # (days, start minute, end minute, rate)
+
+    @classmethod
+    def parse(cls, lines):
+        if isinstance(lines, str):
+            lines = [part for part in lines.split(",") if part.strip()]
+        windows = []
+        for line in lines:
+            match = _WINDOW_RE.match(line.strip())
+            if not match:
+                raise ValueError(f"Not a schedule window: {line!r} (try 'mon-fri 09:00-18:00 2M')")
+            first, last, h1, m1, h2, m2, rate = match.groups()
+            windows.append((_day_range(first, last), int(h1) * 60 + int(m1), int(h2) * 60 + int(m2),
+                            parse_rate(rate)))
+        return cls(windows)
+
+    def rate_at(self, when=None):
+        """(matched, rate) for a time.struct_time, now by default."""
+        when = when or time.localtime()
+        minute = when.tm_hour * 60 + when.tm_min
+        for days, start, end, rate in self.windows:
+            if start <= end:
+                if when.tm_wday in days and start <= minute < end:
+                    return True, rate
+            # past midnight: the early part belongs to the previous day's window
+            elif (when.tm_wday in days and minute >= start) or \
+                    ((when.tm_wday - 1) % 7 in days and minute < end):
+                return True, rate
+        return False, None
+
+    def describe(self):
+        lines = []
+        for days, start, end, rate in self.windows:
+            if len(days) == 7:
+                label = "daily"
+            elif len(days) == 1:
+                label = _DAYS[days[0]]
+            else:
+                label = f"{_DAYS[days[0]]}-{_DAYS[days[-1]]}"
+            lines.append(f"{label} {start // 60:02d}:{start % 60:02d}-{end // 60:02d}:{end % 60:02d} "
+                         f"{format_rate(rate)}")
+        return lines
+
+
+class Shaper:
+    """
+    Rate limits for data connections at three levels: one global bucket
+    (optionally following a RateSchedule), a bucket per server host, and
+    a limit for each single transfer. A client and its pooled sessions
+    share one shaper; wrap() puts a data socket under it.
+    """
+
+    def __init__(self, rate=None, host_rate=None, transfer_rate=None, schedule=None):
+        self.rate = rate  # global limit outside schedule windows
+        self.host_rate = host_rate  # default for hosts without their own
+        self.host_rates = {}
+        self.transfer_rate = transfer_rate
+        self.schedule = schedule
+        self.global_bucket = TokenBucket(rate)
+        self._host_buckets = {}
+        self._lock = threading.Lock()
+        self._next_check = 0.0
+
+    def set_rate(self, rate):
+        self.rate = rate
+        self._next_check = 0.0
+        self._apply_schedule()
+
+    def set_schedule(self, schedule):
+        self.schedule = schedule
+        self._next_check = 0.0
+        self._apply_schedule()
+
+    def set_host_rate(self, host, rate):
+        with self._lock:
+            self.host_rates[host] = rate
+            if host in self._host_buckets:
+                self._host_buckets[host].set_rate(rate)
+
+    def current_rate(self):
+        """Global rate in force right now."""
+        self._apply_schedule()
+        return self.global_bucket.rate
+
+    def buckets(self, host):
+        """Shared buckets a transfer to host has to pass, global first."""
+        self._apply_schedule()
+        with self._lock:
+            bucket = self._host_buckets.get(host)
+            if bucket is None:
+                bucket = self._host_buckets[host] = TokenBucket(self.host_rates.get(host, self.host_rate))
+        return [self.global_bucket, bucket]
+
+    def wrap(self, sock, host, weight=1, metrics=None, direction="recv"):
+        """Socket-like object that spends tokens for everything sent or received."""
+        buckets = self.buckets(host)
+        if self.transfer_rate:
+            buckets.append(TokenBucket(self.transfer_rate))
+        return ShapedSocket(sock, self, buckets, weight, metrics, direction)
+
+    def describe(self):
+        lines = [
+            f"Global: {format_rate(self.current_rate())}"
+            + (f" (default {format_rate(self.rate)})" if self.schedule else ""),
+            f"Per host: {format_rate(self.host_rate)}",
+        ]
+        lines += [f"  {host}: {format_rate(rate)}" for host, rate in sorted(self.host_rates.items())]
+        lines.append(f"Per transfer: {format_rate(self.transfer_rate)}")
+        if self.schedule:
+            lines.append("Schedule:")
+            lines += [f"  {line}" for line in self.schedule.describe()]
+        return lines
+
+    def _apply_schedule(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + SCHEDULE_CHECK
+        rate = self.rate
+        if self.schedule is not None:
+            matched, scheduled = self.schedule.rate_at()
+            if matched:
+                rate = scheduled
+        if rate != self.global_bucket.rate:
+            self.global_bucket.set_rate(rate)
+
+
+class ShapedSocket:
+    """
+    A data socket whose reads and writes are paid for from token
+    buckets. Calls are cut into pieces of the transfer's grant size, so
+    a weight-w transfer takes w pieces for every one of a weight-1
+    transfer while they compete for a bucket. Anything else is passed
+    to the socket.
+    """
+
+    def __init__(self, sock, shaper, buckets, weight=1, metrics=None, direction="recv"):
+        self._sock = sock
+        self._shaper = shaper
+        self._buckets = buckets
+        self._weight = max(1, min(MAX_WEIGHT, int(weight)))
+        self._metrics = metrics
+        self._direction = direction
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._sock.close()
+
+    def recv(self, bufsize, *flags):
+        data = self._sock.recv(min(bufsize, self._grant()), *flags)
+        self._pay(len(data))
+        return data
+
+    def recv_into(self, buffer, nbytes=0, *flags):
+        n = self._sock.recv_into(buffer, min(nbytes or len(buffer), self._grant()), *flags)
+        self._pay(n)
+        return n
+
+    def sendall(self, data, *flags):
+        view = memoryview(data).cast("B")
+        pos = 0
+        while pos < len(view):
+            piece = view[pos:pos + self._grant()]
+            self._sock.sendall(piece, *flags)
+            self._pay(len(piece))
+            pos += len(piece)
+
+    def sendfile(self, file, offset=0, count=None):
+        sent = self._sock.sendfile(file, offset, min(count or self._grant(), self._grant()))
+        self._pay(sent)
+        return sent
+
+    def _grant(self):
+        return min(bucket.grant() for bucket in self._buckets) * self._weight
+
+    def _pay(self, nbytes):
+        if not nbytes:
+            return
+        self._shaper._apply_schedule()
+        # every bucket is paid at once and refills while we sleep, so the
+        # slowest one sets the wait; sleeping for each in turn would stack them
+        piece = self._grant()
+        waited = max(bucket.debit(nbytes, piece) for bucket in self._buckets)
+        if waited > 0:
+            time.sleep(waited)
+        if waited and self._metrics is not None:
+            self._metrics.increment("throttled_seconds_total", waited, direction=self._direction)
+
+
+class FairScheduler:
+    """
+    Weighted fair order for queued transfers, smallest finish tag first.
+    A transfer's tag is the virtual time when it was queued plus its
+    size divided by its weight, so small and high-priority files go
+    first, while a big file queued early still goes ahead of small ones
+    that arrive much later. Thread-safe; get() returns None when empty.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._lock = threading.Lock()
+        self._order = itertools.count()
+        self.virtual_time = 0.0
+
+    def put(self, item, size=None, weight=1):
+        cost = (size if size is not None else MAX_GRANT) / max(1, weight)
+        with self._lock:
+            heapq.heappush(self._heap, (self.virtual_time + cost, next(self._order), item))
+
+    def get(self):
+        with self._lock:
+            if not self._heap:
+                return None
+            tag, _, item = heapq.heappop(self._heap)
+            self.virtual_time = max(self.virtual_time, tag)
+            return item
+
+    def __len__(self):
+        return len(self._heap)
+
+
+def _day_range(first, last):
+    if first is None:
+        return tuple(range(7))
+    try:
+        start = _DAYS.index(first[:3].lower())
+        end = _DAYS.index((last or first)[:3].lower())
+    except ValueError:
+        raise ValueError(f"Unknown day in {first}-{last}, use mon..sun")
+    return tuple((start + i) % 7 for i in range((end - start) % 7 + 1))
@@ -0,0 +1,241 @@
+import fnmatch
+import glob
+import os
+import threading
+import time
+
+from ftp_pool import PoolTimeout
+from ftp_shaping import FairScheduler
+
+
+class Transfer:
+    """One queued file transfer and its outcome."""
+
+    def __init__(self, direction, remote_name, local_path, size=None, priority=1):
+        self.direction = direction  # "get" or "put"
+        self.remote_name = remote_name
+        self.local_path = local_path
+        self.size = size  # expected bytes, None if unknown
+        self.priority = priority  # scheduling and bandwidth weight, 1 and up
+        self.attempts = 0
+        self.bytes = 0
+        self.elapsed = 0.0
+        self.ok = False
+        self.error = None
+        self.journal_id = None  # its row in the TransferQueue's journal, if any
+        self.resume = False
+
+    def __repr__(self):
+        return f"<Transfer {self.direction} {self.remote_name}>"
+
+
+class TransferQueue:
+    """
+    A queue of file transfers drained by a pool of worker sessions
+    borrowed from the client's session pool. Each file is retried on its
+    own, and run() reports aggregate throughput and any failures.
+
+    Transfers are handed out in weighted fair order (see FairScheduler):
+    small and high-priority files first. While a transfer runs under the
+    client's shaper, its priority is also its share of the bandwidth.
+
+    With a TransferJournal, every transfer is recorded there as it goes,
+    so what this process does not finish is resumed by the next one;
+    transfers the journal has as done and unchanged are skipped.
+    """
+
+    def __init__(self, client, workers=4, retries=2, journal=None):
+        self.client = client
+        self.workers = max(1, workers)
+        self.retries = retries
+        self.journal = journal
+        self.transfers = []
+        self._queue = FairScheduler()
+        self._done = 0
+        self._lock = threading.Lock()
+
+    def add(self, direction, remote_name, local_path, size=None, priority=1):
+        """Queue a transfer and return it, None if the journal has it as done and unchanged."""
+        if size is None and direction == "put":
+            try:
+                size = os.path.getsize(local_path)
+            except OSError:
+                pass
+        transfer = Transfer(direction, remote_name, local_path, size, priority)
+        if self.journal is not None:
+            transfer.journal_id, queued = self.journal.add(
+                self.client, direction, remote_name, local_path, size, priority
+            )
+            if not queued and self.journal.get(transfer.journal_id).state == "done":
+                self.client._log(f"{direction} {remote_name}: unchanged since it was transferred, skipped.")
+                return None
+        self.transfers.append(transfer)
+        self._queue.put(transfer, size, priority)
+        return transfer
+
+    def run(self):
+        """Transfer everything queued. Returns the list of failed transfers."""
+        if not self.transfers:
+            self.client._log("Nothing to transfer.")
+            return []
+
+        remote_dir = self.client.pwd()
+        pool = self.client.get_pool(self.workers)
+        start = time.time()
+
+        threads = [
+            threading.Thread(target=self._worker, args=(pool, remote_dir), daemon=True)
+            for _ in range(min(self.workers, len(self.transfers)))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self._report(time.time() - start)
+        return [t for t in self.transfers if not t.ok]
+
+    def _worker(self, pool, remote_dir):
+        transfer = self._next()
+        while transfer is not None:
+            try:
+                with pool.session(timeout=60.0) as session:
+                    if remote_dir:
+                        session.cd(remote_dir)
+                    # keep the same session for as long as it stays healthy
+                    while transfer is not None and session.connected:
+                        self._run_one(session, transfer)
+                        transfer = self._next()
+            except PoolTimeout as e:
+                transfer.error = str(e)
+                self._finish(transfer)
+                transfer = self._next()
+
+    def _next(self):
+        return self._queue.get()
+
+    def _run_one(self, session, transfer):
+        progress = None
+        if transfer.journal_id is not None:
+            if not transfer.attempts:
+                entry = self.journal.start(transfer.journal_id)
+                if entry is None:
+                    transfer.error = "being transferred by another runner"
+                    self._finish(transfer)
+                    return
+                # a journaled item with progress is partial output of an earlier run
+                transfer.resume = entry.attempts > 1 or entry.offset > 0
+            progress = self.journal.recorder(transfer.journal_id)
+
+        while transfer.attempts <= self.retries and session.connected:
+            transfer.attempts += 1
+            if transfer.attempts > 1:
+                self.client.metrics.increment("retries_total", operation=transfer.direction)
+            start = time.time()
+            session.priority = transfer.priority
+            try:
+                if transfer.direction == "get":
+                    ok = session.get(transfer.remote_name, transfer.local_path,
+                                     resume=transfer.resume, progress=progress)
+                else:
+                    ok = session.put(transfer.local_path, transfer.remote_name,
+                                     resume=transfer.resume, progress=progress)
+            finally:
+                session.priority = 1
+            transfer.elapsed += time.time() - start
+            if ok:
+                transfer.ok = True
+                transfer.error = None
+                transfer.bytes = os.path.getsize(transfer.local_path)
+                break
+            transfer.error = f"{transfer.direction} failed"
+
+        if not transfer.ok and not session.connected:
+            if transfer.attempts <= self.retries:
+                # the session died, not the file; retry on another one
+                self._queue.put(transfer, transfer.size, transfer.priority)
+                return
+            transfer.error = "session lost"
+        if transfer.journal_id is not None:
+            if transfer.ok:
+                self.journal.record_done(transfer.journal_id, session, transfer.local_path,
+                                         transfer.remote_name)
+            else:
+                # left pending with a backoff, for the next run to resume
+                self.journal.failed(transfer.journal_id, transfer.error)
+        self._finish(transfer)
+
+    def _finish(self, transfer):
+        self.client.metrics.observe(
+            "transfer_retries", max(transfer.attempts - 1, 0), operation=transfer.direction
+        )
+        with self._lock:
+            self._done += 1
+            done = self._done
+        status = "ok" if transfer.ok else f"FAILED ({transfer.error})"
+        self.client._log(
+            f"[{done}/{len(self.transfers)}] {transfer.direction} {transfer.remote_name}: {status}"
+        )
+
+    def _report(self, elapsed):
+        ok = [t for t in self.transfers if t.ok]
+        failed = [t for t in self.transfers if not t.ok]
+        total = sum(t.bytes for t in ok)
+        elapsed = max(elapsed, 1e-6)
+
+        self.client._log(
+            f"{len(ok)} of {len(self.transfers)} files transferred, "
+            f"{total} bytes in {elapsed:.2f}s ({total / elapsed / 1024:.1f} KiB/s, "
+            f"{len(ok) / elapsed:.1f} files/s, {self.workers} workers)."
+        )
+        if failed:
+            self.client._log("Failed transfers:")
+            for t in failed:
+                self.client._log(f"  {t.direction} {t.remote_name}: {t.error} after {t.attempts} attempt(s)")
+
+
+def match_remote(client, patterns):
+    """Sorted remote names in the current directory matching any of the glob patterns."""
+    names = client.name_list()
+    return sorted({n for n in names for p in patterns if fnmatch.fnmatch(n, p)})
+
+
+def match_local(patterns):
+    """Sorted local files matching any of the glob patterns."""
+    return sorted({f for p in patterns for f in glob.glob(p) if os.path.isfile(f)})
+
+
+def mget(client, patterns, workers=4, retries=2, local_dir=".", journal=None):
+    """
+    Download every remote file matching any of the glob patterns,
+    recording them in journal if given (see TransferQueue). Returns
+    (number of files matched, failed transfers).
+    """
+    matched = match_remote(client, patterns)
+    if not matched:
+        client._log("No remote files match.")
+        return 0, []
+
+    transfers = TransferQueue(client, workers, retries, journal)
+    # sizes let the queue start with the small files
+    sizes = client.sizes(matched)
+    for name in matched:
+        transfers.add("get", name, os.path.join(local_dir, name), sizes.get(name))
+    return len(matched), transfers.run()
+
+
+def mput(client, patterns, workers=4, retries=2, journal=None):
+    """
+    Upload every local file matching any of the glob patterns,
+    recording them in journal if given (see TransferQueue). Returns
+    (number of files matched, failed transfers).
+    """
+    matched = match_local(patterns)
+    if not matched:
+        client._log("No local files match.")
+        return 0, []
+
+    transfers = TransferQueue(client, workers, retries, journal)
+    for path in matched:
+        transfers.add("put", os.path.basename(path), path)
+    return len(matched), transfers.run()
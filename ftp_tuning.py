@@ -0,0 +1,107 @@
+import functools
+import socket
+
+# read/recv chunk limits for data connections
+MIN_CHUNK = 64 * 1024
+MAX_CHUNK = 4 * 1024 * 1024
+DEFAULT_CHUNK = 256 * 1024
+
+# socket buffers are never asked to exceed this
+MAX_SOCKET_BUFFER = 64 * 1024 * 1024
+
+# assumed before any transfer was measured (100 Mbit/s), and the floor
+# for the round trip so loopback and LAN links still get sane numbers
+INITIAL_RATE = 12.5 * 1024 * 1024
+MIN_RTT = 0.001
+
+# transfers shorter than this say more about latency than about the link
+MIN_SAMPLE_BYTES = 1024 * 1024
+
+# autotuning ceiling assumed where the kernel cannot be asked
+FALLBACK_AUTOTUNE_LIMIT = 4 * 1024 * 1024
+
+
+class DataTuner:
+    """
+    Picks socket buffer and chunk sizes for data connections from the
+    control round trip and the throughput of recent transfers. One tuner
+    is shared by a client and its pooled sessions.
+
+    Socket buffers are only set when the bandwidth-delay product is more
+    than the kernel's own autotuning would reach, since setting them
+    switches autotuning off. They are sized at twice the product, so a
+    transfer held back by its window measures a higher rate and the next
+    one gets a bigger buffer, until the link is the limit.
+    """
+
+    def __init__(self):
+        self.rate = None  # smoothed bytes/s of recent large transfers
+        self.last_buffer = None  # what the kernel granted for the last data socket
+
+    def record(self, nbytes, seconds):
+        """Feed the throughput of a finished transfer back in."""
+        if nbytes < MIN_SAMPLE_BYTES or seconds <= 0:
+            return
+        sample = nbytes / seconds
+        self.rate = sample if self.rate is None else 0.7 * self.rate + 0.3 * sample
+
+    def socket_buffer(self, rtt, direction="recv"):
+        """Buffer size for a new data socket, None to leave it to the kernel."""
+        want = min(int((self.rate or INITIAL_RATE) * max(rtt or 0.0, MIN_RTT) * 2), MAX_SOCKET_BUFFER)
+        autotune, settable = _kernel_limits(direction)
+        if want <= autotune or (settable is not None and settable <= autotune):
+            return None
+        return want
+
+    def configure(self, sock, rtt, direction="recv", override=None):
+        """
+        Size the buffers of an unconnected data socket; the receive
+        window scale is fixed at connect time. override is a size in
+        bytes, or 0 to keep the kernel defaults.
+        """
+        size = self.socket_buffer(rtt, direction) if override is None else override
+        option = socket.SO_RCVBUF if direction == "recv" else socket.SO_SNDBUF
+        if size:
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, option, size)
+            except OSError:
+                pass
+        try:
+            self.last_buffer = sock.getsockopt(socket.SOL_SOCKET, option)
+        except OSError:
+            self.last_buffer = None
+
+    def chunk_size(self):
+        """Starting read size: about 10 ms of data at the measured rate."""
+        if self.rate is None:
+            return DEFAULT_CHUNK
+        target = max(MIN_CHUNK, min(MAX_CHUNK, int(self.rate / 100)))
+        return 1 << (target.bit_length() - 1)
+
+    def describe(self, rtt):
+        rate = f"{self.rate / 1024 / 1024:.1f} MiB/s" if self.rate else "not measured yet"
+        wanted = self.socket_buffer(rtt)
+        return (
+            f"throughput {rate}, control RTT "
+            f"{'%.1f ms' % (rtt * 1000) if rtt else 'unknown'}, "
+            f"receive buffer {'kernel autotuning' if wanted is None else f'{wanted} bytes'}, "
+            f"last granted {self.last_buffer}, chunk {self.chunk_size()} bytes"
+        )
+
+
+@functools.lru_cache(maxsize=None)
+def _kernel_limits(direction):
+    """
+    (autotuning ceiling, largest settable buffer) in bytes. Linux reports
+    both under /proc; elsewhere the ceiling is a typical default and the
+    settable size is unknown (None).
+    """
+    tcp, core = ("tcp_rmem", "rmem_max") if direction == "recv" else ("tcp_wmem", "wmem_max")
+    try:
+        with open(f"/proc/sys/net/ipv4/{tcp}") as f:
+            autotune = int(f.read().split()[2])
+        with open(f"/proc/sys/net/core/{core}") as f:
+            settable = int(f.read())
+        return autotune, settable
+    except (OSError, ValueError, IndexError):
+        return FALLBACK_AUTOTUNE_LIMIT, None
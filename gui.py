@@ -1,8 +1,26 @@
+import itertools
 import os
+import queue
+import threading
+import time
 import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
 from tkinter import ttk, messagebox, simpledialog
 
-from ftp_client import FTPClient
+from ftp_client import FTPClient, TransferCancelled
+from ftp_journal import TransferJournal, journal_path
+from ftp_pool import PoolTimeout
+from gui_panel import FilePanel, format_size
+from local_dir import DirectoryWatcher, stat_entry
+
+# transfers run in parallel on pooled sessions
+TRANSFER_WORKERS = 3
+# how often the Tk thread drains results from worker threads
+POLL_INTERVAL_MS = 100
+# remote entries handed to the Tk thread at a time while a listing streams
+LISTING_BATCH = 1000
+# how often the local directory is checked for outside changes
+LOCAL_POLL_MS = 2000
 
 
 class LoginDialog(simpledialog.Dialog):
@@ -26,22 +44,212 @@ class LoginDialog(simpledialog.Dialog):
         self.result = (username, password)
 
 
+class TransferJob:
+    """One queued transfer and its live progress, shared between threads."""
+
+    def __init__(self, job_id, direction, remote_name, local_path, remote_dir, total=None,
+                 journal_id=None):
+        self.id = job_id
+        self.direction = direction  # "get" or "put"
+        self.remote_name = remote_name
+        self.local_path = local_path
+        self.remote_dir = remote_dir
+        self.total = total
+        self.done = 0
+        self.rate = 0.0
+        self.state = "queued"  # queued, running, done, failed, cancelled
+        self.paused = False
+        self.cancelled = False
+        self.keep_queued = False  # cancelled by quit/disconnect, resumed after the next login
+        self.journal_id = journal_id  # its row in the transfer journal, once recorded
+        self.from_journal = journal_id is not None
+        self.resume = False
+        self._resume = threading.Event()
+        self._resume.set()
+        self._sample = (time.monotonic(), 0)
+
+    @property
+    def finished(self):
+        return self.state in ("done", "failed", "cancelled")
+
+    def pause(self):
+        if not self.finished:
+            self.paused = True
+            self._resume.clear()
+
+    def resume(self):
+        self.paused = False
+        self._resume.set()
+
+    def cancel(self, keep_queued=False):
+        self.cancelled = True
+        self.keep_queued = keep_queued
+        self._resume.set()
+
+    def eta(self):
+        if not self.total or self.rate <= 0 or self.paused:
+            return None
+        return max(self.total - self.done, 0) / self.rate
+
+
+class TransferManager:
+    """
+    Runs transfers on worker threads, each on a session borrowed from the
+    client's pool, so the Tk thread never blocks on the network. Progress
+    is written to the TransferJob objects and completion is announced on
+    the `events` queue that the GUI drains with root.after. With a
+    TransferJournal every job is recorded there too, so transfers cut
+    short by quitting are picked up again by resume_unfinished().
+    """
+
+    def __init__(self, client, events, workers=TRANSFER_WORKERS, journal=None):
+        self.client = client
+        self.events = events
+        self.workers = workers
+        self.journal = journal
+        self.jobs = {}
+        self._ids = itertools.count(1)
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+
+    def submit(self, direction, remote_name, local_path, remote_dir, total=None, journal_id=None):
+        job = TransferJob(next(self._ids), direction, remote_name, local_path, remote_dir, total, journal_id)
+        self.jobs[job.id] = job
+        pool = self.client.get_pool(self.workers)
+        self._executor.submit(self._run, job, pool)
+        return job
+
+    def resume_unfinished(self):
+        """Submit the journal's unfinished transfers for the client's server. Returns how many."""
+        if self.journal is None:
+            return 0
+        now = time.time()
+        running = {job.journal_id for job in self.jobs.values() if not job.finished}
+        entries = [
+            entry for entry in self.journal.unfinished(self.client)
+            # active ones with a live lease belong to another process
+            if entry.id not in running and (entry.state == "pending" or entry.lease_until < now)
+        ]
+        for entry in entries:
+            self.submit(entry.direction, entry.remote, entry.local, None, entry.size, entry.id)
+        return len(entries)
+
+    def cancel_all(self, keep_queued=False):
+        for job in self.jobs.values():
+            job.cancel(keep_queued)
+
+    def _run(self, job, pool):
+        if job.cancelled:
+            if job.from_journal and not job.keep_queued:
+                self.journal.remove(job.journal_id)
+            job.state = "cancelled"
+            self.events.put(("finished", job))
+            return
+
+        job.state = "running"
+        try:
+            with pool.session(timeout=60.0) as session:
+                if job.remote_dir:
+                    session.cd(job.remote_dir)
+                progress = lambda done, total: self._progress(job, done, total)
+                item = self._journal_start(session, job)
+                if item is not None:
+                    progress = self.journal.recorder(item.id, progress)
+                elif job.from_journal:
+                    self.events.put(("log", f"'{job.remote_name}' is being transferred by another process."))
+                    job.state = "failed"
+                    self.events.put(("finished", job))
+                    return
+                if job.direction == "get":
+                    ok = session.get(job.remote_name, job.local_path, resume=job.resume, progress=progress)
+                else:
+                    ok = session.put(job.local_path, job.remote_name, resume=job.resume, progress=progress)
+                if item is not None:
+                    self._journal_finish(session, job, item, ok)
+            job.state = "done" if ok else ("cancelled" if job.cancelled else "failed")
+        except (PoolTimeout, OSError) as e:
+            # no session could be had, or its connection broke mid-command
+            self.events.put(("log", f"Transfer of '{job.remote_name}' failed: {e}"))
+            job.state = "failed"
+        job.rate = 0.0
+        self.events.put(("finished", job))
+
+    def _journal_start(self, session, job):
+        """Record job in the journal and mark it active; None without a journal or if that failed."""
+        if self.journal is None:
+            return None
+        if job.journal_id is None:
+            job.journal_id, _ = self.journal.add(session, job.direction, job.remote_name, job.local_path,
+                                                 job.total)
+        item = self.journal.start(job.journal_id)
+        # partial output of an earlier attempt is continued, not redone
+        if item is not None and (item.attempts > 1 or item.offset > 0):
+            job.resume = True
+        return item
+
+    def _journal_finish(self, session, job, item, ok):
+        if ok:
+            self.journal.record_done(item.id, session, job.local_path, job.remote_name)
+        elif job.cancelled and job.keep_queued:
+            self.journal.release(item.id)
+        elif job.cancelled:
+            self.journal.remove(item.id)
+        else:
+            self.journal.failed(item.id, f"{job.direction} failed")
+
+    @staticmethod
+    def _progress(job, done, total):
+        # runs on the worker thread between chunks
+        if job.paused:
+            job.rate = 0.0
+            job._resume.wait()
+            job._sample = (time.monotonic(), done)
+        if job.cancelled:
+            raise TransferCancelled()
+
+        job.done = done
+        if total:
+            job.total = total
+        now = time.monotonic()
+        since, done_then = job._sample
+        if now - since >= 0.5:
+            instant = (done - done_then) / (now - since)
+            job.rate = instant if job.rate <= 0 else 0.7 * job.rate + 0.3 * instant
+            job._sample = (now, done)
+
+
 class FTPClientGUI:
     def __init__(self, root):
         self.root = root
         self.root.title("FTP Client GUI")
 
-        # FTP client in GUI mode
+        # results from worker threads, drained on the Tk thread
+        self.events = queue.Queue()
+
+        # FTP client in GUI mode; it logs from worker threads too
         self.client = FTPClient(is_gui=True)
-        self.client.set_output_callback(self.append_log)
+        self.client.set_output_callback(lambda message: self.events.put(("log", message)))
+
+        # browsing commands share one control connection, so they run
+        # one at a time on a single background thread
+        self.browser = ThreadPoolExecutor(max_workers=1)
+        # local scans get their own thread so a slow (network) disk never
+        # holds up remote browsing, and vice versa
+        self.local_scanner = ThreadPoolExecutor(max_workers=1)
+        # transfers are recorded in the journal, so those cut short by
+        # quitting carry on after the next login
+        self.journal = TransferJournal(journal_path())
+        self.transfers = TransferManager(self.client, self.events, journal=self.journal)
 
         # Track local directory
         self.local_path = os.getcwd()
-        self.remote_entries = []  # list of dicts
-        self.local_entries = []   # list of filenames
+        self.local_watcher = DirectoryWatcher(self.local_path)
+        self._local_check_running = False
+        self.remote_path = None
 
         self._build_widgets()
         self.refresh_local_files()
+        self.root.after(POLL_INTERVAL_MS, self._poll_events)
+        self.root.after(LOCAL_POLL_MS, self._poll_local)
 
     def _build_widgets(self):
         #  Top connection bar 
@@ -78,35 +286,79 @@ class FTPClientGUI:
         self.response_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         resp_scroll.pack(side=tk.RIGHT, fill=tk.Y)
 
-        # Column 2: Remote files (scrollable listbox)
-        remote_frame = ttk.Frame(main_frame)
-        remote_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=(0, 5))
-
-        ttk.Label(remote_frame, text="Remote Files").pack(anchor="w")
-        self.remote_listbox = tk.Listbox(remote_frame, activestyle="dotbox")
-        remote_scroll = ttk.Scrollbar(remote_frame, orient=tk.VERTICAL, command=self.remote_listbox.yview)
-        self.remote_listbox.configure(yscrollcommand=remote_scroll.set)
-
-        self.remote_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        remote_scroll.pack(side=tk.RIGHT, fill=tk.Y)
-
-        # Double-click on remote file/dir
-        self.remote_listbox.bind("<Double-Button-1>", self.on_remote_double_click)
-
-        # Column 3: Local files (scrollable listbox)
-        local_frame = ttk.Frame(main_frame)
-        local_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-
-        ttk.Label(local_frame, text="Local Files").pack(anchor="w")
-        self.local_listbox = tk.Listbox(local_frame, activestyle="dotbox")
-        local_scroll = ttk.Scrollbar(local_frame, orient=tk.VERTICAL, command=self.local_listbox.yview)
-        self.local_listbox.configure(yscrollcommand=local_scroll.set)
-
-        self.local_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        local_scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        # Column 2: Remote files; double-click opens a dir or downloads a file
+        self.remote_panel = FilePanel(main_frame, "Remote Files", on_open=self.on_remote_open)
+        self.remote_panel.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=(0, 5))
+
+        # Column 3: Local files; double-click uploads
+        self.local_panel = FilePanel(main_frame, "Local Files", on_open=self.on_local_open)
+        self.local_panel.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.watch_local = tk.BooleanVar(value=True)
+        ttk.Checkbutton(self.local_panel.header, text="Watch", variable=self.watch_local).pack(side=tk.RIGHT, padx=5)
+
+        # Transfers panel
+        transfer_frame = ttk.Frame(self.root)
+        transfer_frame.pack(side=tk.TOP, fill=tk.X, padx=5, pady=(0, 5))
+
+        header = ttk.Frame(transfer_frame)
+        header.pack(fill=tk.X)
+        ttk.Label(header, text="Transfers").pack(side=tk.LEFT)
+        ttk.Button(header, text="Clear Finished", command=self.on_clear_transfers).pack(side=tk.RIGHT)
+        ttk.Button(header, text="Cancel", command=self.on_cancel_transfer).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(header, text="Resume", command=self.on_resume_transfer).pack(side=tk.RIGHT)
+        ttk.Button(header, text="Pause", command=self.on_pause_transfer).pack(side=tk.RIGHT, padx=5)
+
+        columns = ("file", "direction", "progress", "rate", "eta", "state")
+        self.transfer_tree = ttk.Treeview(transfer_frame, columns=columns, show="headings", height=5)
+        for column, title, width in (
+            ("file", "File", 260), ("direction", "Dir", 50), ("progress", "Progress", 140),
+            ("rate", "Speed", 90), ("eta", "ETA", 70), ("state", "State", 80),
+        ):
+            self.transfer_tree.heading(column, text=title)
+            self.transfer_tree.column(column, width=width, anchor="w")
+        self.transfer_tree.pack(fill=tk.X)
+
+    #  Background work
+    def _background(self, func, on_done=None, executor=None):
+        """
+        Run func on the browsing thread (or `executor`), then
+        on_done(result) on the Tk thread.
+        """
+        future = (executor or self.browser).submit(func)
+        future.add_done_callback(lambda f: self.events.put(("call", on_done, f)))
 
-        # Double-click on local file to upload
-        self.local_listbox.bind("<Double-Button-1>", self.on_local_double_click)
+    def _poll_events(self):
+        """Apply everything the worker threads reported, then reschedule."""
+        try:
+            while True:
+                event = self.events.get_nowait()
+                kind = event[0]
+                if kind == "log":
+                    self.append_log(event[1])
+                elif kind == "call":
+                    _, on_done, future = event
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        self.append_log(f"Error: {e}")
+                        continue
+                    if on_done:
+                        on_done(result)
+                elif kind == "entries":
+                    _, panel, generation, batch = event
+                    if generation == panel.generation:
+                        panel.extend(batch)
+                elif kind == "remote_path":
+                    _, panel, generation, path = event
+                    if generation == panel.generation:
+                        self.remote_path = path
+                elif kind == "finished":
+                    self._on_transfer_finished(event[1])
+        except queue.Empty:
+            pass
+
+        self._update_transfer_rows()
+        self.root.after(POLL_INTERVAL_MS, self._poll_events)
 
     #  Logging 
     def append_log(self, message: str):
@@ -123,14 +375,21 @@ class FTPClientGUI:
             messagebox.showwarning("Host Required", "Please enter a remote host name.")
             return
 
-        # If already connected, close first
-        if self.client.connected:
-            self.client.close()
-
         self.append_log(f"Attempting to connect to {host}...")
-        self.client.open(host)
+        self.connect_button.configure(state=tk.DISABLED)
 
-        if not self.client.connected:
+        def connect():
+            # If already connected, close first
+            if self.client.connected:
+                self.client.close()
+            self.client.open(host)
+            return self.client.connected
+
+        self._background(connect, self._on_opened)
+
+    def _on_opened(self, connected):
+        self.connect_button.configure(state=tk.NORMAL)
+        if not connected:
             messagebox.showerror("Connection Failed", "Could not connect to the FTP server.")
             return
 
@@ -142,127 +401,216 @@ class FTPClientGUI:
             return
 
         username, password = dialog.result
-        success = self.client.login(username, password)
+        self._background(lambda: self.client.login(username, password), self._on_logged_in)
 
+    def _on_logged_in(self, success):
         if success:
             self.refresh_remote_files()
+            resumed = self.transfers.resume_unfinished()
+            if resumed:
+                self.append_log(f"Resuming {resumed} unfinished transfer(s).")
         else:
             messagebox.showerror("Login Failed", "Login was not successful.")
 
     def on_disconnect(self):
-        self.client.close()
-        self.remote_listbox.delete(0, tk.END)
-        self.remote_entries.clear()
+        self.transfers.cancel_all(keep_queued=True)
+        self._background(self.client.close)
+        self.remote_panel.clear()
 
     def on_quit(self):
+        self.transfers.cancel_all(keep_queued=True)
+        # let the browsing thread finish its command before the socket is
+        # closed under it; anything still queued is dropped
+        self.browser.shutdown(wait=True, cancel_futures=True)
         if self.client.connected:
             self.client.close()
         self.root.destroy()
 
     #  Remote / local list handling
-    def refresh_remote_files(self):
+    def refresh_remote_files(self, directory=None):
+        """
+        List the remote directory (after changing into `directory`, if
+        given) into the remote panel, batch by batch as the listing
+        streams in.
+        """
         if not self.client.connected:
             return
 
-        lines = self.client.list_directory()
-        self.remote_entries = []
-        self.remote_listbox.delete(0, tk.END)
-
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-
-            name = self._extract_name_from_list_line(line)
-            if not name:
-                continue
-
-            # detect directory 
-            is_dir = line.startswith("d") or "<DIR>" in line
-
-            display = f"[DIR] {name}" if is_dir else name
-            self.remote_entries.append({"name": name, "is_dir": is_dir})
-            self.remote_listbox.insert(tk.END, display)
+        panel = self.remote_panel
+        panel.clear()
+        panel.set_loading(True)
+        generation = panel.generation
+
+        def fetch():
+            if directory:
+                self.client.cd(directory)
+            path = self.client.current_dir()
+            # ahead of the first rows, so an open never uses the old directory
+            self.events.put(("remote_path", panel, generation, path))
+            batch = []
+            for entry in self.client.iter_entries():
+                batch.append(entry)
+                if len(batch) >= LISTING_BATCH:
+                    self.events.put(("entries", panel, generation, batch))
+                    batch = []
+            self.events.put(("entries", panel, generation, batch))
+            return path
+
+        def done(path):
+            if generation == panel.generation:
+                panel.finish()
+
+        self._background(fetch, done)
 
     def refresh_local_files(self):
-        """Populate the local file list from the current working directory."""
-        self.local_listbox.delete(0, tk.END)
-        self.local_entries = []
-
-        try:
-            entries = sorted(os.listdir(self.local_path))
-        except Exception as e:
-            self.append_log(f"Error listing local directory '{self.local_path}': {e}")
+        """
+        Scan the local directory into the local panel on the local
+        thread, batch by batch, and start watching it.
+        """
+        panel = self.local_panel
+        panel.clear()
+        panel.set_loading(True)
+        generation = panel.generation
+        path = self.local_path
+        watcher = self.local_watcher = DirectoryWatcher(path)
+
+        def scan():
+            try:
+                for batch in watcher.scan():
+                    self.events.put(("entries", panel, generation, batch))
+            except OSError as e:
+                self.events.put(("log", f"Error listing local directory '{path}': {e}"))
+
+        def done(result):
+            if generation == panel.generation:
+                panel.finish()
+
+        self._background(scan, done, self.local_scanner)
+
+    def _update_local_entry(self, path):
+        """Add or refresh the one local row a download wrote, instead of rescanning."""
+        if os.path.dirname(os.path.abspath(path)) != os.path.abspath(self.local_path):
             return
+        panel = self.local_panel
+        generation = panel.generation
+        watcher = self.local_watcher
+
+        def stat_one():
+            entry = stat_entry(path)
+            if entry is not None:
+                watcher.note(entry)
+            return entry
+
+        def done(entry):
+            if entry is not None and generation == panel.generation:
+                panel.apply([entry])
+
+        self._background(stat_one, done, self.local_scanner)
+
+    def _poll_local(self):
+        """Pick up local changes made outside the client, then reschedule."""
+        if self.watch_local.get() and not self._local_check_running:
+            self._local_check_running = True
+            panel = self.local_panel
+            generation = panel.generation
+            watcher = self.local_watcher
+
+            def check():
+                try:
+                    return watcher.check()
+                except OSError as e:
+                    self.events.put(("log", f"Error watching local directory '{watcher.path}': {e}"))
+                    return [], []
+
+            def done(changes):
+                self._local_check_running = False
+                changed, removed = changes
+                if (changed or removed) and generation == panel.generation:
+                    panel.apply(changed, removed)
+
+            self._background(check, done, self.local_scanner)
+        self.root.after(LOCAL_POLL_MS, self._poll_local)
+
+    #  Open handlers 
+    def on_remote_open(self, entry):
+        """Double-click on a remote entry: enter a directory or download a file."""
+        if entry.is_dir:
+            self.refresh_remote_files(entry.name)
+        else:
+            # Download file in the background
+            local_path = os.path.join(self.local_path, entry.name)
+            self.transfers.submit("get", entry.name, local_path, self.remote_path, entry.size)
 
-        for name in entries:
-            full_path = os.path.join(self.local_path, name)
-            if os.path.isdir(full_path):
-                display = f"[DIR] {name}"
-            else:
-                display = name
-            self.local_entries.append(name)
-            self.local_listbox.insert(tk.END, display)
+    def on_local_open(self, entry):
+        """Double-click on a local entry: upload it."""
+        name = entry.name
+        full_path = os.path.join(self.local_path, name)
 
-    @staticmethod
-    def _extract_name_from_list_line(line: str) -> str:
-        """
-         to extract the filename from an FTP LIST line.
-        """
-        parts = line.split()
-        if len(parts) < 1:
-            return ""
-        # fallback: take the last element as the name
-        return parts[-1]
-
-    #  Mouse handlers 
-    def on_remote_double_click(self, event):
-        """Handle double-click on a remote entry."""
-        if not self.remote_entries:
+        if entry.is_dir:
+            messagebox.showinfo("Upload", "Uploading directories is not supported.")
             return
 
-        selection = self.remote_listbox.curselection()
-        if not selection:
+        if not self.client.connected:
+            messagebox.showwarning("Not Connected", "Connect and log in before uploading.")
             return
 
-        index = selection[0]
-        entry = self.remote_entries[index]
-        name = entry["name"]
-        is_dir = entry["is_dir"]
+        self.transfers.submit("put", name, full_path, self.remote_path, entry.size)
 
-        if is_dir:
-            # Change directory on the server
-            self.client.cd(name)
-            self.refresh_remote_files()
+    #  Transfers panel
+    def _on_transfer_finished(self, job):
+        self._update_transfer_row(job)
+        if job.state != "done":
+            return
+        # show the new file where it landed
+        if job.direction == "get":
+            self._update_local_entry(job.local_path)
         else:
-            # Download file
-            self.client.get(name)
-            self.refresh_local_files()
+            self.refresh_remote_files()
 
-    def on_local_double_click(self, event):
-        """Handle double-click on a local entry."""
-        if not self.local_entries:
-            return
+    def _update_transfer_rows(self):
+        for job in self.transfers.jobs.values():
+            if not job.finished or not self.transfer_tree.exists(str(job.id)):
+                self._update_transfer_row(job)
 
-        selection = self.local_listbox.curselection()
-        if not selection:
-            return
+    def _update_transfer_row(self, job):
+        if job.total:
+            progress = f"{job.done * 100 // job.total}% of {format_size(job.total)}"
+        else:
+            progress = format_size(job.done)
+        rate = f"{format_size(job.rate)}/s" if job.rate else ""
+        eta = job.eta()
+        state = "paused" if job.paused and not job.finished else job.state
+        values = (
+            job.remote_name, job.direction, progress, rate,
+            f"{int(eta) // 60}:{int(eta) % 60:02d}" if eta is not None else "", state,
+        )
+        row = str(job.id)
+        if self.transfer_tree.exists(row):
+            self.transfer_tree.item(row, values=values)
+        else:
+            self.transfer_tree.insert("", tk.END, iid=row, values=values)
 
-        index = selection[0]
-        name = self.local_entries[index]
-        full_path = os.path.join(self.local_path, name)
+    def _selected_jobs(self):
+        return [self.transfers.jobs[int(row)] for row in self.transfer_tree.selection()]
 
-        if os.path.isdir(full_path):
-            messagebox.showinfo("Upload", "Uploading directories is not supported.")
-            return
+    def on_pause_transfer(self):
+        for job in self._selected_jobs():
+            job.pause()
 
-        if not self.client.connected:
-            messagebox.showwarning("Not Connected", "Connect and log in before uploading.")
-            return
+    def on_resume_transfer(self):
+        for job in self._selected_jobs():
+            job.resume()
+
+    def on_cancel_transfer(self):
+        for job in self._selected_jobs():
+            job.cancel()
 
-        self.client.put(full_path)
-        # After upload, you can refresh remote list so the file appears
-        self.refresh_remote_files()
+    def on_clear_transfers(self):
+        for job_id, job in list(self.transfers.jobs.items()):
+            if job.finished:
+                del self.transfers.jobs[job_id]
+                if self.transfer_tree.exists(str(job_id)):
+                    self.transfer_tree.delete(str(job_id))
 
 
 def main():
@@ -0,0 +1,426 @@
+import fnmatch
+import re
+import time
+import tkinter as tk
+from array import array
+from tkinter import ttk
+
+from ftp_listing import FTPEntry
+
+# columns of every file panel: (key, heading, width)
+COLUMNS = (("name", "Name", 220), ("size", "Size", 80), ("modify", "Modified", 120))
+
+# Treeview row height in pixels when the theme does not say
+DEFAULT_ROW_HEIGHT = 20
+
+# pause after the last keystroke before the filter is applied
+FILTER_DELAY_MS = 150
+
+# rows moved per mouse wheel notch
+WHEEL_ROWS = 3
+
+
+class EntryStore:
+    """
+    Directory entries kept column-wise: one list of names plus compact
+    arrays for sizes, times and kinds, instead of an object per entry.
+    `order` holds every index in sort order and `view` the part of it
+    that matches the filter; panels display view positions. Nothing
+    here touches Tk.
+    """
+
+    def __init__(self):
+        self.sort_key = "name"  # "name", "size" or "modify"
+        self.reverse = False
+        self.pattern = ""
+        self.clear()
+
+    def clear(self):
+        self.names = []
+        self.sizes = array("q")   # -1 when unknown
+        self.mtimes = array("d")  # 0.0 when unknown
+        self.dirs = bytearray()
+        self.order = array("l")
+        self.view = array("l")
+        self.sorted = True
+        self._index = {}  # name -> index
+
+    def __len__(self):
+        return len(self.view)
+
+    @property
+    def total(self):
+        return len(self.names)
+
+    def extend(self, entries):
+        """
+        Add FTPEntry objects. They are appended to the view in arrival
+        order until the next sort().
+        """
+        match = self._matcher()
+        for entry in entries:
+            index = len(self.names)
+            self._index[entry.name] = index
+            self.names.append(entry.name)
+            self.sizes.append(-1 if entry.size is None else entry.size)
+            self.mtimes.append(entry.modify or 0.0)
+            self.dirs.append(entry.is_dir)
+            self.order.append(index)
+            if match(entry.name):
+                self.view.append(index)
+            self.sorted = False
+
+    def sort(self, key=None, reverse=None):
+        """Sort by name, size or modify time, directories always first."""
+        if key is not None:
+            self.sort_key = key
+        if reverse is not None:
+            self.reverse = reverse
+
+        names = self.names
+        indices = sorted(range(len(names)), key=lambda i: names[i].casefold())
+        if self.sort_key == "name":
+            if self.reverse:
+                indices.reverse()
+        else:
+            # stable, so equal sizes or times stay in name order
+            column = self.sizes if self.sort_key == "size" else self.mtimes
+            indices.sort(key=column.__getitem__, reverse=self.reverse)
+        dirs = self.dirs
+        self.order = array("l", [i for i in indices if dirs[i]] + [i for i in indices if not dirs[i]])
+        self.sorted = True
+        self._apply_filter()
+
+    def apply(self, changed=(), removed=()):
+        """
+        Update entries by name: changed ones replace their old values or
+        are added, removed ones are dropped. Re-sorts afterwards, since
+        new sizes, times or names can move rows.
+        """
+        added = []
+        for entry in changed:
+            i = self._index.get(entry.name)
+            if i is None:
+                added.append(entry)
+                continue
+            self.sizes[i] = -1 if entry.size is None else entry.size
+            self.mtimes[i] = entry.modify or 0.0
+            self.dirs[i] = entry.is_dir
+        gone = {name for name in removed if name in self._index}
+        if gone:
+            self._drop(gone)
+        self.extend(added)
+        self.sort()
+
+    def position(self, name):
+        """View position of name, None if it is not shown."""
+        i = self._index.get(name)
+        if i is None:
+            return None
+        try:
+            return self.view.index(i)
+        except ValueError:
+            return None
+
+    def set_filter(self, pattern):
+        """
+        Show only names containing pattern (case-insensitive), or matching
+        it as a glob when it has * ? or [ in it.
+        """
+        self.pattern = pattern.strip()
+        self._apply_filter()
+
+    def entry(self, position):
+        """The FTPEntry at a view position."""
+        i = self.view[position]
+        size = self.sizes[i]
+        return FTPEntry(
+            self.names[i], "dir" if self.dirs[i] else "file",
+            None if size < 0 else size, self.mtimes[i] or None,
+        )
+
+    def _drop(self, names):
+        keep = [i for i, name in enumerate(self.names) if name not in names]
+        self.names = [self.names[i] for i in keep]
+        self.sizes = array("q", [self.sizes[i] for i in keep])
+        self.mtimes = array("d", [self.mtimes[i] for i in keep])
+        self.dirs = bytearray(self.dirs[i] for i in keep)
+        self._index = {name: i for i, name in enumerate(self.names)}
+        self.order = array("l", range(len(self.names)))
+        self.view = array("l", self.order)
+
+    def _apply_filter(self):
+        if not self.pattern:
+            self.view = array("l", self.order)
+            return
+        match, names = self._matcher(), self.names
+        self.view = array("l", [i for i in self.order if match(names[i])])
+
+    def _matcher(self):
+        pattern = self.pattern.casefold()
+        if not pattern:
+            return lambda name: True
+        if any(c in pattern for c in "*?["):
+            regex = re.compile(fnmatch.translate(pattern), re.IGNORECASE)
+            return lambda name: regex.match(name) is not None
+        return lambda name: pattern in name.casefold()
+
+
+class FilePanel(ttk.Frame):
+    """
+    File list that only has Treeview rows for what fits on screen and
+    reads everything else from an EntryStore, so a directory with
+    hundreds of thousands of entries costs a few dozen widgets. Typing
+    filters the list and clicking a heading sorts by that column.
+    on_open(entry) runs on double-click or Return.
+    """
+
+    def __init__(self, master, title, on_open=None):
+        super().__init__(master)
+        self.store = EntryStore()
+        self.on_open = on_open
+        self.generation = 0  # bumped by clear(), lets callers drop stale batches
+        self.loading = False
+        self.top = 0         # view position of the first visible row
+        self.cursor = None   # view position of the selected entry
+        self.rows = 1
+        self._redraw_pending = False
+        self._filter_job = None
+
+        # callers may add their own controls to the header
+        self.header = ttk.Frame(self)
+        self.header.pack(fill=tk.X)
+        self.title_label = ttk.Label(self.header, text=title)
+        self.title_label.pack(side=tk.LEFT)
+        self.count_label = ttk.Label(self.header, text="")
+        self.count_label.pack(side=tk.RIGHT)
+
+        self.filter_var = tk.StringVar()
+        self.filter_entry = ttk.Entry(self, textvariable=self.filter_var)
+        self.filter_entry.pack(fill=tk.X, pady=2)
+        self.filter_var.trace_add("write", self._on_filter_changed)
+        self.filter_entry.bind("<Escape>", self._on_filter_escape)
+        self.filter_entry.bind("<Down>", lambda event: self.tree.focus_set())
+
+        body = ttk.Frame(self)
+        body.pack(fill=tk.BOTH, expand=True)
+        self.tree = ttk.Treeview(body, columns=[c[0] for c in COLUMNS], show="headings", selectmode="browse")
+        for key, heading, width in COLUMNS:
+            self.tree.heading(key, text=heading, command=lambda k=key: self.sort_by(k))
+            self.tree.column(key, width=width, anchor="e" if key == "size" else "w", stretch=key == "name")
+        self.scrollbar = ttk.Scrollbar(body, orient=tk.VERTICAL, command=self._on_scrollbar)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        try:
+            self.row_height = int(ttk.Style().lookup("Treeview", "rowheight")) or DEFAULT_ROW_HEIGHT
+        except (tk.TclError, ValueError):
+            self.row_height = DEFAULT_ROW_HEIGHT
+
+        self.tree.bind("<Configure>", self._on_resize)
+        self.tree.bind("<Button-1>", self._on_click)
+        self.tree.bind("<Double-Button-1>", self._on_open)
+        self.tree.bind("<Return>", self._on_open)
+        self.tree.bind("<MouseWheel>", lambda event: self.scroll(-WHEEL_ROWS if event.delta > 0 else WHEEL_ROWS))
+        self.tree.bind("<Button-4>", lambda event: self.scroll(-WHEEL_ROWS))
+        self.tree.bind("<Button-5>", lambda event: self.scroll(WHEEL_ROWS))
+        for key in ("Up", "Down", "Prior", "Next", "Home", "End"):
+            self.tree.bind(f"<{key}>", self._on_move)
+        self.tree.bind("<Key>", self._on_type)
+        self._update_headings()
+
+    # contents
+    def clear(self):
+        self.store.clear()
+        self.generation += 1
+        self.top = 0
+        self.cursor = None
+        self.redraw()
+
+    def extend(self, entries):
+        """Add a batch of FTPEntry objects, e.g. while a listing streams in."""
+        self.store.extend(entries)
+        self.redraw()
+
+    def set_loading(self, loading):
+        self.loading = loading
+        self.redraw()
+
+    def finish(self):
+        """The listing is complete: sort it and stop showing it as loading."""
+        self.loading = False
+        self.store.sort()
+        self.cursor = None
+        self.redraw()
+
+    def set_entries(self, entries):
+        self.clear()
+        self.extend(entries)
+        self.finish()
+
+    def apply(self, changed=(), removed=()):
+        """
+        Apply changes to single entries without reloading, keeping the
+        scroll position and the selection where possible.
+        """
+        entry = self.selected()
+        self.store.apply(changed, removed)
+        self.cursor = self.store.position(entry.name) if entry is not None else None
+        self.redraw()
+
+    def selected(self):
+        """The selected FTPEntry, or None."""
+        if self.cursor is None or self.cursor >= len(self.store):
+            return None
+        return self.store.entry(self.cursor)
+
+    def sort_by(self, key):
+        """Sort by a column; sorting by the same column again reverses it."""
+        reverse = not self.store.reverse if key == self.store.sort_key else False
+        self.store.sort(key, reverse)
+        self.top = 0
+        self.cursor = None
+        self._update_headings()
+        self.redraw()
+
+    def scroll(self, rows):
+        self.top += rows
+        self.redraw()
+
+    # drawing
+    def redraw(self):
+        """Schedule a redraw; any number of calls before it runs cost one."""
+        if not self._redraw_pending:
+            self._redraw_pending = True
+            self.after_idle(self._redraw)
+
+    def _redraw(self):
+        self._redraw_pending = False
+        store = self.store
+        total = len(store)
+        self.top = max(0, min(self.top, total - self.rows))
+        visible = min(self.rows, total - self.top)
+
+        # a fixed set of row items "0".."rows-1" is reused for every scroll
+        for row in range(visible):
+            iid = str(row)
+            values = self._values(self.top + row)
+            if self.tree.exists(iid):
+                self.tree.item(iid, values=values)
+            else:
+                self.tree.insert("", tk.END, iid=iid, values=values)
+        for iid in self.tree.get_children()[visible:]:
+            self.tree.delete(iid)
+
+        if self.cursor is not None and self.top <= self.cursor < self.top + visible:
+            self.tree.selection_set(str(self.cursor - self.top))
+        elif self.tree.selection():
+            self.tree.selection_remove(self.tree.selection())
+
+        if total:
+            self.scrollbar.set(self.top / total, (self.top + visible) / total)
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+        count = f"{total} of {store.total}" if store.pattern else f"{total}"
+        self.count_label.configure(text=f"{count} items" + (", loading..." if self.loading else ""))
+
+    def _values(self, position):
+        store = self.store
+        i = store.view[position]
+        mtime = store.mtimes[i]
+        modified = time.strftime("%Y-%m-%d %H:%M", time.localtime(mtime)) if mtime else ""
+        if store.dirs[i]:
+            return f"[DIR] {store.names[i]}", "", modified
+        size = store.sizes[i]
+        return store.names[i], format_size(size) if size >= 0 else "", modified
+
+    def _update_headings(self):
+        for key, heading, _ in COLUMNS:
+            if key == self.store.sort_key:
+                heading += " ▼" if self.store.reverse else " ▲"
+            self.tree.heading(key, text=heading)
+
+    def _see(self, position):
+        if position < self.top:
+            self.top = position
+        elif position >= self.top + self.rows:
+            self.top = position - self.rows + 1
+        self.redraw()
+
+    # event handlers
+    def _on_resize(self, event):
+        # one row's worth of height goes to the headings
+        rows = max(1, event.height // self.row_height - 1)
+        if rows != self.rows:
+            self.rows = rows
+            self.redraw()
+
+    def _on_scrollbar(self, action, amount, what=None):
+        total = len(self.store)
+        if action == "moveto":
+            self.top = int(float(amount) * total)
+        elif what == "pages":
+            self.top += int(amount) * self.rows
+        else:
+            self.top += int(amount)
+        self.redraw()
+
+    def _on_click(self, event):
+        row = self.tree.identify_row(event.y)
+        if row:
+            self.cursor = self.top + int(row)
+            self.redraw()
+
+    def _on_open(self, event=None):
+        entry = self.selected()
+        if entry is not None and self.on_open:
+            self.on_open(entry)
+        return "break"
+
+    def _on_move(self, event):
+        total = len(self.store)
+        if not total:
+            return "break"
+        if event.keysym == "Home":
+            cursor = 0
+        elif event.keysym == "End":
+            cursor = total - 1
+        else:
+            step = {"Up": -1, "Down": 1, "Prior": -self.rows, "Next": self.rows}[event.keysym]
+            cursor = self.top if self.cursor is None else self.cursor + step
+        self.cursor = max(0, min(cursor, total - 1))
+        self._see(self.cursor)
+        return "break"
+
+    def _on_type(self, event):
+        # type-ahead: printable keys go to the filter box
+        if event.char and event.char.isprintable() and not event.state & 0x4:
+            self.filter_entry.focus_set()
+            self.filter_entry.insert(tk.END, event.char)
+            return "break"
+        return None
+
+    def _on_filter_changed(self, *args):
+        if self._filter_job is not None:
+            self.after_cancel(self._filter_job)
+        self._filter_job = self.after(FILTER_DELAY_MS, self._apply_filter)
+
+    def _apply_filter(self):
+        self._filter_job = None
+        self.store.set_filter(self.filter_var.get())
+        self.top = 0
+        self.cursor = 0 if len(self.store) else None
+        self.redraw()
+
+    def _on_filter_escape(self, event):
+        self.filter_var.set("")
+        self.tree.focus_set()
+        return "break"
+
+
+def format_size(nbytes):
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if nbytes < 1024 or unit == "GiB":
+            return f"{nbytes:.0f} {unit}" if unit == "B" else f"{nbytes:.1f} {unit}"
+        nbytes /= 1024
@@ -0,0 +1,114 @@
+import os
+import stat
+
+from ftp_listing import FTPEntry
+
+# entries handed over at a time while a directory is scanned
+SCAN_BATCH = 1000
+
+# DirectoryWatcher rescans after this many checks even when the
+# directory's mtime did not move, to catch files modified in place
+RESCAN_EVERY = 15
+
+
+def scan_directory(path, batch=SCAN_BATCH):
+    """
+    Yield lists of FTPEntry for the entries of a local directory. Kinds
+    come from the os.scandir DirEntry, which knows them without a stat
+    call on most platforms; only files are stat'ed, for size and time.
+    """
+    entries = []
+    with os.scandir(path) as it:
+        for item in it:
+            entry = _from_dir_entry(item)
+            if entry is None:
+                continue
+            entries.append(entry)
+            if len(entries) >= batch:
+                yield entries
+                entries = []
+    if entries:
+        yield entries
+
+
+def stat_entry(path):
+    """FTPEntry for a single local path, None if it is gone."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    name = os.path.basename(path)
+    if stat.S_ISDIR(st.st_mode):
+        return FTPEntry(name, "dir")
+    return FTPEntry(name, "file", st.st_size, st.st_mtime)
+
+
+class DirectoryWatcher:
+    """
+    Polls one local directory for changes made outside the client.
+    check() costs a single stat while the directory's own mtime stays
+    put, which covers files being created, deleted or renamed; every
+    `rescan_every` checks it rescans anyway to catch files modified in
+    place. Not thread-safe: use it from one thread.
+    """
+
+    def __init__(self, path, rescan_every=RESCAN_EVERY):
+        self.path = path
+        self.rescan_every = rescan_every
+        self.snapshot = {}  # name -> (type, size, modify) as of the last scan
+        self._mtime = None
+        self._checks = 0
+
+    def scan(self):
+        """Yield batches like scan_directory and remember the result."""
+        # taken first, so a change during the scan shows up on the next check
+        self._mtime = self._dir_mtime()
+        snapshot = {}
+        for batch in scan_directory(self.path):
+            for entry in batch:
+                snapshot[entry.name] = _signature(entry)
+            yield batch
+        self.snapshot = snapshot
+        self._checks = 0
+
+    def check(self):
+        """
+        Return (changed or new entries, removed names) since the last
+        scan; both are empty when nothing changed.
+        """
+        self._checks += 1
+        if self._dir_mtime() == self._mtime and self._checks < self.rescan_every:
+            return [], []
+
+        old = self.snapshot
+        changed = []
+        for batch in self.scan():
+            changed.extend(entry for entry in batch if old.get(entry.name) != _signature(entry))
+        removed = [name for name in old if name not in self.snapshot]
+        return changed, removed
+
+    def note(self, entry):
+        """Record a change the caller has already applied, e.g. a finished download."""
+        self.snapshot[entry.name] = _signature(entry)
+        # the directory mtime moved because of that change, not an outside one
+        self._mtime = self._dir_mtime()
+
+    def _dir_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+
+def _from_dir_entry(item):
+    try:
+        if item.is_dir():
+            return FTPEntry(item.name, "dir")
+        st = item.stat()
+    except OSError:
+        return None
+    return FTPEntry(item.name, "file", st.st_size, st.st_mtime)
+
+
+def _signature(entry):
+    return entry.type, entry.size, entry.modify
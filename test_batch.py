@@ -0,0 +1,48 @@
+import os
+import tempfile
+import unittest
+
+from ftp_batch import BatchRunner, parse_steps
+from ftp_client import FTPClient
+from ftp_loopback import LoopbackFTPServer
+
+
+class BatchTests(unittest.TestCase):
+    """BatchRunner steps against the loopback server."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.server = LoopbackFTPServer().start()
+        self.addCleanup(self.server.stop)
+        self.server.add_file("/in/a.csv", b"a")
+        self.server.add_dir("/empty")
+
+        self.client = FTPClient(is_gui=True)
+        self.client.set_output_callback(lambda message: None)
+        self.client.open("127.0.0.1", self.server.port, "user", "secret")
+        self.addCleanup(self.client.close)
+
+    def run_steps(self, *steps):
+        steps = parse_steps({"steps": list(steps)})
+        BatchRunner(self.client, steps).run()
+        return [step.state for step in steps]
+
+    def test_mget(self):
+        step = {"op": "mget", "patterns": "*.csv", "local_dir": self.tmp.name, "cwd": "/in"}
+        self.assertEqual(self.run_steps(step), ["ok"])
+        self.assertTrue(os.path.isfile(os.path.join(self.tmp.name, "a.csv")))
+
+    def test_mget_without_matches_fails(self):
+        step = {"op": "mget", "patterns": "*.csv", "local_dir": self.tmp.name, "cwd": "/empty"}
+        self.assertEqual(self.run_steps(step), ["failed"])
+        self.assertEqual(self.run_steps(dict(step, allow_empty=True)), ["ok"])
+
+    def test_mput_without_matches_fails(self):
+        pattern = os.path.join(self.tmp.name, "*.csv")
+        self.assertEqual(self.run_steps({"op": "mput", "patterns": pattern}), ["failed"])
+        self.assertEqual(self.run_steps({"op": "mput", "patterns": pattern, "allow_empty": True}), ["ok"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import tempfile
+import unittest
+
+from ftp_client import FTPClient
+from ftp_loopback import LoopbackFTPServer
+
+SIZE = 8 * 1024 * 1024
+
+
+class Interrupted(Exception):
+    pass
+
+
+class DownloadTests(unittest.TestCase):
+    """get() against the loopback server, interrupted and resumed."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.server = LoopbackFTPServer().start()
+        self.addCleanup(self.server.stop)
+        self.server.add_file("/big.bin", size=SIZE)
+        self.data = self.server.read_file("/big.bin")
+        self.local = os.path.join(self.tmp.name, "big.bin")
+
+    def connect(self, use_mmap=False):
+        client = FTPClient(is_gui=True)
+        client.set_output_callback(lambda message: None)
+        client.use_mmap = use_mmap
+        client.open("127.0.0.1", self.server.port, "user", "secret")
+        self.addCleanup(client.close)
+        return client
+
+    def local_data(self):
+        with open(self.local, "rb") as f:
+            return f.read()
+
+    def interrupt(self, client):
+        def progress(done, total):
+            if done > SIZE // 3:
+                raise Interrupted()
+        self.assertFalse(client.get("big.bin", self.local, progress=progress))
+
+    def test_resume_after_interrupted_mmap_get(self):
+        self.interrupt(self.connect(use_mmap=True))
+        # the preallocated tail is gone, only received data is kept
+        self.assertLess(os.path.getsize(self.local), SIZE)
+        self.assertTrue(self.connect().get("big.bin", self.local, resume=True))
+        self.assertEqual(self.local_data(), self.data)
+
+    def test_session_usable_after_failed_get(self):
+        self.server.add_file("/small.bin", b"small")
+        client = self.connect()
+        self.interrupt(client)
+        # the end-of-transfer reply was read, so the next reply is SIZE's own
+        self.assertTrue(client.connected)
+        self.assertEqual(client.size("small.bin"), 5)
+        self.assertTrue(client.get("big.bin", self.local, resume=True))
+        self.assertEqual(self.local_data(), self.data)
+
+    def test_resume_from_checkpoint_of_full_length_file(self):
+        # what a killed mmap download leaves: full length, checkpointed prefix
+        client = self.connect()
+        with open(self.local, "wb") as f:
+            f.write(self.data[:SIZE // 4] + bytes(SIZE - SIZE // 4))
+        checkpoint = {"direction": "get", "host": client.host, "remote": "big.bin", "size": SIZE}
+        client._write_checkpoint(self.local, checkpoint, SIZE // 4)
+        self.assertTrue(client.get("big.bin", self.local, resume=True))
+        self.assertEqual(self.local_data(), self.data)
+
+    def test_segmented_get_is_verified(self):
+        messages = []
+        client = self.connect()
+        client.set_output_callback(messages.append)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.tmp.name)
+        self.assertTrue(client.get_segmented("big.bin", segments=4))
+        self.assertIn("SHA-256 of 'big.bin' verified.", messages)
+        self.assertEqual(self.local_data(), self.data)
+
+    def test_full_length_copy_is_checked_before_it_counts_as_complete(self):
+        with open(self.local, "wb") as f:
+            f.write(bytes(SIZE))
+        self.assertTrue(self.connect().get("big.bin", self.local, resume=True))
+        self.assertEqual(self.local_data(), self.data)
+
+
+if __name__ == "__main__":
+    unittest.main()
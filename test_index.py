@@ -0,0 +1,81 @@
+import os
+import tempfile
+import time
+import unittest
+
+from ftp_client import FTPClient
+from ftp_index import RemoteIndex, crawl
+from ftp_loopback import LoopbackFTPServer
+
+
+class CrawlTests(unittest.TestCase):
+    """crawl() and RemoteIndex against the loopback server."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.server = LoopbackFTPServer().start()
+        self.addCleanup(self.server.stop)
+        for a in ("a", "b", "c"):
+            for name in ("one.txt", "two.iso"):
+                self.server.add_file(f"/pub/{a}/{name}", b"data")
+            self.server.add_file(f"/pub/{a}/deep/three.txt", b"more")
+        # listings carry whole seconds; push the tree into the past so
+        # changes made by the tests show up as a different mtime
+        self._age(self.server.root, time.time() - 3600)
+
+        self.client = FTPClient(is_gui=True)
+        self.client.set_output_callback(lambda message: None)
+        self.client.open("127.0.0.1", self.server.port, "user", "secret")
+        self.addCleanup(self.client.close)
+        self.index = RemoteIndex(os.path.join(self.tmp.name, "index.sqlite3"))
+        self.addCleanup(self.index.close)
+
+    def _age(self, node, stamp):
+        node.mtime = stamp
+        for child in (node.children or {}).values():
+            self._age(child, stamp)
+
+    def paths(self, pattern):
+        return [entry.path for entry in self.index.search(self.client, pattern)]
+
+    def test_crawl_and_search(self):
+        stats = crawl(self.client, self.index, "/pub", workers=3)
+        self.assertEqual(stats.listed, 7)
+        self.assertEqual(self.index.stats(self.client), (9, 7, 36))
+        self.assertEqual(self.paths("*.iso"), ["/pub/a/two.iso", "/pub/b/two.iso", "/pub/c/two.iso"])
+        self.assertEqual(self.paths("/pub/b/"), ["/pub/b/deep", "/pub/b/deep/three.txt",
+                                                 "/pub/b/one.txt", "/pub/b/two.iso"])
+        self.assertEqual(self.paths("thr"), [f"/pub/{a}/deep/three.txt" for a in "abc"])
+
+    def test_max_depth(self):
+        crawl(self.client, self.index, "/pub", max_depth=1)
+        self.assertEqual(self.paths("three*"), [])
+        self.assertEqual(len(self.paths("one*")), 3)
+
+    def test_recrawl_skips_unchanged_directories(self):
+        crawl(self.client, self.index, "/pub")
+        stats = crawl(self.client, self.index, "/pub")
+        self.assertEqual((stats.listed, stats.skipped), (1, 3))
+
+    def test_recrawl_picks_up_changes(self):
+        crawl(self.client, self.index, "/pub")
+        path = os.path.join(self.tmp.name, "new.txt")
+        with open(path, "wb") as f:
+            f.write(b"new")
+        self.assertTrue(self.client.put(path, "/pub/b/new.txt"))
+        self.assertTrue(self.client.delete("/pub/c/one.txt"))
+
+        stats = crawl(self.client, self.index, "/pub")
+        # /pub, then b and c, whose mtimes moved; a (with what is below
+        # it) and b/deep, c/deep are skipped
+        self.assertEqual((stats.listed, stats.skipped), (3, 3))
+        self.assertEqual(self.paths("new*"), ["/pub/b/new.txt"])
+        self.assertEqual(self.paths("/pub/c/one"), [])
+
+    def test_unreadable_root(self):
+        self.assertIsNone(crawl(self.client, self.index, "/missing"))
+
+
+if __name__ == "__main__":
+    unittest.main()
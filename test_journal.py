@@ -0,0 +1,77 @@
+import os
+import tempfile
+import unittest
+
+from ftp_client import FTPClient
+from ftp_journal import JournalRunner, TransferJournal
+from ftp_loopback import LoopbackFTPServer
+from ftp_transfer import TransferQueue, mget
+
+
+class JournalTests(unittest.TestCase):
+    """TransferJournal, JournalRunner and journaled mget/mput against the loopback server."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.server = LoopbackFTPServer().start()
+        self.addCleanup(self.server.stop)
+        self.server.add_file("/a.txt", b"alpha")
+        self.server.add_file("/b.txt", b"bravo")
+
+        self.client = FTPClient(is_gui=True)
+        self.client.set_output_callback(lambda message: None)
+        self.client.open("127.0.0.1", self.server.port, "user", "secret")
+        self.addCleanup(self.client.close)
+        self.journal = TransferJournal(os.path.join(self.tmp.name, "journal.sqlite3"))
+        self.addCleanup(self.journal.close)
+
+    def local(self, name, data=None):
+        path = os.path.join(self.tmp.name, name)
+        if data is not None:
+            with open(path, "wb") as f:
+                f.write(data)
+        return path
+
+    def run_queue(self):
+        self.assertEqual(JournalRunner(self.client, self.journal, workers=2).run(wait=False), 0)
+
+    def test_done_put_requeued_when_remote_changes(self):
+        path = self.local("up.txt", b"upload")
+        self.journal.add(self.client, "put", "up.txt", path)
+        self.run_queue()
+        self.assertEqual(self.server.read_file("/up.txt"), b"upload")
+        self.assertFalse(self.journal.add(self.client, "put", "up.txt", path)[1])
+
+        self.assertTrue(self.client.delete("up.txt"))
+        self.assertTrue(self.journal.add(self.client, "put", "up.txt", path)[1])
+        self.run_queue()
+        self.assertEqual(self.server.read_file("/up.txt"), b"upload")
+
+    def test_done_get_requeued_when_local_changes(self):
+        path = self.local("a.txt")
+        self.journal.add(self.client, "get", "a.txt", path)
+        self.run_queue()
+        self.assertFalse(self.journal.add(self.client, "get", "a.txt", path)[1])
+        os.remove(path)
+        self.assertTrue(self.journal.add(self.client, "get", "a.txt", path)[1])
+
+    def test_mget_is_journaled(self):
+        self.assertEqual(mget(self.client, ["*.txt"], workers=2, local_dir=self.tmp.name,
+                              journal=self.journal), (2, []))
+        self.assertEqual(self.journal.counts(self.client), {"done": 2})
+        # unchanged on both ends, so nothing is transferred again
+        self.assertEqual(mget(self.client, ["*.txt"], workers=2, local_dir=self.tmp.name,
+                              journal=self.journal), (2, []))
+        self.assertEqual(self.journal.counts(self.client), {"done": 2})
+
+    def test_failed_transfer_stays_queued(self):
+        queue = TransferQueue(self.client, workers=1, retries=0, journal=self.journal)
+        queue.add("get", "missing.txt", self.local("missing.txt"))
+        self.assertEqual(len(queue.run()), 1)
+        entry, = self.journal.unfinished(self.client)
+        self.assertEqual((entry.state, entry.error), ("pending", "get failed"))
+
+
+if __name__ == "__main__":
+    unittest.main()
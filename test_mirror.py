@@ -0,0 +1,63 @@
+import os
+import tempfile
+import unittest
+
+from ftp_client import FTPClient
+from ftp_loopback import LoopbackFTPServer
+from ftp_mirror import mirror
+
+
+class MirrorTests(unittest.TestCase):
+    """mirror() against the loopback server."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.server = LoopbackFTPServer().start()
+        self.addCleanup(self.server.stop)
+        self.server.add_file("/r/top.txt", b"top")
+        self.server.add_file("/r/secret/keep.txt", b"keep")
+        self.server.add_file("/r/secret/inner/deeper.txt", b"deeper")
+
+        self.client = FTPClient(is_gui=True)
+        self.client.set_output_callback(lambda message: None)
+        self.client.open("127.0.0.1", self.server.port, "user", "secret")
+        self.addCleanup(self.client.close)
+        self.local = os.path.join(self.tmp.name, "r")
+
+    def local_files(self):
+        found = []
+        for dirpath, _, filenames in os.walk(self.local):
+            rel = os.path.relpath(dirpath, self.local)
+            found += sorted(name if rel == "." else f"{rel}/{name}" for name in filenames)
+        return sorted(found)
+
+    def test_download(self):
+        plan = mirror(self.client, "/r", self.local)
+        self.assertEqual(plan.failed, [])
+        self.assertEqual(self.local_files(), ["secret/inner/deeper.txt", "secret/keep.txt", "top.txt"])
+        with open(os.path.join(self.local, "secret", "keep.txt"), "rb") as f:
+            self.assertEqual(f.read(), b"keep")
+
+        plan = mirror(self.client, "/r", self.local)
+        self.assertEqual((len(plan.transfers), plan.unchanged), (0, 3))
+
+    def test_unreadable_subtree_is_not_deleted(self):
+        mirror(self.client, "/r", self.local)
+        self.server.unreadable.add("/r/secret")
+        self.client.listing_cache.clear()
+
+        plan = mirror(self.client, "/r", self.local, delete=True, dry_run=True)
+        self.assertEqual(plan.unreadable, ["/r/secret"])
+        self.assertEqual((plan.deletes, plan.remove_dirs), ([], []))
+
+        mirror(self.client, "/r", self.local, delete=True)
+        self.assertEqual(self.local_files(), ["secret/inner/deeper.txt", "secret/keep.txt", "top.txt"])
+
+    def test_unreadable_root(self):
+        self.server.unreadable.add("/r")
+        self.assertIsNone(mirror(self.client, "/r", self.local, delete=True))
+
+
+if __name__ == "__main__":
+    unittest.main()
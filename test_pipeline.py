@@ -0,0 +1,29 @@
+import unittest
+
+from ftp_client import FTPClient
+from ftp_loopback import LoopbackFTPServer
+
+
+class PipelineTests(unittest.TestCase):
+    """pipeline() against a loopback server that answers slowly."""
+
+    def setUp(self):
+        self.server = LoopbackFTPServer(latency=0.3).start()
+        self.addCleanup(self.server.stop)
+        self.server.add_file("/a.txt", b"alpha")
+        self.server.add_file("/b.txt", b"bravo!")
+
+        self.client = FTPClient(is_gui=True)
+        self.client.set_output_callback(lambda message: None)
+        self.client.open("127.0.0.1", self.server.port, "user", "secret")
+        self.addCleanup(self.client.close)
+
+    def test_slow_replies_keep_the_session(self):
+        replies = self.client.pipeline(["SIZE a.txt", "SIZE b.txt", "SIZE c.txt"], timeout=0.1)
+        self.assertEqual([reply.code for reply in replies], [213, 213, 550])
+        self.assertTrue(self.client.connected)
+        self.assertEqual(self.client.size("b.txt"), 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import threading
+import time
+import unittest
+
+from ftp_shaping import Shaper
+
+MIB = 1024 * 1024
+
+
+class _Endless:
+    """Socket stand-in whose reads always fill what was asked for."""
+
+    def recv_into(self, buffer, nbytes=0):
+        return nbytes or len(buffer)
+
+    def close(self):
+        pass
+
+
+class ShaperTests(unittest.TestCase):
+    """Rates the shaper lets through, measured over a short run."""
+
+    def measure(self, shaper, weights, seconds=1.5):
+        received = [0] * len(weights)
+        stop = time.monotonic() + seconds
+
+        def work(i, weight):
+            sock = shaper.wrap(_Endless(), "host", weight=weight)
+            buffer = bytearray(MIB)
+            while time.monotonic() < stop:
+                received[i] += sock.recv_into(buffer)
+
+        threads = [threading.Thread(target=work, args=(i, w)) for i, w in enumerate(weights)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return [n / seconds for n in received]
+
+    def test_global_and_host_limits_do_not_stack(self):
+        for weight in (1, 4, 8):
+            rate, = self.measure(Shaper(rate=MIB, host_rate=MIB), [weight])
+            self.assertGreater(rate, 0.85 * MIB, f"weight {weight}")
+            self.assertLess(rate, 1.2 * MIB, f"weight {weight}")
+
+    def test_weights_share_the_limit(self):
+        heavy, light = self.measure(Shaper(rate=2 * MIB, host_rate=2 * MIB), [4, 1])
+        self.assertGreater(heavy + light, 1.7 * MIB)
+        self.assertLess(heavy + light, 2.4 * MIB)
+        self.assertGreater(heavy / light, 3.0)
+        self.assertLess(heavy / light, 5.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import ftp_client
+from ftp_client import FTPClient
+from ftp_loopback import LoopbackFTPServer
+
+
+class UploadTests(unittest.TestCase):
+    """put() against the loopback server, fast and over a slow link."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def connect(self, server, messages=None):
+        client = FTPClient(is_gui=True)
+        client.set_output_callback(messages.append if messages is not None else lambda message: None)
+        client.open("127.0.0.1", server.port, "user", "secret")
+        self.assertTrue(client.connected)
+        self.addCleanup(client.close)
+        return client
+
+    def local_file(self, name, size):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "wb") as f:
+            f.write(os.urandom(size))
+        return path
+
+    def check_upload(self, server, size):
+        client = self.connect(server)
+        path = self.local_file("data.bin", size)
+        self.assertTrue(client.put(path, "data.bin"))
+        with open(path, "rb") as f:
+            self.assertEqual(server.read_file("/data.bin"), f.read())
+
+    def test_fast_server(self):
+        with LoopbackFTPServer() as server:
+            self.check_upload(server, 3 * 1024 * 1024 + 17)
+
+    def test_slow_server(self):
+        with LoopbackFTPServer(latency=0.05, bandwidth=4 * 1024 * 1024) as server:
+            self.check_upload(server, 1024 * 1024 + 17)
+
+    def test_sendfile_upload_is_verified(self):
+        messages = []
+        with LoopbackFTPServer() as server:
+            client = self.connect(server, messages)
+            self.assertTrue(client.use_sendfile)
+            path = self.local_file("data.bin", 2 * 1024 * 1024)
+            with mock.patch.object(ftp_client, "_feed_digest", wraps=ftp_client._feed_digest) as feed:
+                self.assertTrue(client.put(path, "data.bin"))
+            self.assertTrue(feed.called)
+            self.assertIn("SHA-256 of 'data.bin' verified.", messages)
+
+    def test_empty_file(self):
+        with LoopbackFTPServer() as server:
+            self.check_upload(server, 0)
+
+    def test_quota_exceeded(self):
+        # the server cuts the upload off with 552 part way through
+        with LoopbackFTPServer(upload_limit=256 * 1024) as server:
+            client = self.connect(server)
+            path = self.local_file("big.bin", 4 * 1024 * 1024)
+            self.assertFalse(client.put(path, "big.bin"))
+            stored = server.read_file("/big.bin")
+            self.assertTrue(stored is None or len(stored) <= 256 * 1024)
+            # the control connection is still in step
+            self.assertTrue(client.noop())
+            small = self.local_file("small.bin", 1024)
+            self.assertTrue(client.put(small, "small.bin"))
+
+    def test_small_put_does_not_stall(self):
+        with LoopbackFTPServer() as server:
+            client = self.connect(server)
+            path = self.local_file("small.bin", 64 * 1024)
+            client.put(path, "warmup.bin")
+            started = time.perf_counter()
+            self.assertTrue(client.put(path, "small.bin"))
+            self.assertLess(time.perf_counter() - started, 0.5)
+
+    def test_small_put_over_latency(self):
+        # a few round trips, not a fixed sleep on top of them
+        with LoopbackFTPServer(latency=0.02) as server:
+            client = self.connect(server)
+            path = self.local_file("small.bin", 1024)
+            started = time.perf_counter()
+            self.assertTrue(client.put(path, "small.bin"))
+            self.assertLess(time.perf_counter() - started, 0.5)
+            self.assertEqual(len(server.read_file("/small.bin")), 1024)
+
+
+if __name__ == "__main__":
+    unittest.main()